@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
+from datetime import datetime, timezone
 import logging
 
 from app.dependencies import *
@@ -11,6 +12,9 @@ from app.database import (
     refresh_token as token_db,
     profile as profile_db,
 )
+from app.database.unit_of_work import unit_of_work
+from app.service.availability import availability
+from app.errors import UniqueViolationError
 from .models import *
 
 router = APIRouter(tags=["auth"], prefix="/auth")
@@ -19,23 +23,25 @@ router = APIRouter(tags=["auth"], prefix="/auth")
 @router.post("/signup", response_model=SignupResponse)
 def signup(data: SignupRequest, db: Session = Depends(get_db)) -> SignupResponse:
     try:
-        existing_username_user: User | None = user_db.get_user_by_username(
+        if availability.is_username_taken(
             db, data.username
-        )
-        existing_email_user: User | None = user_db.get_user_by_email(db, data.email)
-        if existing_username_user or existing_email_user:
+        ) or availability.is_email_taken(db, data.email):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Username or email already exists",
             )
 
         password_hash: str = hash_password(data.password)
-        user: User = user_db.create_user(
-            db, data.username, data.full_name, data.email, password_hash, False
-        )
-        profile: Profile = profile_db.create_profile(
-            db, user.id, bio="", avatar_url=None, pinned_stance_id=None
-        )
+
+        # create the user and their profile in one transaction
+        with unit_of_work(db):
+            user: User = user_db.create_user(
+                db, data.username, data.full_name, data.email, password_hash, False
+            )
+            profile: Profile = profile_db.create_profile(
+                db, user.id, bio="", avatar_url=None, pinned_stance_id=None
+            )
+        availability.add(username=user.username, email=user.email)
 
         return SignupResponse(
             id=user.id,
@@ -45,6 +51,12 @@ def signup(data: SignupRequest, db: Session = Depends(get_db)) -> SignupResponse
         )
     except HTTPException:
         raise
+    except UniqueViolationError:
+        # lost a race with a concurrent signup for the same name
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Username or email already exists",
+        )
     except Exception as e:
         logging.error(e)
         raise HTTPException(
@@ -58,13 +70,10 @@ def token(
     form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)
 ) -> Token:
     try:
-        logging.info(
-            f"Attempting to authenticate user: {form_data.username} with password {form_data.password}"
-        )
+        logging.info("Attempting to authenticate user %s", form_data.username)
 
         # get the user and verify the password
         user: User | None = user_db.get_user_by_username(db, form_data.username)
-        logging.info(f"Retrieved user: {user}")
         if not user or not verify_password(form_data.password, user.password_hash):
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -130,6 +139,11 @@ def refresh_token(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid or revoked refresh token",
             )
+        if db_token.expires_at <= datetime.now(timezone.utc):
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Refresh token expired",
+            )
 
         # check whether user is admin
         is_admin: bool = user_db.is_user_admin(db, db_token.user_id)
@@ -84,13 +84,14 @@ class EntityFeedTag(BaseModel):
     tag_type: int
 
 
+# list items may leave out any field but id when fields= is given
 class EntityFeedEntity(BaseModel):
     id: int
-    type: int
-    title: str
-    images_json: str
-    tags: list[EntityFeedTag]
-    stances: list[EntityFeedStance]
+    type: int | None = None
+    title: str | None = None
+    images_json: str | None = None
+    tags: list[EntityFeedTag] | None = None
+    stances: list[EntityFeedStance] | None = None
     description: str | None = None
     location: str | None = None
     start_time: str | None = None
@@ -102,3 +103,31 @@ class EntityFeedEntity(BaseModel):
 class EntityListResponse(BaseModel):
     entities: list[EntityFeedEntity]
     next_cursor: str | None
+
+
+class DemographicBreakdownBucket(BaseModel):
+    num_ratings: int
+    average_rating: float
+    # only the dimensions that were broken down by are set
+    age_band: str | None = None
+    gender: str | None = None
+    region: str | None = None
+
+
+class DemographicBreakdownResponse(BaseModel):
+    dimensions: list[str]
+    buckets: list[DemographicBreakdownBucket]
+    suppressed_ratings: int
+
+
+class RelatedEntity(BaseModel):
+    id: int
+    type: int
+    title: str
+    images_json: str
+    tags: list[EntityFeedTag]
+    score: float
+
+
+class RelatedEntitiesResponse(BaseModel):
+    entities: list[RelatedEntity]
@@ -1,6 +1,8 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 import logging
+from typing import Literal
 from datetime import datetime
 import json
 import base64
@@ -14,7 +16,22 @@ from app.database import (
     tag as tag_db,
     entity_tag as entity_tag_db,
 )
+from app.database.unit_of_work import unit_of_work
+from app.database import demographic_stats as demographic_stats_db
+from app.service.demographics import suppress_small_buckets
 from app.service.storage import *
+from app.service.http_cache import check_not_modified
+from app.service.related import ENTITIES, RELATED_NEIGHBOURS, get_related_index
+from app.service.fieldsets import column_fields, columns_for, pick, wants
+from app.service.rating_events import (
+    entity_channel,
+    rating_broker,
+    stream_rating_events,
+)
+from app.service.response_cache import (
+    invalidate_entity_responses,
+    invalidate_home_feed,
+)
 from .models import *
 from .dependencies import *
 
@@ -43,50 +60,57 @@ def create_entity_endpoint(
                 image_urls.append(url)
         images_json: str = json.dumps(image_urls)
 
-        # create the entity
-        entity: Entity = entity_db.create_entity(
-            db,
-            unique_id=request.unique_id,
-            type=request.type,
-            title=request.title,
-            description=request.description,
-            location=request.location,
-            start_time=(
-                datetime.fromisoformat(request.start_time)
-                if request.start_time
-                else None
-            ),
-            end_time=(
-                datetime.fromisoformat(request.end_time) if request.end_time else None
-            ),
-            images_json=images_json,
-            latest_action_date=(
-                datetime.fromisoformat(request.latest_action_date)
-                if request.latest_action_date
-                else None
-            ),
-            latest_action_text=request.latest_action_text,
-        )
+        # create the entity and its tags in one transaction
+        with unit_of_work(db):
+            entity: Entity = entity_db.create_entity(
+                db,
+                unique_id=request.unique_id,
+                type=request.type,
+                title=request.title,
+                description=request.description,
+                location=request.location,
+                start_time=(
+                    datetime.fromisoformat(request.start_time)
+                    if request.start_time
+                    else None
+                ),
+                end_time=(
+                    datetime.fromisoformat(request.end_time)
+                    if request.end_time
+                    else None
+                ),
+                images_json=images_json,
+                latest_action_date=(
+                    datetime.fromisoformat(request.latest_action_date)
+                    if request.latest_action_date
+                    else None
+                ),
+                latest_action_text=request.latest_action_text,
+            )
 
-        # handle tags
-        tags_response: list[TagResponse] = []
-        for tag_req in request.tags:
-            tag: Tag = tag_db.find_tag(db, name=tag_req.name, tag_type=tag_req.tag_type)
-            if not tag:
-                tag = tag_db.create_tag(
+            # handle tags
+            tags_response: list[TagResponse] = []
+            for tag_req in request.tags:
+                tag: Tag = tag_db.find_tag(
                     db, name=tag_req.name, tag_type=tag_req.tag_type
                 )
-            # Check if the entity_tag already exists to avoid duplicates
-            entity_tag: EntityTag = entity_tag_db.find_entity_tag(
-                db, entity_id=entity.id, tag_id=tag.id
-            )
-            if not entity_tag:
-                entity_tag = entity_tag_db.create_entity_tag(
+                if not tag:
+                    tag = tag_db.create_tag(
+                        db, name=tag_req.name, tag_type=tag_req.tag_type
+                    )
+                # Check if the entity_tag already exists to avoid duplicates
+                entity_tag: EntityTag = entity_tag_db.find_entity_tag(
                     db, entity_id=entity.id, tag_id=tag.id
                 )
-            tags_response.append(
-                TagResponse(id=tag.id, name=tag.name, tag_type=tag.tag_type)
-            )
+                if not entity_tag:
+                    entity_tag = entity_tag_db.create_entity_tag(
+                        db, entity_id=entity.id, tag_id=tag.id
+                    )
+                tags_response.append(
+                    TagResponse(id=tag.id, name=tag.name, tag_type=tag.tag_type)
+                )
+
+        invalidate_home_feed()
 
         return EntityReadResponse(
             id=entity.id,
@@ -116,11 +140,12 @@ def create_entity_endpoint(
         )
 
 
-@router.get("/", response_model=EntityListResponse)
+@router.get("/", response_model=EntityListResponse, response_model_exclude_unset=True)
 def get_entities_endpoint(
     num_stances_per_entity: int = 15,
     cursor: str | None = None,
     limit: int = Query(10, le=100),
+    fields: set[str] | None = Depends(get_fields(EntityFeedEntity)),
     db: Session = Depends(get_db),
 ) -> EntityListResponse:
     try:
@@ -136,7 +161,10 @@ def get_entities_endpoint(
                 )
 
         entities: list[Entity] = entity_db.get_entities(
-            db, limit=limit, cursor=cursor_datetime
+            db,
+            limit=limit,
+            cursor=cursor_datetime,
+            columns=columns_for(fields, entity_db.ENTITY_FIELD_COLUMNS),
         )
 
         next_cursor: str | None = None
@@ -144,48 +172,46 @@ def get_entities_endpoint(
             entities = entities[:-1]
             next_cursor = entities[-1].updated_at.isoformat()
 
+        # load the tags, stances and ratings of the whole page at once,
+        # skipping whatever fields= left out
+        entity_ids: list[int] = [entity.id for entity in entities]
+        tags: dict[int, list[Tag]] = {}
+        if wants(fields, "tags"):
+            tags = entity_tag_db.get_tags_for_entities(db, entity_ids)
+        stances: dict[int, list[Stance]] = {}
+        histograms: dict[int, list[int]] = {}
+        if wants(fields, "stances"):
+            stances = stance_db.get_n_stances_by_entities(
+                db, entity_ids, num_stances_per_entity
+            )
+            histograms = rating_db.get_rating_histograms(
+                db,
+                [s.id for entity_stances in stances.values() for s in entity_stances],
+            )
+
         feed_entities: list[EntityFeedEntity] = []
         for entity in entities:
-            # fetch tags
-            tags: list[Tag] = entity_tag_db.get_tags_for_entity(db, entity.id)
             feed_tags: list[EntityFeedTag] = [
-                EntityFeedTag(id=t.id, name=t.name, tag_type=t.tag_type) for t in tags
+                EntityFeedTag(id=t.id, name=t.name, tag_type=t.tag_type)
+                for t in tags.get(entity.id, [])
             ]
 
-            # stances
-            stances: list[Stance] = stance_db.get_n_stances_by_entity(
-                db, entity.id, num_stances_per_entity
-            )
             feed_stances: list[EntityFeedStance] = []
-            for s in stances:
-                avg_rating: float | None = rating_db.get_average_rating_for_stance(
-                    db, s.id
-                )
+            for s in stances.get(entity.id, []):
+                _, avg_rating = rating_db.summarize_histogram(histograms[s.id])
                 feed_stances.append(
                     EntityFeedStance(
                         id=s.id, headline=s.headline, average_rating=avg_rating
                     )
                 )
 
-            feed_entity = EntityFeedEntity(
-                id=entity.id,
-                type=entity.type,
-                title=entity.title,
-                images_json=entity.images_json,
-                tags=feed_tags,
-                stances=feed_stances,
-                description=entity.description,
-                location=entity.location,
-                start_time=entity.start_time.isoformat() if entity.start_time else None,
-                end_time=entity.end_time.isoformat() if entity.end_time else None,
-                latest_action_date=(
-                    entity.latest_action_date.isoformat()
-                    if entity.latest_action_date
-                    else None
-                ),
-                latest_action_text=entity.latest_action_text,
-            )
-            feed_entities.append(feed_entity)
+            item: dict = {
+                "id": entity.id,
+                **column_fields(entity, fields, entity_db.ENTITY_FIELD_COLUMNS),
+                "tags": feed_tags,
+                "stances": feed_stances,
+            }
+            feed_entities.append(EntityFeedEntity(**pick(fields, item)))
 
         return EntityListResponse(entities=feed_entities, next_cursor=next_cursor)
     except HTTPException:
@@ -200,9 +226,20 @@ def get_entities_endpoint(
 
 @router.get("/{entity_id}", response_model=EntityReadResponse)
 def get_entity_endpoint(
-    db: Session = Depends(get_db), entity: Entity = Depends(validate_entity)
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_db),
+    entity: Entity = Depends(validate_entity),
 ) -> EntityReadResponse:
     try:
+        # updated_at is bumped on every entity and tag change
+        check_not_modified(
+            request,
+            response,
+            version=(entity.id, entity.updated_at),
+            last_modified=entity.updated_at,
+        )
+
         # get tags
         tags: list[Tag] = entity_tag_db.get_tags_for_entity(db, entity.id)
 
@@ -257,49 +294,56 @@ def update_entity_endpoint(
                 image_urls.append(url)
         images_json: str = json.dumps(image_urls)
 
-        # new tags
-        entity_tag_db.delete_entity_tags_for_entity(db, entity.id)
-        tags_response: list[TagResponse] = []
-        for tag_req in request.tags:
-            tag: Tag = tag_db.find_tag(db, name=tag_req.name, tag_type=tag_req.tag_type)
-            if not tag:
-                tag = tag_db.create_tag(
+        # replace the tags and update the entity in one transaction
+        with unit_of_work(db):
+            entity_tag_db.delete_entity_tags_for_entity(db, entity.id)
+            tags_response: list[TagResponse] = []
+            for tag_req in request.tags:
+                tag: Tag = tag_db.find_tag(
                     db, name=tag_req.name, tag_type=tag_req.tag_type
                 )
-            entity_tag: EntityTag = entity_tag_db.find_entity_tag(
-                db, entity_id=entity.id, tag_id=tag.id
-            )
-            if not entity_tag:
-                entity_tag = entity_tag_db.create_entity_tag(
+                if not tag:
+                    tag = tag_db.create_tag(
+                        db, name=tag_req.name, tag_type=tag_req.tag_type
+                    )
+                entity_tag: EntityTag = entity_tag_db.find_entity_tag(
                     db, entity_id=entity.id, tag_id=tag.id
                 )
-            tags_response.append(
-                TagResponse(id=tag.id, name=tag.name, tag_type=tag.tag_type)
+                if not entity_tag:
+                    entity_tag = entity_tag_db.create_entity_tag(
+                        db, entity_id=entity.id, tag_id=tag.id
+                    )
+                tags_response.append(
+                    TagResponse(id=tag.id, name=tag.name, tag_type=tag.tag_type)
+                )
+
+            entity: Entity = entity_db.update_entity(
+                db,
+                entity_id=entity.id,
+                unique_id=request.unique_id,
+                images_json=images_json,
+                description=request.description,
+                location=request.location,
+                start_time=(
+                    datetime.fromisoformat(request.start_time)
+                    if request.start_time
+                    else None
+                ),
+                end_time=(
+                    datetime.fromisoformat(request.end_time)
+                    if request.end_time
+                    else None
+                ),
+                title=request.title,
+                latest_action_date=(
+                    datetime.fromisoformat(request.latest_action_date)
+                    if request.latest_action_date
+                    else None
+                ),
+                latest_action_text=request.latest_action_text,
             )
 
-        entity: Entity = entity_db.update_entity(
-            db,
-            entity_id=entity.id,
-            unique_id=request.unique_id,
-            images_json=images_json,
-            description=request.description,
-            location=request.location,
-            start_time=(
-                datetime.fromisoformat(request.start_time)
-                if request.start_time
-                else None
-            ),
-            end_time=(
-                datetime.fromisoformat(request.end_time) if request.end_time else None
-            ),
-            title=request.title,
-            latest_action_date=(
-                datetime.fromisoformat(request.latest_action_date)
-                if request.latest_action_date
-                else None
-            ),
-            latest_action_text=request.latest_action_text,
-        )
+        invalidate_entity_responses(entity.id)
 
         return EntityUpdateResponse(
             id=entity.id,
@@ -347,6 +391,7 @@ def delete_entity_endpoint(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Failed to delete entity",
             )
+        invalidate_entity_responses(entity.id)
         return EntityDeleteResponse(success=True)
     except HTTPException:
         raise
@@ -356,3 +401,111 @@ def delete_entity_endpoint(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Internal server error",
         )
+
+
+@router.get("/{entity_id}/demographics", response_model=DemographicBreakdownResponse)
+def get_entity_demographics_endpoint(
+    by: list[Literal["age_band", "gender", "region"]] = Query(["age_band"]),
+    db: Session = Depends(get_db),
+    entity: Entity = Depends(validate_entity),
+) -> DemographicBreakdownResponse:
+    try:
+        dimensions: list[str] = list(dict.fromkeys(by))
+
+        rows: list[tuple] = demographic_stats_db.get_breakdown(
+            db, dimensions, entity_id=entity.id
+        )
+        rows, suppressed = suppress_small_buckets(rows)
+        return DemographicBreakdownResponse(
+            dimensions=dimensions,
+            buckets=[
+                DemographicBreakdownBucket(
+                    **dict(zip(dimensions, bucket)),
+                    num_ratings=num_ratings,
+                    average_rating=rating_sum / num_ratings,
+                )
+                for *bucket, num_ratings, rating_sum in rows
+            ],
+            suppressed_ratings=suppressed,
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error getting demographics for entity {entity.id}: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Internal server error",
+        )
+
+
+# answered from the index built by app.scripts.build_related_index; empty
+# until it has been built, and without entities created since the last build
+@router.get("/{entity_id}/related", response_model=RelatedEntitiesResponse)
+def get_related_entities_endpoint(
+    limit: int = Query(10, ge=1, le=RELATED_NEIGHBOURS),
+    db: Session = Depends(get_db),
+    entity: Entity = Depends(validate_entity),
+) -> RelatedEntitiesResponse:
+    try:
+        index = get_related_index(ENTITIES)
+        neighbours: list[tuple[int, float]] = (
+            index.lookup(entity.id, limit) if index is not None else []
+        )
+        related_ids: list[int] = [related_id for related_id, _ in neighbours]
+
+        entities: dict[int, Entity] = entity_db.read_entities(db, related_ids)
+        tags: dict[int, list[Tag]] = entity_tag_db.get_tags_for_entities(
+            db, related_ids
+        )
+        # entities deleted since the build are left out
+        return RelatedEntitiesResponse(
+            entities=[
+                RelatedEntity(
+                    id=related_id,
+                    type=entities[related_id].type,
+                    title=entities[related_id].title,
+                    images_json=entities[related_id].images_json,
+                    tags=[
+                        EntityFeedTag(id=t.id, name=t.name, tag_type=t.tag_type)
+                        for t in tags[related_id]
+                    ],
+                    score=score,
+                )
+                for related_id, score in neighbours
+                if related_id in entities
+            ]
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error getting entities related to entity {entity.id}: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Internal server error",
+        )
+
+
+# server-sent rating events of every stance on the entity
+@router.get("/{entity_id}/ratings/stream", response_class=StreamingResponse)
+def stream_entity_ratings_endpoint(
+    db: Session = Depends(get_db),
+    entity: Entity = Depends(validate_entity),
+) -> StreamingResponse:
+    try:
+        channel: str = entity_channel(entity.id)
+        # the stream outlives the request; hand the session's connection back
+        # to the pool now rather than when the client disconnects
+        db.close()
+        return StreamingResponse(
+            stream_rating_events(channel, rating_broker.subscribe(channel)),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error streaming ratings of entity {entity.id}: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Internal server error",
+        )
@@ -0,0 +1,40 @@
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import PlainTextResponse
+import logging
+import secrets
+
+from app.service import metrics
+from app.service.metrics import render_metrics
+
+router = APIRouter(tags=["metrics"])
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def verify_metrics_token(request: Request) -> None:
+    """Let through only scrapers that send METRICS_TOKEN as a bearer token."""
+    if not metrics.METRICS_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    auth_header: str = request.headers.get("Authorization", "")
+    if not secrets.compare_digest(
+        auth_header.encode(), f"Bearer {metrics.METRICS_TOKEN}".encode()
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid metrics token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+
+@router.get(
+    "/metrics", include_in_schema=False, dependencies=[Depends(verify_metrics_token)]
+)
+def get_metrics_endpoint() -> PlainTextResponse:
+    try:
+        return PlainTextResponse(render_metrics(), media_type=PROMETHEUS_CONTENT_TYPE)
+    except Exception as e:
+        logging.error(f"Error rendering metrics: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Internal server error",
+        )
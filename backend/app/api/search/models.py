@@ -0,0 +1,54 @@
+from pydantic import BaseModel
+
+
+class SearchCursor(BaseModel):
+    rank: float
+    id: int
+
+
+class SearchTag(BaseModel):
+    id: int
+    name: str
+    tag_type: int
+
+
+class SearchEntity(BaseModel):
+    id: int
+    type: int
+    title: str
+    images_json: str
+    tags: list[SearchTag]
+    rank: float
+    description: str | None = None
+    start_time: str | None = None
+    end_time: str | None = None
+
+
+class SearchEntitiesResponse(BaseModel):
+    entities: list[SearchEntity]
+    next_cursor: SearchCursor | None = None
+    # only the newest matches were ranked; a narrower query finds older ones
+    truncated: bool = False
+
+
+class SearchStanceEntity(BaseModel):
+    id: int
+    type: int
+    title: str
+
+
+class SearchStance(BaseModel):
+    id: int
+    user_id: int
+    entity: SearchStanceEntity
+    headline: str
+    snippet: str
+    rank: float
+    created_at: str
+
+
+class SearchStancesResponse(BaseModel):
+    stances: list[SearchStance]
+    next_cursor: SearchCursor | None = None
+    # only the newest matches were ranked; a narrower query finds older ones
+    truncated: bool = False
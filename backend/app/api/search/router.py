@@ -0,0 +1,143 @@
+from fastapi import APIRouter, Depends, HTTPException, status, Query
+from sqlalchemy.orm import Session
+import logging
+
+from app.database.models import *
+from app.dependencies import *
+from app.database import search as search_db, entity_tag as entity_tag_db
+from .models import *
+
+router = APIRouter(tags=["search"], prefix="/search")
+
+CANDIDATES_NOTE = (
+    f"Only the newest {search_db.SEARCH_MAX_CANDIDATES} matches are ranked; "
+    "when a query matches more, older matches are left out of every page "
+    "and the response has truncated set. Narrow the query, or filter by "
+    "entity_type or tag_id, to reach them."
+)
+
+
+@router.get(
+    "/entities",
+    response_model=SearchEntitiesResponse,
+    description="Entities matching q, best match first. " + CANDIDATES_NOTE,
+)
+def search_entities_endpoint(
+    q: str = Query(..., min_length=1, max_length=200),
+    entity_type: int | None = None,
+    tag_id: int | None = None,
+    cursor_rank: float | None = None,
+    cursor_id: int | None = None,
+    limit: int = Query(20, le=100),
+    db: Session = Depends(get_db),
+) -> SearchEntitiesResponse:
+    try:
+        results: list[tuple[Entity, float]]
+        results, truncated = search_db.search_entities(
+            db,
+            query=q,
+            entity_type=entity_type,
+            tag_id=tag_id,
+            cursor_rank=cursor_rank,
+            cursor_id=cursor_id,
+            limit=limit,
+        )
+
+        next_cursor: SearchCursor | None = None
+        if len(results) > limit:
+            results = results[:limit]  # remove the extra result
+            last_entity, last_rank = results[-1]
+            next_cursor = SearchCursor(rank=last_rank, id=last_entity.id)
+
+        # load the tags of the whole page at once
+        tags: dict[int, list[Tag]] = entity_tag_db.get_tags_for_entities(
+            db, [entity.id for entity, _ in results]
+        )
+
+        search_entities: list[SearchEntity] = [
+            SearchEntity(
+                id=entity.id,
+                type=entity.type,
+                title=entity.title,
+                images_json=entity.images_json,
+                tags=[
+                    SearchTag(id=t.id, name=t.name, tag_type=t.tag_type)
+                    for t in tags[entity.id]
+                ],
+                rank=rank,
+                description=entity.description,
+                start_time=entity.start_time.isoformat() if entity.start_time else None,
+                end_time=entity.end_time.isoformat() if entity.end_time else None,
+            )
+            for entity, rank in results
+        ]
+        return SearchEntitiesResponse(
+            entities=search_entities, next_cursor=next_cursor, truncated=truncated
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error searching entities for {q!r}: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Internal server error",
+        )
+
+
+@router.get(
+    "/stances",
+    response_model=SearchStancesResponse,
+    description="Stances matching q, best match first. " + CANDIDATES_NOTE,
+)
+def search_stances_endpoint(
+    q: str = Query(..., min_length=1, max_length=200),
+    entity_type: int | None = None,
+    tag_id: int | None = None,
+    cursor_rank: float | None = None,
+    cursor_id: int | None = None,
+    limit: int = Query(20, le=100),
+    db: Session = Depends(get_db),
+) -> SearchStancesResponse:
+    try:
+        results: list[tuple[Stance, Entity, float, str]]
+        results, truncated = search_db.search_stances(
+            db,
+            query=q,
+            entity_type=entity_type,
+            tag_id=tag_id,
+            cursor_rank=cursor_rank,
+            cursor_id=cursor_id,
+            limit=limit,
+        )
+
+        next_cursor: SearchCursor | None = None
+        if len(results) > limit:
+            results = results[:limit]  # remove the extra result
+            last_stance, _, last_rank, _ = results[-1]
+            next_cursor = SearchCursor(rank=last_rank, id=last_stance.id)
+
+        search_stances: list[SearchStance] = [
+            SearchStance(
+                id=stance.id,
+                user_id=stance.user_id,
+                entity=SearchStanceEntity(
+                    id=entity.id, type=entity.type, title=entity.title
+                ),
+                headline=stance.headline,
+                snippet=snippet,
+                rank=rank,
+                created_at=str(stance.created_at),
+            )
+            for stance, entity, rank, snippet in results
+        ]
+        return SearchStancesResponse(
+            stances=search_stances, next_cursor=next_cursor, truncated=truncated
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error searching stances for {q!r}: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Internal server error",
+        )
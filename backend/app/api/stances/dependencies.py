@@ -4,6 +4,7 @@ from app.dependencies import get_db
 from app.database import entity as entity_db
 from app.database import stance as stance_db
 from app.database.models import Entity, Stance
+from app.service.fieldsets import column_fields, wants
 
 
 # validate entity existence
@@ -36,3 +37,17 @@ def validate_entity_stance(
             detail="Stance does not belong to the specified entity",
         )
     return entity, stance
+
+
+def stance_column_fields(
+    stance: Stance, fields: set[str] | None, preview: bool = False
+) -> dict:
+    """The requested fields of a stance list item read straight from its row."""
+    columns: dict[str, tuple] = dict(stance_db.STANCE_FIELD_COLUMNS)
+    if preview:
+        # preview mode never loads the document
+        del columns["content_json"]
+    values: dict = column_fields(stance, fields, columns)
+    if preview and wants(fields, "content_json"):
+        values["content_json"] = None
+    return values
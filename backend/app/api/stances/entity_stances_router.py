@@ -1,9 +1,24 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 import logging
+from typing import Literal
 
 from app.dependencies import *
 from app.service.stance import *
+from app.service.http_cache import check_not_modified
+from app.service.fieldsets import columns_for, pick, wants
+from app.service.rating_events import (
+    RatingUpdate,
+    publish_rating_update,
+    rating_broker,
+    stance_channel,
+    stream_rating_events,
+)
+from app.service.response_cache import (
+    invalidate_entity_responses,
+    invalidate_stance_responses,
+)
 from app.database.models import *
 from app.database import (
     image as image_db,
@@ -14,6 +29,10 @@ from app.database import (
     profile as profile_db,
     user as user_db,
 )
+from app.database.unit_of_work import unit_of_work
+from app.database import demographic_stats as demographic_stats_db
+from app.service.demographics import suppress_small_buckets
+from app.service.related import RELATED_NEIGHBOURS, STANCES, get_related_index
 from .models import *
 from .dependencies import *
 
@@ -52,7 +71,9 @@ def create_stance_endpoint(
     entity: Entity = Depends(validate_entity),
 ) -> StanceCreateResponse:
     try:
-        logging.info(f"Creating stance for user {user_id} with entity_id {entity.id}")
+        logging.info(
+            "Creating stance for user %d with entity_id %d", user_id, entity.id
+        )
 
         # check if the user already has a stance for this entity
         existing_stances: list[Stance] = stance_db.get_stances_by_user(db, user_id)
@@ -66,26 +87,36 @@ def create_stance_endpoint(
         processed_content, image_urls = process_stance_content_json(
             request.content_json
         )
+        content_text: str = extract_stance_text(processed_content)
+        excerpt: StanceExcerpt = build_stance_excerpt(processed_content, content_text)
 
-        # create the stance
-        stance_obj: Stance = stance_db.create_stance(
-            db,
-            user_id=user_id,
-            entity_id=entity.id,
-            headline=request.headline,
-            content_json=processed_content,
-        )
-
-        for url in image_urls:
-            image_db.create_image(
+        # create the stance and its images in one transaction
+        with unit_of_work(db):
+            stance_obj: Stance = stance_db.create_stance(
                 db,
-                stance_id=stance_obj.id,
-                entity_id=None,
-                public_url=url,
-                file_size=0,
-                file_type="image/png",
+                user_id=user_id,
+                entity_id=entity.id,
+                headline=request.headline,
+                content_json=processed_content,
+                content_text=content_text,
+                excerpt=excerpt.excerpt,
+                word_count=excerpt.word_count,
+                preview_image_url=excerpt.preview_image_url,
             )
 
+            for url in image_urls:
+                image_db.create_image(
+                    db,
+                    stance_id=stance_obj.id,
+                    entity_id=None,
+                    profile_id=None,
+                    public_url=url,
+                    file_size=0,
+                    file_type="image/png",
+                )
+
+        invalidate_entity_responses(entity.id)
+
         return StanceCreateResponse(
             id=stance_obj.id,
             user_id=stance_obj.user_id,
@@ -138,10 +169,8 @@ def get_my_stance_for_entity(
         if not entity:
             return None
 
-        average_rating: float | None = rating_db.get_average_rating_for_stance(
-            db, stance.id
-        )
-        num_ratings: int = rating_db.get_num_ratings_for_stance(db, stance.id)
+        histogram: list[int] = rating_db.get_rating_histogram(db, stance.id)
+        num_ratings, average_rating = rating_db.summarize_histogram(histogram)
         my_rating: int | None = None
         rating: Rating | None = rating_db.read_rating_by_user_and_stance(
             db, stance.id, user_id
@@ -153,8 +182,12 @@ def get_my_stance_for_entity(
             user=stance_user,
             headline=stance.headline,
             content_json=stance.content_json,
+            excerpt=stance.excerpt,
+            word_count=stance.word_count,
+            preview_image_url=stance.preview_image_url,
             average_rating=average_rating,
             num_ratings=num_ratings,
+            rating_histogram=histogram,
             my_rating=my_rating,
             tags=stance_tags,
             created_at=str(stance.created_at) if stance.created_at else None,
@@ -173,15 +206,22 @@ def get_my_stance_for_entity(
 
 @router.get("/{stance_id}", response_model=StanceReadResponse)
 def get_stance_basic_endpoint(
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
     entity_stance: tuple[Entity, Stance] = Depends(validate_entity_stance),
 ) -> StanceReadResponse:
     try:
         entity, stance = entity_stance
 
-        avg_rating: float | None = rating_db.get_average_rating_for_stance(
-            db, stance.id
+        histogram: list[int] = rating_db.get_rating_histogram(db, stance.id)
+        check_not_modified(
+            request,
+            response,
+            version=(stance.id, stance.updated_at, *histogram),
         )
+
+        _, avg_rating = rating_db.summarize_histogram(histogram)
         return StanceReadResponse(
             id=stance.id,
             user_id=stance.user_id,
@@ -202,6 +242,8 @@ def get_stance_basic_endpoint(
 
 @router.get("/{stance_id}/page", response_model=StanceFeedStanceResponse)
 def get_stance_endpoint(
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
     current_user_id: int | None = Depends(get_current_user_optional),
     entity_stance: tuple[Entity, Stance] = Depends(validate_entity_stance),
@@ -209,6 +251,18 @@ def get_stance_endpoint(
     try:
         entity, stance = entity_stance
 
+        # answer revalidation requests before hydrating the page
+        version: tuple = stance_db.get_stance_page_version(
+            db, stance.id, current_user_id
+        )
+        *_, my_rating = version
+        check_not_modified(
+            request,
+            response,
+            version=(stance.id, current_user_id, *version),
+            public=current_user_id is None,
+        )
+
         # read user information
         user: User | None = user_db.read_user(db, stance.user_id)
         if not user:
@@ -245,16 +299,8 @@ def get_stance_endpoint(
             end_time=str(entity.end_time) if entity.end_time else None,
         )
 
-        average_rating: float | None = rating_db.get_average_rating_for_stance(
-            db, stance.id
-        )
-        num_ratings: int = rating_db.get_num_ratings_for_stance(db, stance.id)
-        my_rating: int | None = None
-        if current_user_id:
-            rating: Rating | None = rating_db.read_rating_by_user_and_stance(
-                db, stance.id, current_user_id
-            )
-            my_rating = rating.rating if rating else None
+        histogram: list[int] = [count or 0 for count in version[4:-1]]
+        num_ratings, average_rating = rating_db.summarize_histogram(histogram)
 
         stance_stance: StanceFeedStance = StanceFeedStance(
             id=stance.id,
@@ -262,8 +308,12 @@ def get_stance_endpoint(
             entity=stance_entity,
             headline=stance.headline,
             content_json=stance.content_json,
+            excerpt=stance.excerpt,
+            word_count=stance.word_count,
+            preview_image_url=stance.preview_image_url,
             average_rating=average_rating,
             num_ratings=num_ratings,
+            rating_histogram=histogram,
             my_rating=my_rating,
             tags=stance_tags,
             created_at=str(stance.created_at),
@@ -288,35 +338,47 @@ def update_stance_endpoint(
 ) -> StanceUpdateResponse:
     try:
         entity, stance = entity_stance
-        logging.info(f"Updating stance {stance.id} for user {user_id}")
+        logging.info("Updating stance %d for user %d", stance.id, user_id)
 
         processed_content, image_urls = process_stance_content_json(
             request.content_json
         )
-        # update the stance
-        stance_obj: Stance = stance_db.update_stance(
-            db,
-            stance_id=stance.id,
-            headline=request.headline,
-            content_json=processed_content,
-        )
-        if not stance_obj:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Stance not found or not authorized",
-            )
-
-        for url in image_urls:
-            image_db.create_image(
+        content_text: str = extract_stance_text(processed_content)
+        excerpt: StanceExcerpt = build_stance_excerpt(processed_content, content_text)
+        # update the stance and add its new images in one transaction
+        with unit_of_work(db):
+            stance_obj: Stance = stance_db.update_stance(
                 db,
-                stance_id=stance_obj.id,
-                entity_id=None,
-                public_url=url,
-                file_size=0,
-                file_type="image/png",
+                stance_id=stance.id,
+                headline=request.headline,
+                content_json=processed_content,
+                content_text=content_text,
+                excerpt=excerpt.excerpt,
+                word_count=excerpt.word_count,
+                preview_image_url=excerpt.preview_image_url,
             )
+            if not stance_obj:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Stance not found or not authorized",
+                )
 
-        avg_rating: float = rating_db.get_average_rating_for_stance(db, stance_obj.id)
+            for url in image_urls:
+                image_db.create_image(
+                    db,
+                    stance_id=stance_obj.id,
+                    entity_id=None,
+                    profile_id=None,
+                    public_url=url,
+                    file_size=0,
+                    file_type="image/png",
+                )
+
+        invalidate_entity_responses(entity.id)
+
+        _, avg_rating = rating_db.summarize_histogram(
+            rating_db.get_rating_histogram(db, stance_obj.id)
+        )
         return StanceUpdateResponse(
             id=stance_obj.id,
             user_id=stance_obj.user_id,
@@ -343,7 +405,7 @@ def delete_stance_endpoint(
 ) -> None:
     try:
         entity, stance = entity_stance
-        logging.info(f"Deleting stance {stance.id} for user {user_id}")
+        logging.info("Deleting stance %d for user %d", stance.id, user_id)
 
         success: bool = stance_db.delete_stance(db, stance.id)
         if not success:
@@ -351,6 +413,7 @@ def delete_stance_endpoint(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Failed to delete stance",
             )
+        invalidate_entity_responses(entity.id)
 
         return
     except HTTPException:
@@ -373,10 +436,23 @@ def rate_stance_endpoint(
     try:
         entity, stance = entity_stance
         # rating can be None (to remove rating) or int
-        success: bool = rating_db.rate_stance(
+        histogram: list[int] | None = rating_db.rate_stance(
             db, user_id=user_id, stance_id=stance.id, rating=request.rating
         )
-        return StanceRateResponse(success=success)
+        if histogram is None:
+            return StanceRateResponse(success=False)
+        invalidate_stance_responses(entity.id, stance.id)
+        num_ratings, average_rating = rating_db.summarize_histogram(histogram)
+        publish_rating_update(
+            entity.id, stance.id, num_ratings, average_rating, histogram
+        )
+        return StanceRateResponse(
+            success=True,
+            average_rating=average_rating,
+            num_ratings=num_ratings,
+            rating_histogram=histogram,
+            my_rating=request.rating,
+        )
     except HTTPException:
         raise
     except Exception as e:
@@ -387,6 +463,50 @@ def rate_stance_endpoint(
         )
 
 
+# server-sent rating events, replacing polling of num-ratings and the page
+@router.get("/{stance_id}/ratings/stream", response_class=StreamingResponse)
+def stream_stance_ratings_endpoint(
+    db: Session = Depends(get_db),
+    entity_stance: tuple[Entity, Stance] = Depends(validate_entity_stance),
+) -> StreamingResponse:
+    try:
+        entity, stance = entity_stance
+        # subscribe before reading the current ratings, so no write is missed
+        channel: str = stance_channel(stance.id)
+        subscription = rating_broker.subscribe(channel)
+        histogram: list[int] = rating_db.get_rating_histograms(db, [stance.id])[
+            stance.id
+        ]
+        num_ratings, average_rating = rating_db.summarize_histogram(histogram)
+        # the first event carries the current ratings, unless a write beat it
+        subscription.offer(
+            RatingUpdate(
+                entity_id=entity.id,
+                stance_id=stance.id,
+                num_ratings=num_ratings,
+                average_rating=average_rating,
+                rating_histogram=tuple(histogram),
+            ),
+            replace=False,
+        )
+        # the stream outlives the request; hand the session's connection back
+        # to the pool now rather than when the client disconnects
+        db.close()
+        return StreamingResponse(
+            stream_rating_events(channel, subscription),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error streaming ratings of stance {stance.id}: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Internal server error",
+        )
+
+
 @router.get("/{stance_id}/num-ratings", response_model=NumRatingsResponse)
 def get_num_ratings_endpoint(
     db: Session = Depends(get_db),
@@ -406,11 +526,15 @@ def get_num_ratings_endpoint(
         )
 
 
-@router.get("/", response_model=EntityStancesResponse)
+@router.get(
+    "/", response_model=EntityStancesResponse, response_model_exclude_unset=True
+)
 def get_entity_stances_endpoint(
     cursor_score: float | None = None,
     cursor_id: int | None = None,
     limit: int = Query(20, le=100),
+    preview: bool = False,
+    fields: set[str] | None = Depends(get_fields(PaginatedStancesByEntityStance)),
     db: Session = Depends(get_db),
     current_user_id: int | None = Depends(get_current_user_optional),
     entity: Entity = Depends(validate_entity),
@@ -423,6 +547,8 @@ def get_entity_stances_endpoint(
             cursor_score=cursor_score,
             cursor_id=cursor_id,
             limit=limit,
+            preview=preview,
+            columns=columns_for(fields, stance_db.STANCE_FIELD_COLUMNS),
         )
 
         next_cursor: PaginatedStancesByEntityCursor | None = None
@@ -435,51 +561,61 @@ def get_entity_stances_endpoint(
                 score=last_stance.engagement_score, id=last_stance.id
             )
 
-        feed_stances: list[PaginatedStancesByEntityStance] = []
-        for stance in stances:
-            # read user information
-            user: User | None = user_db.read_user(db, stance.user_id)
-            if not user:
-                continue
-
-            profile: Profile | None = profile_db.get_profile_by_user_id(db, user.id)
-
-            stance_user: StanceFeedUser = StanceFeedUser(
-                id=user.id,
-                username=user.username,
-                avatar_url=profile.avatar_url if profile else None,
-            )
-
-            tags: list[Tag] = entity_tag_db.get_tags_for_entity(db, stance.entity_id)
-            stance_tags: list[StanceFeedTag] = [
+        # load everything the page shows at once rather than per stance,
+        # skipping whatever fields= left out
+        stance_ids: list[int] = [stance.id for stance in stances]
+        user_ids: list[int] = [stance.user_id for stance in stances]
+        histograms: dict[int, list[int]] = {}
+        if wants(fields, "average_rating", "num_ratings", "rating_histogram"):
+            histograms = rating_db.get_rating_histograms(db, stance_ids)
+        users: dict[int, User] = {}
+        profiles: dict[int, Profile] = {}
+        if wants(fields, "user"):
+            users = user_db.read_users(db, user_ids)
+            profiles = profile_db.get_profiles_by_user_ids(db, user_ids)
+        stance_tags: list[StanceFeedTag] = []
+        if wants(fields, "tags"):
+            tags: list[Tag] = entity_tag_db.get_tags_for_entity(db, entity.id)
+            stance_tags = [
                 StanceFeedTag(id=t.id, name=t.name, tag_type=t.tag_type) for t in tags
             ]
-
-            average_rating: float | None = rating_db.get_average_rating_for_stance(
-                db, stance.id
+        my_ratings: dict[int, int] = {}
+        if current_user_id and wants(fields, "my_rating"):
+            my_ratings = rating_db.read_ratings_by_user_for_stances(
+                db, current_user_id, stance_ids
             )
-            num_ratings: int = rating_db.get_num_ratings_for_stance(db, stance.id)
-            my_rating: int | None = None
-            if current_user_id:
-                rating: Rating | None = rating_db.read_rating_by_user_and_stance(
-                    db, stance.id, current_user_id
+
+        feed_stances: list[PaginatedStancesByEntityStance] = []
+        for stance in stances:
+            item: dict = {
+                "id": stance.id,
+                **stance_column_fields(stance, fields, preview),
+                "my_rating": my_ratings.get(stance.id),
+                "tags": stance_tags,
+                "created_at": str(stance.created_at) if stance.created_at else None,
+            }
+
+            if wants(fields, "user"):
+                user: User | None = users.get(stance.user_id)
+                if not user:
+                    continue
+                profile: Profile | None = profiles.get(user.id)
+                item["user"] = StanceFeedUser(
+                    id=user.id,
+                    username=user.username,
+                    avatar_url=profile.avatar_url if profile else None,
                 )
-                my_rating = rating.rating if rating else None
-
-            stance_stance: PaginatedStancesByEntityStance = (
-                PaginatedStancesByEntityStance(
-                    id=stance.id,
-                    user=stance_user,
-                    headline=stance.headline,
-                    content_json=stance.content_json,
+
+            if wants(fields, "average_rating", "num_ratings", "rating_histogram"):
+                histogram: list[int] = histograms[stance.id]
+                num_ratings, average_rating = rating_db.summarize_histogram(histogram)
+                item.update(
                     average_rating=average_rating,
                     num_ratings=num_ratings,
-                    my_rating=my_rating,
-                    tags=stance_tags,
-                    created_at=str(stance.created_at) if stance.created_at else None,
+                    rating_histogram=histogram,
                 )
-            )
-            feed_stances.append(stance_stance)
+
+            feed_stances.append(PaginatedStancesByEntityStance(**pick(fields, item)))
 
         return EntityStancesResponse(stances=feed_stances, next_cursor=next_cursor)
     except HTTPException:
@@ -490,3 +626,86 @@ def get_entity_stances_endpoint(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Internal server error",
         )
+
+
+@router.get("/{stance_id}/demographics", response_model=DemographicBreakdownResponse)
+def get_stance_demographics_endpoint(
+    by: list[Literal["age_band", "gender", "region"]] = Query(["age_band"]),
+    db: Session = Depends(get_db),
+    entity_stance: tuple[Entity, Stance] = Depends(validate_entity_stance),
+) -> DemographicBreakdownResponse:
+    try:
+        entity, stance = entity_stance
+        dimensions: list[str] = list(dict.fromkeys(by))
+
+        rows: list[tuple] = demographic_stats_db.get_breakdown(
+            db, dimensions, stance_id=stance.id
+        )
+        rows, suppressed = suppress_small_buckets(rows)
+        return DemographicBreakdownResponse(
+            dimensions=dimensions,
+            buckets=[
+                DemographicBreakdownBucket(
+                    **dict(zip(dimensions, bucket)),
+                    num_ratings=num_ratings,
+                    average_rating=rating_sum / num_ratings,
+                )
+                for *bucket, num_ratings, rating_sum in rows
+            ],
+            suppressed_ratings=suppressed,
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error getting demographics for stance {stance.id}: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Internal server error",
+        )
+
+
+# answered from the index built by app.scripts.build_related_index; empty
+# until it has been built, and without stances created since the last build
+@router.get("/{stance_id}/similar", response_model=SimilarStancesResponse)
+def get_similar_stances_endpoint(
+    limit: int = Query(10, ge=1, le=RELATED_NEIGHBOURS),
+    db: Session = Depends(get_db),
+    entity_stance: tuple[Entity, Stance] = Depends(validate_entity_stance),
+) -> SimilarStancesResponse:
+    try:
+        entity, stance = entity_stance
+
+        index = get_related_index(STANCES)
+        neighbours: list[tuple[int, float]] = (
+            index.lookup(stance.id, limit) if index is not None else []
+        )
+        scores: dict[int, float] = dict(neighbours)
+
+        # stances deleted since the build are left out
+        stances: list[Stance] = stance_db.read_stances(
+            db,
+            list(scores),
+            preview=True,
+            columns=[Stance.headline, Stance.excerpt],
+        )
+        return SimilarStancesResponse(
+            stances=[
+                SimilarStance(
+                    id=s.id,
+                    entity_id=s.entity_id,
+                    user_id=s.user_id,
+                    headline=s.headline,
+                    excerpt=s.excerpt,
+                    score=scores[s.id],
+                )
+                for s in stances
+            ]
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error getting stances similar to stance {stance.id}: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Internal server error",
+        )
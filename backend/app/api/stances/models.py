@@ -1,4 +1,5 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+from typing import Literal
 
 
 class StanceCreateRequest(BaseModel):
@@ -49,18 +50,61 @@ class ReadStanceRatingResponse(BaseModel):
     rating: int | None = None
 
 
+class StanceMyRating(BaseModel):
+    stance_id: int
+    rating: int | None  # None if the viewer has not rated the stance
+
+
+class StanceMyRatingsResponse(BaseModel):
+    ratings: list[StanceMyRating]
+
+
 class StanceRateRequest(BaseModel):
     rating: int | None = None
 
 
 class StanceRateResponse(BaseModel):
     success: bool
+    # the stance's ratings after this one was applied
+    average_rating: float | None = None
+    num_ratings: int | None = None
+    rating_histogram: list[int] | None = None
+    my_rating: int | None = None
 
 
 class NumRatingsResponse(BaseModel):
     num_ratings: int
 
 
+class StanceRatingHistogram(BaseModel):
+    stance_id: int
+    average_rating: float | None
+    num_ratings: int
+    rating_histogram: list[int]  # counts of 1 to 5 star ratings
+
+
+class StanceRatingHistogramsResponse(BaseModel):
+    histograms: list[StanceRatingHistogram]
+
+
+class StanceBatchRating(BaseModel):
+    stance_id: int
+    rating: int | None = Field(None, ge=1, le=5)  # None removes the rating
+
+
+class StanceBatchRateRequest(BaseModel):
+    ratings: list[StanceBatchRating] = Field(..., min_length=1, max_length=100)
+
+
+class StanceBatchRatingResult(StanceRatingHistogram):
+    my_rating: int | None
+
+
+class StanceBatchRateResponse(BaseModel):
+    ratings: list[StanceBatchRatingResult]
+    missing_stance_ids: list[int]
+
+
 class StanceFeedCursor(BaseModel):
     score: float | None
     id: int | None
@@ -89,17 +133,23 @@ class StanceFeedEntity(BaseModel):
     end_time: str | None = None
 
 
+# list items may leave out any field but id when fields= is given
 class StanceFeedStance(BaseModel):
     id: int
-    user: StanceFeedUser
-    entity: StanceFeedEntity
-    headline: str
-    content_json: str
-    average_rating: float | None
-    num_ratings: int
-    my_rating: int | None
-    tags: list[StanceFeedTag]
-    created_at: str
+    user: StanceFeedUser | None = None
+    entity: StanceFeedEntity | None = None
+    headline: str | None = None
+    # omitted in preview mode, where feeds show the excerpt instead
+    content_json: str | None = None
+    excerpt: str | None = None
+    word_count: int | None = None
+    preview_image_url: str | None = None
+    average_rating: float | None = None
+    num_ratings: int | None = None
+    rating_histogram: list[int] | None = None  # counts of 1 to 5 star ratings
+    my_rating: int | None = None
+    tags: list[StanceFeedTag] | None = None
+    created_at: str | None = None
 
 
 class StanceFeedRequest(BaseModel):
@@ -107,6 +157,11 @@ class StanceFeedRequest(BaseModel):
     initial_stance_id: int | None
     entities: list[int] | None
     cursor: StanceFeedCursor | None = None
+    preview: bool = False
+    # personalized ranks by the signed-in user's tag affinities, and needs a
+    # signed-in user; one who has rated nothing yet gets the random feed. Keep
+    # sending initial_stance_id with the cursor so it is not shown again
+    ranking: Literal["random", "personalized"] = "random"
 
 
 class StanceFeedResponse(BaseModel):
@@ -127,13 +182,18 @@ class StanceFollowingFeedResponse(BaseModel):
 # paginated stances by entity do not include entity info, and use a str for cursor
 class PaginatedStancesByEntityStance(BaseModel):
     id: int
-    user: StanceFeedUser
-    headline: str
-    content_json: str
-    average_rating: float | None
-    num_ratings: int
-    my_rating: int | None
-    tags: list[StanceFeedTag]
+    user: StanceFeedUser | None = None
+    headline: str | None = None
+    # omitted in preview mode, where feeds show the excerpt instead
+    content_json: str | None = None
+    excerpt: str | None = None
+    word_count: int | None = None
+    preview_image_url: str | None = None
+    average_rating: float | None = None
+    num_ratings: int | None = None
+    rating_histogram: list[int] | None = None  # counts of 1 to 5 star ratings
+    my_rating: int | None = None
+    tags: list[StanceFeedTag] | None = None
     created_at: str | None = None
 
 
@@ -154,16 +214,49 @@ class PaginatedStancesByEntityStanceResponse(BaseModel):
 # paginated stances by user do not include user info, and use
 class PaginatedStancesByUserStance(BaseModel):
     id: int
-    entity: StanceFeedEntity
-    headline: str
-    content_json: str
-    average_rating: float | None
-    num_ratings: int
-    my_rating: int | None
-    tags: list[StanceFeedTag]
-    created_at: str
+    entity: StanceFeedEntity | None = None
+    headline: str | None = None
+    # omitted in preview mode, where feeds show the excerpt instead
+    content_json: str | None = None
+    excerpt: str | None = None
+    word_count: int | None = None
+    preview_image_url: str | None = None
+    average_rating: float | None = None
+    num_ratings: int | None = None
+    rating_histogram: list[int] | None = None  # counts of 1 to 5 star ratings
+    my_rating: int | None = None
+    tags: list[StanceFeedTag] | None = None
+    created_at: str | None = None
 
 
 class UserStancesResponse(BaseModel):
     stances: list[PaginatedStancesByUserStance]
     next_cursor: str | None = None
+
+
+class DemographicBreakdownBucket(BaseModel):
+    num_ratings: int
+    average_rating: float
+    # only the dimensions that were broken down by are set
+    age_band: str | None = None
+    gender: str | None = None
+    region: str | None = None
+
+
+class DemographicBreakdownResponse(BaseModel):
+    dimensions: list[str]
+    buckets: list[DemographicBreakdownBucket]
+    suppressed_ratings: int
+
+
+class SimilarStance(BaseModel):
+    id: int
+    entity_id: int
+    user_id: int
+    headline: str
+    excerpt: str | None
+    score: float
+
+
+class SimilarStancesResponse(BaseModel):
+    stances: list[SimilarStance]
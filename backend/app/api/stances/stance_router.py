@@ -1,14 +1,28 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.orm import Session
+from typing import Literal
 import logging
 import datetime
+import numpy as np
 
 from app.dependencies import *
 from app.service.stance import *
+from app.service.fieldsets import columns_for, pick, wants
+from app.service.feed_ranking import (
+    FEED_CANDIDATE_TAGS,
+    FEED_MAX_CANDIDATES,
+    FeedCandidates,
+    pooled_candidates,
+    rank_candidates,
+    score_candidates,
+)
+from app.service.response_cache import invalidate_stance_responses
+from app.service.rating_events import publish_rating_update
 from app.database.models import *
 from app.database import (
     entity as entity_db,
     entity_tag as entity_tag_db,
+    feed_ranking as feed_ranking_db,
     stance as stance_db,
     rating as rating_db,
     profile as profile_db,
@@ -26,6 +40,9 @@ def get_stances_endpoint(
 ) -> StanceListResponse:
     try:
         stances: list[Stance] = stance_db.get_all_stances(db)
+        histograms: dict[int, list[int]] = rating_db.get_rating_histograms(
+            db, [stance.id for stance in stances]
+        )
         return StanceListResponse(
             stances=[
                 StanceReadResponse(
@@ -34,9 +51,9 @@ def get_stances_endpoint(
                     entity_id=stance.entity_id,
                     headline=stance.headline,
                     content_json=stance.content_json,
-                    average_rating=rating_db.get_average_rating_for_stance(
-                        db, stance.id
-                    ),
+                    average_rating=rating_db.summarize_histogram(histograms[stance.id])[
+                        1
+                    ],
                 )
                 for stance in stances
             ]
@@ -51,49 +68,68 @@ def get_stances_endpoint(
         )
 
 
-@router.post("/feed", response_model=StanceFeedResponse)
-def get_stance_feed_endpoint(
-    request: StanceFeedRequest,
-    db: Session = Depends(get_db),
-    current_user_id: int | None = Depends(get_current_user_optional),
-) -> StanceFeedResponse:
-    try:
-        # get random stances
-        stances: list[Stance] = stance_db.get_random_stances(db, request.num_stances)
-
-        # get the initial stance if provided
-        if request.initial_stance_id:
-            stances = [s for s in stances if str(s.id) != request.initial_stance_id]
-            initial_stance: Stance | None = stance_db.read_stance(
-                db, int(request.initial_stance_id)
-            )
-            if initial_stance:
-                stances.insert(0, initial_stance)
+def build_feed_stances(
+    db: Session,
+    stances: list[Stance],
+    current_user_id: int | None,
+    preview: bool = False,
+    fields: set[str] | None = None,
+) -> list[StanceFeedStance]:
+    # load everything the page shows at once rather than per stance, skipping
+    # whatever fields= left out
+    stance_ids: list[int] = [stance.id for stance in stances]
+    user_ids: list[int] = [stance.user_id for stance in stances]
+    entity_ids: list[int] = [stance.entity_id for stance in stances]
+    histograms: dict[int, list[int]] = {}
+    if wants(fields, "average_rating", "num_ratings", "rating_histogram"):
+        histograms = rating_db.get_rating_histograms(db, stance_ids)
+    users: dict[int, User] = {}
+    profiles: dict[int, Profile] = {}
+    if wants(fields, "user"):
+        users = user_db.read_users(db, user_ids)
+        profiles = profile_db.get_profiles_by_user_ids(db, user_ids)
+    entities: dict[int, Entity] = {}
+    if wants(fields, "entity"):
+        entities = entity_db.read_entities(db, entity_ids)
+    tags: dict[int, list[Tag]] = {}
+    if wants(fields, "entity", "tags"):
+        tags = entity_tag_db.get_tags_for_entities(db, entity_ids)
+    my_ratings: dict[int, int] = {}
+    if current_user_id and wants(fields, "my_rating"):
+        my_ratings = rating_db.read_ratings_by_user_for_stances(
+            db, current_user_id, stance_ids
+        )
+
+    feed_stances: list[StanceFeedStance] = []
+    for stance in stances:
+        item: dict = {
+            "id": stance.id,
+            **stance_column_fields(stance, fields, preview),
+            "my_rating": my_ratings.get(stance.id),
+            "created_at": str(stance.created_at),
+        }
 
-        feed_stances: list[StanceFeedStance] = []
-        for stance in stances:
-            # read user information
-            user: User | None = user_db.read_user(db, stance.user_id)
+        if wants(fields, "user"):
+            user: User | None = users.get(stance.user_id)
             if not user:
                 continue
-
-            profile: Profile | None = profile_db.get_profile_by_user_id(db, user.id)
-
-            stance_user: StanceFeedUser = StanceFeedUser(
+            profile: Profile | None = profiles.get(user.id)
+            item["user"] = StanceFeedUser(
                 id=user.id,
                 username=user.username,
                 avatar_url=profile.avatar_url if profile else None,
             )
 
-            tags: list[Tag] = entity_tag_db.get_tags_for_entity(db, stance.entity_id)
-            stance_tags: list[StanceFeedTag] = [
-                StanceFeedTag(id=t.id, name=t.name, tag_type=t.tag_type) for t in tags
-            ]
-
-            entity: Entity | None = entity_db.read_entity(db, stance.entity_id)
+        stance_tags: list[StanceFeedTag] = [
+            StanceFeedTag(id=t.id, name=t.name, tag_type=t.tag_type)
+            for t in tags.get(stance.entity_id, [])
+        ]
+        item["tags"] = stance_tags
+        if wants(fields, "entity"):
+            entity: Entity | None = entities.get(stance.entity_id)
             if not entity:
                 continue
-            stance_entity: StanceFeedEntity = StanceFeedEntity(
+            item["entity"] = StanceFeedEntity(
                 id=entity.id,
                 type=entity.type,
                 title=entity.title,
@@ -104,39 +140,239 @@ def get_stance_feed_endpoint(
                 end_time=str(entity.end_time) if entity.end_time else None,
             )
 
-            average_rating: float | None = rating_db.get_average_rating_for_stance(
-                db, stance.id
-            )
-            num_ratings: int = rating_db.get_num_ratings_for_stance(db, stance.id)
-            my_rating: int | None = None
-            if current_user_id:
-                rating: Rating = rating_db.read_rating_by_user_and_stance(
-                    db, stance.id, current_user_id
-                )
-                my_rating = rating.rating if rating else None
-
-            stance_stance: StanceFeedStance = StanceFeedStance(
-                id=stance.id,
-                user=stance_user,
-                entity=stance_entity,
-                headline=stance.headline,
-                content_json=stance.content_json,
+        if wants(fields, "average_rating", "num_ratings", "rating_histogram"):
+            histogram: list[int] = histograms[stance.id]
+            num_ratings, average_rating = rating_db.summarize_histogram(histogram)
+            item.update(
                 average_rating=average_rating,
                 num_ratings=num_ratings,
-                my_rating=my_rating,
-                tags=stance_tags,
-                created_at=str(stance.created_at),
+                rating_histogram=histogram,
             )
-            feed_stances.append(stance_stance)
 
-        next_cursor: StanceFeedCursor | None = None
-        if stances and len(stances) == request.num_stances:
-            last_stance = stances[-1]
-            next_cursor = StanceFeedCursor(
-                score=last_stance.engagement_score, id=last_stance.id
+        feed_stances.append(StanceFeedStance(**pick(fields, item)))
+    return feed_stances
+
+
+def build_random_stance_feed(
+    db: Session,
+    num_stances: int,
+    initial_stance_id: int | None,
+    current_user_id: int | None,
+    preview: bool = False,
+    fields: set[str] | None = None,
+    entity_ids: list[int] | None = None,
+) -> StanceFeedResponse:
+    # get random stances, of the given entities if any
+    stances: list[Stance] = stance_db.get_random_stances(
+        db,
+        num_stances,
+        preview,
+        columns_for(fields, stance_db.STANCE_FIELD_COLUMNS),
+        entity_ids,
+    )
+
+    # get the initial stance if provided
+    if initial_stance_id:
+        stances = [s for s in stances if s.id != initial_stance_id]
+        initial_stance: Stance | None = stance_db.read_stance(db, initial_stance_id)
+        if initial_stance:
+            stances.insert(0, initial_stance)
+
+    feed_stances: list[StanceFeedStance] = build_feed_stances(
+        db, stances, current_user_id, preview, fields
+    )
+
+    next_cursor: StanceFeedCursor | None = None
+    if stances and len(stances) == num_stances:
+        last_stance = stances[-1]
+        next_cursor = StanceFeedCursor(
+            score=last_stance.engagement_score, id=last_stance.id
+        )
+
+    return StanceFeedResponse(stances=feed_stances, next_cursor=next_cursor)
+
+
+def build_personalized_stance_feed(
+    db: Session,
+    num_stances: int,
+    initial_stance_id: int | None,
+    current_user_id: int | None,
+    cursor: StanceFeedCursor | None,
+    preview: bool = False,
+    fields: set[str] | None = None,
+    entity_ids: list[int] | None = None,
+) -> StanceFeedResponse:
+    if current_user_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Sign in for a personalized feed",
+        )
+    affinity: UserTagAffinity | None = feed_ranking_db.get_tag_affinity(
+        db, current_user_id
+    )
+    # nothing to personalize by for users without ratings
+    if affinity is None:
+        return build_random_stance_feed(
+            db,
+            num_stances,
+            initial_stance_id,
+            current_user_id,
+            preview,
+            fields,
+            entity_ids,
+        )
+
+    # candidates: the stances of the given entities, or the pools of the
+    # user's strongest liked tags
+    if entity_ids is not None:
+        rows = stance_db.get_feed_candidates_by_entities(
+            db, entity_ids, FEED_MAX_CANDIDATES
+        )
+        candidates = FeedCandidates(
+            np.array([row[0] for row in rows], dtype=np.int64),
+            np.array([row[1] for row in rows], dtype=np.int64),
+            np.array([row[2] for row in rows], dtype=np.float64),
+        )
+    else:
+        liked_tags: list[int] = [
+            tag_id
+            for tag_id, weight in zip(affinity.tag_ids, affinity.weights)
+            if weight > 0
+        ][:FEED_CANDIDATE_TAGS]
+        pools: list[TagStancePool] = feed_ranking_db.get_tag_stance_pools(
+            db, liked_tags
+        )
+        candidates = pooled_candidates(
+            [(p.stance_ids, p.entity_ids, p.engagement_scores) for p in pools]
+        )
+
+    scores: np.ndarray = score_candidates(
+        affinity.tag_ids,
+        affinity.weights,
+        candidates,
+        entity_tag_db.get_entity_tag_pairs(
+            db, np.unique(candidates.entity_ids).tolist()
+        ),
+    )
+    # the initial stance leads the first page; later pages that name it too
+    # leave it out where it ranks, so that it is not shown twice
+    ranked: np.ndarray = np.flatnonzero(candidates.stance_ids != initial_stance_id)
+    leads: bool = bool(initial_stance_id) and cursor is None
+    limit: int = num_stances - 1 if leads else num_stances
+    page: np.ndarray = ranked[
+        rank_candidates(
+            candidates.stance_ids[ranked],
+            scores[ranked],
+            limit,
+            cursor.score if cursor else None,
+            cursor.id if cursor else None,
+        )
+    ]
+    stance_ids: list[int] = candidates.stance_ids[page].tolist()
+    if leads:
+        stance_ids.insert(0, initial_stance_id)
+    stances: list[Stance] = stance_db.read_stances(
+        db, stance_ids, preview, columns_for(fields, stance_db.STANCE_FIELD_COLUMNS)
+    )
+    feed_stances: list[StanceFeedStance] = build_feed_stances(
+        db, stances, current_user_id, preview, fields
+    )
+
+    # the next page follows the last ranked stance on this one
+    next_cursor: StanceFeedCursor | None = None
+    if len(page) and len(page) == limit:
+        next_cursor = StanceFeedCursor(
+            score=float(scores[page[-1]]), id=int(candidates.stance_ids[page[-1]])
+        )
+    elif leads and not limit and len(ranked):
+        # a page of only the initial stance; start above the best candidate
+        next_cursor = StanceFeedCursor(
+            score=float(scores[ranked].max()),
+            id=int(candidates.stance_ids[ranked].max()) + 1,
+        )
+    return StanceFeedResponse(stances=feed_stances, next_cursor=next_cursor)
+
+
+@router.post(
+    "/feed", response_model=StanceFeedResponse, response_model_exclude_unset=True
+)
+def get_stance_feed_endpoint(
+    request: StanceFeedRequest,
+    fields: set[str] | None = Depends(get_fields(StanceFeedStance)),
+    db: Session = Depends(get_db),
+    current_user_id: int | None = Depends(get_current_user_optional),
+) -> StanceFeedResponse:
+    try:
+        if request.ranking == "personalized":
+            return build_personalized_stance_feed(
+                db,
+                request.num_stances,
+                request.initial_stance_id,
+                current_user_id,
+                request.cursor,
+                request.preview,
+                fields,
+                request.entities,
             )
+        return build_random_stance_feed(
+            db,
+            request.num_stances,
+            request.initial_stance_id,
+            current_user_id,
+            request.preview,
+            fields,
+            request.entities,
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error fetching stance feed: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Internal server error",
+        )
+
 
-        return StanceFeedResponse(stances=feed_stances, next_cursor=next_cursor)
+# GET variant of the feed; not cached, since every request gets a new random feed
+@router.get(
+    "/feed", response_model=StanceFeedResponse, response_model_exclude_unset=True
+)
+def get_public_stance_feed_endpoint(
+    num_stances: int = Query(20, le=100),
+    initial_stance_id: int | None = None,
+    preview: bool = False,
+    entities: list[int] | None = Query(None, max_length=100),
+    ranking: Literal["random", "personalized"] = "random",
+    cursor_score: float | None = None,
+    cursor_id: int | None = None,
+    fields: set[str] | None = Depends(get_fields(StanceFeedStance)),
+    db: Session = Depends(get_db),
+    current_user_id: int | None = Depends(get_current_user_optional),
+) -> StanceFeedResponse:
+    try:
+        if ranking == "personalized":
+            cursor: StanceFeedCursor | None = None
+            if cursor_score is not None and cursor_id is not None:
+                cursor = StanceFeedCursor(score=cursor_score, id=cursor_id)
+            return build_personalized_stance_feed(
+                db,
+                num_stances,
+                initial_stance_id,
+                current_user_id,
+                cursor,
+                preview,
+                fields,
+                entities,
+            )
+        return build_random_stance_feed(
+            db,
+            num_stances,
+            initial_stance_id,
+            current_user_id,
+            preview,
+            fields,
+            entities,
+        )
     except HTTPException:
         raise
     except Exception as e:
@@ -147,10 +383,16 @@ def get_stance_feed_endpoint(
         )
 
 
-@router.get("/following-feed", response_model=StanceFollowingFeedResponse)
+@router.get(
+    "/following-feed",
+    response_model=StanceFollowingFeedResponse,
+    response_model_exclude_unset=True,
+)
 def get_stance_feed_endpoint(
     cursor: str | None = None,
     limit: int = Query(20, le=100),
+    preview: bool = False,
+    fields: set[str] | None = Depends(get_fields(StanceFeedStance)),
     db: Session = Depends(get_db),
     current_user_id: int | None = Depends(get_current_user),
 ) -> StanceFollowingFeedResponse:
@@ -160,7 +402,12 @@ def get_stance_feed_endpoint(
             cursor_dt = datetime.datetime.fromisoformat(cursor)
 
         stances: list[Stance] = stance_db.get_stance_feed_for_user(
-            db, current_user_id, cursor_dt, limit
+            db,
+            current_user_id,
+            cursor_dt,
+            limit,
+            preview,
+            columns_for(fields, stance_db.STANCE_FIELD_COLUMNS),
         )
 
         next_cursor: str | None = None
@@ -171,72 +418,133 @@ def get_stance_feed_endpoint(
             last_stance = stances[-1]
             next_cursor = last_stance.created_at.isoformat()
 
-        feed_stances: list[StanceFeedStance] = []
-        for stance in stances:
-            # read user information
-            user: User | None = user_db.read_user(db, stance.user_id)
-            if not user:
-                continue
+        feed_stances: list[StanceFeedStance] = build_feed_stances(
+            db, stances, current_user_id, preview, fields
+        )
 
-            profile: Profile | None = profile_db.get_profile_by_user_id(db, user.id)
+        return StanceFollowingFeedResponse(
+            stances=feed_stances, next_cursor=next_cursor
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error fetching following stance feed: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Internal server error",
+        )
 
-            stance_user: StanceFeedUser = StanceFeedUser(
-                id=user.id,
-                username=user.username,
-                avatar_url=profile.avatar_url if profile else None,
+
+@router.get("/rating-histograms", response_model=StanceRatingHistogramsResponse)
+def get_rating_histograms_endpoint(
+    stance_ids: list[int] = Query(..., max_length=100),
+    db: Session = Depends(get_db),
+) -> StanceRatingHistogramsResponse:
+    try:
+        # unknown stance ids get an empty histogram
+        unique_ids: list[int] = list(dict.fromkeys(stance_ids))
+        histograms: dict[int, list[int]] = rating_db.get_rating_histograms(
+            db, unique_ids
+        )
+
+        stance_histograms: list[StanceRatingHistogram] = []
+        for stance_id in unique_ids:
+            histogram: list[int] = histograms[stance_id]
+            num_ratings, average_rating = rating_db.summarize_histogram(histogram)
+            stance_histograms.append(
+                StanceRatingHistogram(
+                    stance_id=stance_id,
+                    average_rating=average_rating,
+                    num_ratings=num_ratings,
+                    rating_histogram=histogram,
+                )
             )
+        return StanceRatingHistogramsResponse(histograms=stance_histograms)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error fetching rating histograms for {stance_ids}: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Internal server error",
+        )
 
-            tags: list[Tag] = entity_tag_db.get_tags_for_entity(db, stance.entity_id)
-            stance_tags: list[StanceFeedTag] = [
-                StanceFeedTag(id=t.id, name=t.name, tag_type=t.tag_type) for t in tags
+
+@router.get("/my-ratings", response_model=StanceMyRatingsResponse)
+def get_my_ratings_endpoint(
+    stance_ids: list[int] = Query(..., max_length=100),
+    db: Session = Depends(get_db),
+    user_id: int = Depends(get_current_user),
+) -> StanceMyRatingsResponse:
+    try:
+        # unknown stance ids are reported as unrated
+        unique_ids: list[int] = list(dict.fromkeys(stance_ids))
+        ratings: dict[int, int] = rating_db.read_ratings_by_user_for_stances(
+            db, user_id, unique_ids
+        )
+        return StanceMyRatingsResponse(
+            ratings=[
+                StanceMyRating(stance_id=stance_id, rating=ratings.get(stance_id))
+                for stance_id in unique_ids
             ]
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error fetching ratings of user {user_id} for {stance_ids}: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Internal server error",
+        )
 
-            entity: Entity | None = entity_db.read_entity(db, stance.entity_id)
-            if not entity:
-                continue
-            stance_entity: StanceFeedEntity = StanceFeedEntity(
-                id=entity.id,
-                type=entity.type,
-                title=entity.title,
-                images_json=entity.images_json,
-                tags=stance_tags,
-                description=entity.description,
-                start_time=str(entity.start_time) if entity.start_time else None,
-                end_time=str(entity.end_time) if entity.end_time else None,
-            )
 
-            average_rating: float | None = rating_db.get_average_rating_for_stance(
-                db, stance.id
+@router.post("/ratings", response_model=StanceBatchRateResponse)
+def batch_rate_stances_endpoint(
+    request: StanceBatchRateRequest,
+    db: Session = Depends(get_db),
+    user_id: int = Depends(get_current_user),
+) -> StanceBatchRateResponse:
+    try:
+        # a stance rated twice in one batch keeps its last rating
+        ratings: dict[int, int | None] = {
+            item.stance_id: item.rating for item in request.ratings
+        }
+        rated: dict[int, rating_db.RatedStance] = rating_db.rate_stances(
+            db, user_id, ratings
+        )
+
+        results: list[StanceBatchRatingResult] = []
+        for stance_id, rated_stance in rated.items():
+            invalidate_stance_responses(rated_stance.entity_id, stance_id)
+            num_ratings, average_rating = rating_db.summarize_histogram(
+                rated_stance.rating_histogram
             )
-            num_ratings: int = rating_db.get_num_ratings_for_stance(db, stance.id)
-            my_rating: int | None = None
-            if current_user_id:
-                rating: Rating | None = rating_db.read_rating_by_user_and_stance(
-                    db, stance.id, current_user_id
+            publish_rating_update(
+                rated_stance.entity_id,
+                stance_id,
+                num_ratings,
+                average_rating,
+                rated_stance.rating_histogram,
+            )
+            results.append(
+                StanceBatchRatingResult(
+                    stance_id=stance_id,
+                    average_rating=average_rating,
+                    num_ratings=num_ratings,
+                    rating_histogram=rated_stance.rating_histogram,
+                    my_rating=ratings[stance_id],
                 )
-                my_rating = rating.rating if rating else None
-
-            stance_stance: StanceFeedStance = StanceFeedStance(
-                id=stance.id,
-                user=stance_user,
-                entity=stance_entity,
-                headline=stance.headline,
-                content_json=stance.content_json,
-                average_rating=average_rating,
-                num_ratings=num_ratings,
-                my_rating=my_rating,
-                tags=stance_tags,
-                created_at=str(stance.created_at),
             )
-            feed_stances.append(stance_stance)
-
-        return StanceFollowingFeedResponse(
-            stances=feed_stances, next_cursor=next_cursor
+        return StanceBatchRateResponse(
+            ratings=results,
+            missing_stance_ids=[
+                stance_id for stance_id in ratings if stance_id not in rated
+            ],
         )
     except HTTPException:
         raise
     except Exception as e:
-        logging.error(f"Error fetching following stance feed: {e}")
+        logging.error(f"Error batch rating stances by user {user_id}: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Internal server error",
@@ -4,6 +4,7 @@ import logging
 
 from app.dependencies import *
 from app.service.stance import *
+from app.service.fieldsets import columns_for, pick, wants
 from app.database.models import *
 from app.database import (
     entity as entity_db,
@@ -18,13 +19,15 @@ from .dependencies import *
 router = APIRouter(tags=["stances"], prefix="/users/{user_id}/stances")
 
 
-@router.get("/", response_model=UserStancesResponse)
+@router.get("/", response_model=UserStancesResponse, response_model_exclude_unset=True)
 def get_user_stances_endpoint(
     user_id: int,
     db: Session = Depends(get_db),
     current_user_id: int | None = Depends(get_current_user_optional),
     cursor: str | None = None,
     limit: int = Query(20, le=100),
+    preview: bool = False,
+    fields: set[str] | None = Depends(get_fields(PaginatedStancesByUserStance)),
 ) -> UserStancesResponse:
     try:
         user: User | None = user_db.read_user(db, user_id)
@@ -34,7 +37,12 @@ def get_user_stances_endpoint(
             )
 
         stances: list[Stance] = stance_db.get_user_stances(
-            db, user_id=user_id, limit=limit, cursor=cursor
+            db,
+            user_id=user_id,
+            limit=limit,
+            cursor=cursor,
+            preview=preview,
+            columns=columns_for(fields, stance_db.STANCE_FIELD_COLUMNS),
         )
 
         next_cursor = None
@@ -44,52 +52,67 @@ def get_user_stances_endpoint(
             ]  # remove the extra stance used to check for next cursor
             next_cursor = stances[-1].created_at.isoformat()
 
+        # load everything the page shows at once rather than per stance,
+        # skipping whatever fields= left out
+        stance_ids: list[int] = [stance.id for stance in stances]
+        entity_ids: list[int] = [stance.entity_id for stance in stances]
+        histograms: dict[int, list[int]] = {}
+        if wants(fields, "average_rating", "num_ratings", "rating_histogram"):
+            histograms = rating_db.get_rating_histograms(db, stance_ids)
+        entities: dict[int, Entity] = {}
+        if wants(fields, "entity"):
+            entities = entity_db.read_entities(db, entity_ids)
+        tags: dict[int, list[Tag]] = {}
+        if wants(fields, "entity", "tags"):
+            tags = entity_tag_db.get_tags_for_entities(db, entity_ids)
+        my_ratings: dict[int, int] = {}
+        if current_user_id and wants(fields, "my_rating"):
+            my_ratings = rating_db.read_ratings_by_user_for_stances(
+                db, current_user_id, stance_ids
+            )
+
         feed_stances = []
         for stance in stances:
-            # read entity tags
-            tags: list[Tag] = entity_tag_db.get_tags_for_entity(db, stance.entity_id)
             stance_tags: list[StanceFeedTag] = [
-                StanceFeedTag(id=t.id, name=t.name, tag_type=t.tag_type) for t in tags
+                StanceFeedTag(id=t.id, name=t.name, tag_type=t.tag_type)
+                for t in tags.get(stance.entity_id, [])
             ]
+            item: dict = {
+                "id": stance.id,
+                **stance_column_fields(stance, fields, preview),
+                "my_rating": my_ratings.get(stance.id),
+                "tags": stance_tags,
+                "created_at": stance.created_at.isoformat(),
+            }
 
             # read entity information
-            entity: Entity | None = entity_db.read_entity(db, stance.entity_id)
-            if not entity:
-                continue
-            stance_entity: StanceFeedEntity = StanceFeedEntity(
-                id=entity.id,
-                type=entity.type,
-                title=entity.title,
-                images_json=entity.images_json,
-                tags=stance_tags,
-                description=entity.description,
-                start_time=entity.start_time.isoformat() if entity.start_time else None,
-                end_time=entity.end_time.isoformat() if entity.end_time else None,
-            )
+            if wants(fields, "entity"):
+                entity: Entity | None = entities.get(stance.entity_id)
+                if not entity:
+                    continue
+                item["entity"] = StanceFeedEntity(
+                    id=entity.id,
+                    type=entity.type,
+                    title=entity.title,
+                    images_json=entity.images_json,
+                    tags=stance_tags,
+                    description=entity.description,
+                    start_time=(
+                        entity.start_time.isoformat() if entity.start_time else None
+                    ),
+                    end_time=entity.end_time.isoformat() if entity.end_time else None,
+                )
 
-            average_rating: float | None = rating_db.get_average_rating_for_stance(
-                db, stance.id
-            )
-            num_ratings: int = rating_db.get_num_ratings_for_stance(db, stance.id)
-            my_rating: int | None = None
-            if current_user_id:
-                rating: Rating | None = rating_db.read_rating_by_user_and_stance(
-                    db, stance.id, current_user_id
+            if wants(fields, "average_rating", "num_ratings", "rating_histogram"):
+                histogram: list[int] = histograms[stance.id]
+                num_ratings, average_rating = rating_db.summarize_histogram(histogram)
+                item.update(
+                    average_rating=average_rating,
+                    num_ratings=num_ratings,
+                    rating_histogram=histogram,
                 )
-                my_rating = rating.rating if rating else None
 
-            stance_stance: PaginatedStancesByUserStance = PaginatedStancesByUserStance(
-                id=stance.id,
-                entity=stance_entity,
-                headline=stance.headline,
-                content_json=stance.content_json,
-                average_rating=average_rating,
-                num_ratings=num_ratings,
-                my_rating=my_rating,
-                tags=stance_tags,
-                created_at=stance.created_at.isoformat(),
-            )
-            feed_stances.append(stance_stance)
+            feed_stances.append(PaginatedStancesByUserStance(**pick(fields, item)))
 
         return UserStancesResponse(stances=feed_stances, next_cursor=next_cursor)
     except HTTPException:
@@ -0,0 +1,33 @@
+from pydantic import BaseModel
+
+
+class TagResponse(BaseModel):
+    id: int
+    name: str
+    tag_type: int
+
+
+class TagEntitiesCursor(BaseModel):
+    time: str
+    id: int
+
+
+# list items may leave out any field but id when fields= is given
+class TagEntity(BaseModel):
+    id: int
+    type: int | None = None
+    title: str | None = None
+    images_json: str | None = None
+    tags: list[TagResponse] | None = None
+    description: str | None = None
+    location: str | None = None
+    start_time: str | None = None
+    end_time: str | None = None
+    latest_action_date: str | None = None
+    latest_action_text: str | None = None
+
+
+class TagEntitiesResponse(BaseModel):
+    tag: TagResponse
+    entities: list[TagEntity]
+    next_cursor: TagEntitiesCursor | None = None
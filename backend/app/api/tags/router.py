@@ -0,0 +1,93 @@
+from fastapi import APIRouter, Depends, HTTPException, status, Query
+from sqlalchemy.orm import Session
+from datetime import datetime
+from typing import Literal
+import logging
+
+from app.database.models import *
+from app.dependencies import *
+from app.database import tag as tag_db, entity as entity_db, entity_tag as entity_tag_db
+from app.service.fieldsets import column_fields, columns_for, pick, wants
+from .models import *
+
+router = APIRouter(tags=["tags"], prefix="/tags")
+
+
+@router.get(
+    "/{tag_id}/entities",
+    response_model=TagEntitiesResponse,
+    response_model_exclude_unset=True,
+)
+def get_tag_entities_endpoint(
+    tag_id: int,
+    sort: Literal["recent", "activity"] = "recent",
+    cursor_time: datetime | None = None,
+    cursor_id: int | None = None,
+    limit: int = Query(20, le=100),
+    fields: set[str] | None = Depends(get_fields(TagEntity)),
+    db: Session = Depends(get_db),
+) -> TagEntitiesResponse:
+    try:
+        tag: Tag | None = tag_db.get_tag(db, tag_id)
+        if not tag:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Tag not found"
+            )
+
+        entities: list[Entity] = entity_tag_db.get_entities_for_tag(
+            db,
+            tag_id=tag.id,
+            sort=sort,
+            cursor_time=cursor_time,
+            cursor_id=cursor_id,
+            limit=limit,
+            columns=columns_for(fields, entity_db.ENTITY_FIELD_COLUMNS),
+        )
+
+        next_cursor: TagEntitiesCursor | None = None
+        if len(entities) > limit:
+            entities = entities[:-1]
+            last_entity: Entity = entities[-1]
+            sort_time: datetime = (
+                last_entity.updated_at if sort == "recent" else last_entity.activity_at
+            )
+            next_cursor = TagEntitiesCursor(
+                time=sort_time.isoformat(), id=last_entity.id
+            )
+
+        # load the tags of the whole page at once
+        tags: dict[int, list[Tag]] = {}
+        if wants(fields, "tags"):
+            tags = entity_tag_db.get_tags_for_entities(
+                db, [entity.id for entity in entities]
+            )
+
+        tag_entities: list[TagEntity] = [
+            TagEntity(
+                **pick(
+                    fields,
+                    {
+                        "id": entity.id,
+                        **column_fields(entity, fields, entity_db.ENTITY_FIELD_COLUMNS),
+                        "tags": [
+                            TagResponse(id=t.id, name=t.name, tag_type=t.tag_type)
+                            for t in tags.get(entity.id, [])
+                        ],
+                    },
+                )
+            )
+            for entity in entities
+        ]
+        return TagEntitiesResponse(
+            tag=TagResponse(id=tag.id, name=tag.name, tag_type=tag.tag_type),
+            entities=tag_entities,
+            next_cursor=next_cursor,
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error fetching entities for tag {tag_id}: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Internal server error",
+        )
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Response
 from sqlalchemy.orm import Session
 import logging
 from datetime import datetime
@@ -11,7 +11,17 @@ from app.database import (
     profile as profile_db,
     stance as stance_db,
     follow as follow_db,
+    demographic_stats as demographic_stats_db,
 )
+from app.database.unit_of_work import unit_of_work
+from app.service.demographics import (
+    DemographicBucket,
+    UNKNOWN_BUCKET,
+    demographic_bucket,
+)
+from app.service.http_cache import check_not_modified
+from app.service.availability import availability
+from app.errors import UniqueViolationError
 from .models import *
 from .dependencies import *
 
@@ -57,6 +67,23 @@ def update_current_user_endpoint(
                 status_code=status.HTTP_400_BAD_REQUEST, detail="User not found"
             )
 
+        # changing only the case of a name keeps it, anything else must be free
+        username_taken: bool = (
+            request.username is not None
+            and request.username.lower() != user.username.lower()
+            and availability.is_username_taken(db, request.username)
+        )
+        email_taken: bool = (
+            request.email is not None
+            and request.email.lower() != user.email.lower()
+            and availability.is_email_taken(db, request.email)
+        )
+        if username_taken or email_taken:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Username or email already exists",
+            )
+
         user = user_db.update_user(
             db,
             user_id=current_user,
@@ -64,6 +91,8 @@ def update_current_user_endpoint(
             full_name=request.full_name,
             email=request.email,
         )
+        availability.add(username=user.username, email=user.email)
+
         return UserReadResponse(
             id=user.id,
             username=user.username,
@@ -72,6 +101,11 @@ def update_current_user_endpoint(
         )
     except HTTPException:
         raise
+    except UniqueViolationError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Username or email already exists",
+        )
     except Exception as e:
         logging.error(f"Error updating current user: {e}")
         raise HTTPException(
@@ -83,7 +117,7 @@ def update_current_user_endpoint(
 @router.get("/username_taken", response_model=bool)
 def check_username_endpoint(username: str, db: Session = Depends(get_db)) -> bool:
     try:
-        is_taken: bool = user_db.is_username_taken(db, username=username)
+        is_taken: bool = availability.is_username_taken(db, username)
         return is_taken
     except Exception as e:
         logging.error(f"Error checking username {username}: {e}")
@@ -95,9 +129,18 @@ def check_username_endpoint(username: str, db: Session = Depends(get_db)) -> boo
 
 @router.get("/{user_id}", response_model=UserReadResponse)
 def get_user_endpoint(
-    db: Session = Depends(get_db), user: User = Depends(validate_user)
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_db),
+    user: User = Depends(validate_user),
 ) -> UserReadResponse:
     try:
+        check_not_modified(
+            request,
+            response,
+            version=(user.id, user.updated_at),
+            last_modified=user.updated_at,
+        )
         return UserReadResponse(
             id=user.id,
             username=user.username,
@@ -152,7 +195,9 @@ def create_demographic_endpoint(
 ) -> DemographicReadResponse:
     try:
         logging.info(
-            f"Creating demographic for user {user.id} with data {request.model_dump()}"
+            "Creating demographic for user %d",
+            user.id,
+            extra={"fields": sorted(request.model_fields_set)},
         )
 
         if user.id != current_user:
@@ -161,24 +206,37 @@ def create_demographic_endpoint(
                 detail="Not authorized to create demographic for this user",
             )
 
-        # read existing demographic to prevent duplicates
-        existing_demographic: Demographic | None = (
-            demographic_db.get_demographic_by_user_id(db, user_id=user.id)
-        )
-        if existing_demographic:
-            logging.warning(f"User {user.id} already has a demographic")
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="User already has a demographic",
+        # ratings made so far were counted as unknown; move them with the answers
+        with unit_of_work(db):
+            # wait for the user's rating writes, which count them as unknown
+            # until this commits; also keeps concurrent creates from both
+            # passing the duplicate check
+            demographic_stats_db.lock_user_bucket(db, user.id)
+            existing_demographic: Demographic | None = (
+                demographic_db.get_demographic_by_user_id(db, user_id=user.id)
+            )
+            if existing_demographic:
+                logging.warning(f"User {user.id} already has a demographic")
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="User already has a demographic",
+                )
+
+            demographic: Demographic = demographic_db.create_demographic(
+                db,
+                user_id=user.id,
+                birth_year=request.birth_year,
+                gender=request.gender,
+                zip_code=request.zip_code,
+            )
+            demographic_stats_db.move_user_ratings(
+                db,
+                user.id,
+                UNKNOWN_BUCKET,
+                demographic_bucket(
+                    demographic.birth_year, demographic.gender, demographic.zip_code
+                ),
             )
-
-        demographic: Demographic = demographic_db.create_demographic(
-            db,
-            user_id=user.id,
-            birth_year=request.birth_year,
-            gender=request.gender,
-            zip_code=request.zip_code,
-        )
         return DemographicReadResponse(
             user_id=demographic.user_id,
             birth_year=demographic.birth_year,
@@ -201,7 +259,7 @@ def get_demographic_endpoint(
     user: User = Depends(validate_user),
 ) -> DemographicReadResponse:
     try:
-        logging.info(f"Fetching demographic for user {user.id}")
+        logging.info("Fetching demographic for user %d", user.id)
 
         if user.id != current_user:
             raise HTTPException(
@@ -241,7 +299,9 @@ def update_demographic_endpoint(
 ) -> DemographicUpdateResponse:
     try:
         logging.info(
-            f"Updating demographic for user {user.id} with data {request.model_dump()}"
+            "Updating demographic for user %d",
+            user.id,
+            extra={"fields": sorted(request.model_fields_set)},
         )
 
         if user.id != current_user:
@@ -258,13 +318,30 @@ def update_demographic_endpoint(
                 status_code=status.HTTP_404_NOT_FOUND, detail="Demographic not found"
             )
 
-        demographic: Demographic | None = demographic_db.update_demographic(
-            db, demographic_id=existing_demographic.id, **request.model_dump()
-        )
-        if not demographic:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Failed to update demographic",
+        # update the answers and move the user's ratings to their new bucket
+        with unit_of_work(db):
+            demographic_stats_db.lock_user_bucket(db, user.id)
+            db.refresh(existing_demographic)
+            old_bucket: DemographicBucket = demographic_bucket(
+                existing_demographic.birth_year,
+                existing_demographic.gender,
+                existing_demographic.zip_code,
+            )
+            demographic: Demographic | None = demographic_db.update_demographic(
+                db, demographic_id=existing_demographic.id, **request.model_dump()
+            )
+            if not demographic:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Failed to update demographic",
+                )
+            demographic_stats_db.move_user_ratings(
+                db,
+                user.id,
+                old_bucket,
+                demographic_bucket(
+                    demographic.birth_year, demographic.gender, demographic.zip_code
+                ),
             )
         return DemographicUpdateResponse(
             user_id=demographic.user_id,
@@ -291,7 +368,9 @@ def create_profile_endpoint(
 ) -> ProfileReadResponse:
     try:
         logging.info(
-            f"Creating profile for user {user.id} with data {request.model_dump()}"
+            "Creating profile for user %d",
+            user.id,
+            extra={"fields": sorted(request.model_fields_set)},
         )
         if user.id != current_user:
             raise HTTPException(
@@ -338,15 +417,24 @@ def create_profile_endpoint(
 
 @router.get("/{user_id}/profile", response_model=ProfileReadResponse)
 def get_profile_endpoint(
-    db: Session = Depends(get_db), user: User = Depends(validate_user)
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_db),
+    user: User = Depends(validate_user),
 ) -> ProfileReadResponse:
     try:
-        logging.info(f"Fetching profile for user {user.id}")
+        logging.info("Fetching profile for user %d", user.id)
         profile = profile_db.get_profile_by_user_id(db, user_id=user.id)
         if not profile:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found"
             )
+        check_not_modified(
+            request,
+            response,
+            version=(profile.id, profile.updated_at),
+            last_modified=profile.updated_at,
+        )
         return ProfileReadResponse(
             user_id=profile.user_id,
             profile_id=profile.id,
@@ -373,7 +461,9 @@ def update_profile_endpoint(
 ) -> ProfileUpdateResponse:
     try:
         logging.info(
-            f"Updating profile for user {user.id} with data {request.model_dump()}"
+            "Updating profile for user %d",
+            user.id,
+            extra={"fields": sorted(request.model_fields_set)},
         )
         if user.id != current_user:
             raise HTTPException(
@@ -417,7 +507,7 @@ def get_profile_page_endpoint(
     current_user: int | None = Depends(get_current_user_optional),
 ) -> ProfilePageResponse:
     try:
-        logging.info(f"Fetching profile page for user {user.id}")
+        logging.info("Fetching profile page for user %d", user.id)
 
         profile: Profile | None = profile_db.get_profile_by_user_id(db, user_id=user.id)
         if not profile:
@@ -1,5 +1,6 @@
 from sqlalchemy.orm import Session
 from app.database.models import User, Demographic
+from app.database.unit_of_work import commit_or_flush
 from app.errors import DatabaseError
 import logging
 
@@ -16,8 +17,7 @@ def create_demographic(
             user_id=user_id, birth_year=birth_year, gender=gender, zip_code=zip_code
         )
         db.add(demographic)
-        db.commit()
-        db.refresh(demographic)
+        commit_or_flush(db, demographic)
         return demographic
     except Exception as e:
         logging.error(f"Error creating demographic: {e}")
@@ -44,8 +44,7 @@ def update_demographic(
         for key, value in kwargs.items():
             if hasattr(demographic, key):
                 setattr(demographic, key, value)
-        db.commit()
-        db.refresh(demographic)
+        commit_or_flush(db, demographic)
         return demographic
     except Exception as e:
         logging.error(f"Error updating demographic {demographic_id}: {e}")
@@ -59,7 +58,7 @@ def delete_demographic(db: Session, demographic_id: int) -> bool:
         )
         if demographic:
             db.delete(demographic)
-            db.commit()
+            commit_or_flush(db)
             return True
     except Exception as e:
         logging.error(f"Error deleting demographic {demographic_id}: {e}")
@@ -0,0 +1,191 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import case, func, literal, select, update
+from sqlalchemy.dialects.postgresql import insert
+from datetime import date
+from app.database.models import *
+from app.errors import DatabaseError
+from app.service.demographics import (
+    AGE_BANDS,
+    UNKNOWN,
+    UNKNOWN_BIRTH_YEAR,
+    DemographicBucket,
+    UNKNOWN_BUCKET,
+    demographic_bucket,
+)
+import logging
+
+CELL_COLUMNS = ("stance_id", "birth_year", "gender", "region")
+
+
+def lock_user_bucket(db: Session, user_id: int) -> None:
+    """
+    Lock a user against rating writes until commit, before their demographic
+    answers are created or changed. The user row is locked rather than the
+    demographic row, which does not exist before the first answers.
+    """
+    try:
+        db.query(User.id).filter(User.id == user_id).with_for_update(
+            key_share=True
+        ).first()
+    except Exception as e:
+        logging.error(f"Error locking demographic bucket of user {user_id}: {e}")
+        raise DatabaseError("Failed to lock demographic bucket")
+
+
+def get_user_bucket(db: Session, user_id: int, lock: bool = False) -> DemographicBucket:
+    """
+    Return the demographic bucket a user's ratings are counted in. With lock,
+    the user row is share-locked so that lock_user_bucket, and with it any
+    change of the bucket, waits until commit.
+    """
+    try:
+        if lock:
+            db.query(User.id).filter(User.id == user_id).with_for_update(
+                read=True
+            ).first()
+        row = (
+            db.query(Demographic.birth_year, Demographic.gender, Demographic.zip_code)
+            .filter(Demographic.user_id == user_id)
+            .first()
+        )
+        return demographic_bucket(*row) if row else UNKNOWN_BUCKET
+    except Exception as e:
+        logging.error(f"Error getting demographic bucket for user {user_id}: {e}")
+        raise DatabaseError("Failed to get demographic bucket")
+
+
+def _age_band(birth_year, today: date | None = None):
+    """app.service.demographics.age_band of a birth year column, in SQL."""
+    age = (today or date.today()).year - birth_year
+    return case(
+        (birth_year == UNKNOWN_BIRTH_YEAR, UNKNOWN),
+        (age < 0, UNKNOWN),
+        *((age < bound, label) for bound, label in AGE_BANDS),
+        else_=UNKNOWN,
+    )
+
+
+def _in_cell(stats, bucket: DemographicBucket) -> tuple:
+    return (
+        stats.c.birth_year == bucket.birth_year,
+        stats.c.gender == bucket.gender,
+        stats.c.region == bucket.region,
+    )
+
+
+def _add_to_cells(db: Session, rows) -> None:
+    """
+    Add counts to rollup cells, creating missing ones. rows selects
+    (stance_id, birth_year, gender, region, entity_id, num_ratings, rating_sum).
+    """
+    stats = StanceDemographicStats.__table__
+    statement = insert(stats).from_select(
+        [*CELL_COLUMNS, "entity_id", "num_ratings", "rating_sum"], rows
+    )
+    db.execute(
+        statement.on_conflict_do_update(
+            index_elements=list(CELL_COLUMNS),
+            set_={
+                "num_ratings": stats.c.num_ratings + statement.excluded.num_ratings,
+                "rating_sum": stats.c.rating_sum + statement.excluded.rating_sum,
+            },
+        )
+    )
+
+
+def move_user_ratings(
+    db: Session,
+    user_id: int,
+    old_bucket: DemographicBucket,
+    new_bucket: DemographicBucket,
+) -> None:
+    """
+    Move every rating of a user from one bucket to another after their
+    demographic answers change, in the caller's transaction.
+    """
+    if old_bucket == new_bucket:
+        return
+    try:
+        stats = StanceDemographicStats.__table__
+        # lock the rated stances in id order, as rating writes do, so the two
+        # take turns on the shared cells rather than deadlocking
+        db.execute(
+            select(Stance.id)
+            .where(
+                Stance.id.in_(select(Rating.stance_id).where(Rating.user_id == user_id))
+            )
+            .order_by(Stance.id)
+            .with_for_update(key_share=True)
+        )
+        # keep the user's ratings still while they are moved
+        db.query(Rating.id).filter(Rating.user_id == user_id).with_for_update().all()
+        db.execute(
+            update(stats)
+            .where(
+                Rating.user_id == user_id,
+                stats.c.stance_id == Rating.stance_id,
+                *_in_cell(stats, old_bucket),
+            )
+            .values(
+                num_ratings=stats.c.num_ratings - 1,
+                rating_sum=stats.c.rating_sum - Rating.rating,
+            )
+        )
+        _add_to_cells(
+            db,
+            select(
+                Rating.stance_id,
+                literal(new_bucket.birth_year),
+                literal(new_bucket.gender),
+                literal(new_bucket.region),
+                Stance.entity_id,
+                literal(1),
+                Rating.rating,
+            )
+            .join(Stance, Stance.id == Rating.stance_id)
+            .where(Rating.user_id == user_id),
+        )
+    except Exception as e:
+        logging.error(f"Error moving demographic stats for user {user_id}: {e}")
+        raise DatabaseError("Failed to move demographic stats")
+
+
+def get_breakdown(
+    db: Session,
+    dimensions: list[str],
+    stance_id: int | None = None,
+    entity_id: int | None = None,
+) -> list[tuple]:
+    """
+    Sum the rollup of a stance or of every stance of an entity by the given
+    dimensions. Returns (*dimension values, num_ratings, rating_sum) rows.
+    """
+    try:
+        stats = StanceDemographicStats.__table__
+        columns = [
+            (
+                _age_band(stats.c.birth_year).label("age_band")
+                if dimension == "age_band"
+                else stats.c[dimension]
+            )
+            for dimension in dimensions
+        ]
+        num_ratings = func.sum(stats.c.num_ratings)
+        query = db.query(*columns, num_ratings, func.sum(stats.c.rating_sum))
+        if stance_id is not None:
+            query = query.filter(stats.c.stance_id == stance_id)
+        if entity_id is not None:
+            query = query.filter(stats.c.entity_id == entity_id)
+        return [
+            tuple(row)
+            for row in query.group_by(*columns)
+            .having(num_ratings > 0)
+            .order_by(*columns)
+            .all()
+        ]
+    except Exception as e:
+        logging.error(
+            f"Error getting demographic breakdown by {dimensions} "
+            f"(stance={stance_id}, entity={entity_id}): {e}"
+        )
+        raise DatabaseError("Failed to get demographic breakdown")
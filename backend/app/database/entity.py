@@ -1,10 +1,27 @@
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, load_only
 from sqlalchemy.sql import func
 from app.database.models import Entity
+from app.database.unit_of_work import commit_or_flush
+from app.database import outbox as outbox_db
 from app.errors import DatabaseError
 import logging
 from datetime import datetime
 
+# small columns list queries always load, for ordering and cursors
+ENTITY_KEY_COLUMNS = (Entity.id, Entity.updated_at, Entity.activity_at)
+# the other columns, by the list item field that reads them
+ENTITY_FIELD_COLUMNS: dict[str, tuple] = {
+    "type": (Entity.type,),
+    "title": (Entity.title,),
+    "images_json": (Entity.images_json,),
+    "description": (Entity.description,),
+    "location": (Entity.location,),
+    "start_time": (Entity.start_time,),
+    "end_time": (Entity.end_time,),
+    "latest_action_date": (Entity.latest_action_date,),
+    "latest_action_text": (Entity.latest_action_text,),
+}
+
 
 def create_entity(
     db: Session,
@@ -33,8 +50,9 @@ def create_entity(
             latest_action_text=latest_action_text,
         )
         db.add(entity)
-        db.commit()
-        db.refresh(entity)
+        db.flush()
+        outbox_db.add_outbox_event(db, outbox_db.ENTITY_CREATED, entity.id)
+        commit_or_flush(db, entity)
         return entity
     except Exception as e:
         logging.error(f"Error creating entity: {e}")
@@ -49,6 +67,15 @@ def read_entity(db: Session, entity_id: int) -> Entity | None:
         raise DatabaseError("Failed to read entity")
 
 
+def read_entities(db: Session, entity_ids: list[int]) -> dict[int, Entity]:
+    try:
+        entities = db.query(Entity).filter(Entity.id.in_(entity_ids)).all()
+        return {entity.id: entity for entity in entities}
+    except Exception as e:
+        logging.error(f"Error reading entities {entity_ids}: {e}")
+        raise DatabaseError("Failed to read entities")
+
+
 def update_entity(db: Session, entity_id: int, **kwargs) -> Entity | None:
     ALLOWED_FIELDS = {
         "title",
@@ -68,8 +95,10 @@ def update_entity(db: Session, entity_id: int, **kwargs) -> Entity | None:
         for key, value in kwargs.items():
             if hasattr(entity, key) and key in ALLOWED_FIELDS:
                 setattr(entity, key, value)
-        db.commit()
-        db.refresh(entity)
+        # always bump updated_at; tag changes do not touch the entity row itself
+        entity.updated_at = func.now()
+        outbox_db.add_outbox_event(db, outbox_db.ENTITY_UPDATED, entity_id)
+        commit_or_flush(db, entity)
         return entity
     except Exception as e:
         logging.error(f"Error updating entity {entity_id}: {e}")
@@ -81,7 +110,8 @@ def delete_entity(db: Session, entity_id: int) -> bool:
         entity = db.query(Entity).filter(Entity.id == entity_id).first()
         if entity:
             db.delete(entity)
-            db.commit()
+            outbox_db.add_outbox_event(db, outbox_db.ENTITY_DELETED, entity_id)
+            commit_or_flush(db)
             return True
     except Exception as e:
         logging.error(f"Error deleting entity {entity_id}: {e}")
@@ -89,12 +119,24 @@ def delete_entity(db: Session, entity_id: int) -> bool:
     return False
 
 
+def query_entities(db: Session, columns: list | None = None):
+    """Query entities, loading only the given columns when they are set."""
+    query = db.query(Entity)
+    if columns is not None:
+        # raise rather than lazy-load the columns that were left out
+        query = query.options(load_only(*ENTITY_KEY_COLUMNS, *columns, raiseload=True))
+    return query
+
+
 def get_entities(
-    db: Session, limit: int, cursor: datetime | None = None
+    db: Session,
+    limit: int,
+    cursor: datetime | None = None,
+    columns: list | None = None,
 ) -> list[Entity]:
     """Fetch entities ordered by updated_at (descending) with cursor-based pagination."""
     try:
-        query = db.query(Entity)
+        query = query_entities(db, columns)
         if cursor:
             query = query.filter(Entity.updated_at < cursor)
 
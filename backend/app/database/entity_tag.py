@@ -1,15 +1,20 @@
 from sqlalchemy.orm import Session
+from sqlalchemy import exists
 from app.database.models import Entity, Tag, EntityTag
+from app.database.entity import query_entities
+from app.database.unit_of_work import commit_or_flush
 from app.errors import DatabaseError
 import logging
+from datetime import datetime
+
+ENTITY_SORT_KEYS = {"recent": Entity.updated_at, "activity": Entity.activity_at}
 
 
 def create_entity_tag(db: Session, entity_id: int, tag_id: int) -> EntityTag:
     try:
         entity_tag = EntityTag(entity_id=entity_id, tag_id=tag_id)
         db.add(entity_tag)
-        db.commit()
-        db.refresh(entity_tag)
+        commit_or_flush(db, entity_tag)
         return entity_tag
     except Exception as e:
         db.rollback()
@@ -41,8 +46,7 @@ def update_entity_tag(db: Session, entity_tag_id: int, **kwargs) -> EntityTag |
         for key, value in kwargs.items():
             if hasattr(entity_tag, key):
                 setattr(entity_tag, key, value)
-        db.commit()
-        db.refresh(entity_tag)
+        commit_or_flush(db, entity_tag)
         return entity_tag
     except Exception as e:
         db.rollback()
@@ -55,7 +59,7 @@ def delete_entity_tag(db: Session, entity_tag_id: int) -> bool:
         entity_tag = db.query(EntityTag).filter(EntityTag.id == entity_tag_id).first()
         if entity_tag:
             db.delete(entity_tag)
-            db.commit()
+            commit_or_flush(db)
             return True
     except Exception as e:
         db.rollback()
@@ -88,11 +92,35 @@ def get_entity_tags_for_tag(db: Session, tag_id: int) -> list[EntityTag]:
         raise DatabaseError("Failed to get entities for tag")
 
 
-def get_entities_for_tag(db: Session, tag_id: int) -> list[Entity]:
+def get_entities_for_tag(
+    db: Session,
+    tag_id: int,
+    sort: str,
+    cursor_time: datetime | None,
+    cursor_id: int | None,
+    limit: int,
+    columns: list | None = None,
+) -> list[Entity]:
+    """
+    Fetch a page of the entities carrying a tag, newest first by the sort key
+    ("recent" for updated_at, "activity" for activity_at), using keyset
+    pagination on (sort key, id).
+    """
     try:
-        entity_tags = db.query(EntityTag).filter(EntityTag.tag_id == tag_id).all()
-        entity_ids = [et.entity_id for et in entity_tags]
-        return db.query(Entity).filter(Entity.id.in_(entity_ids)).all()
+        sort_key = ENTITY_SORT_KEYS[sort]
+        query = query_entities(db, columns).filter(
+            exists().where(EntityTag.tag_id == tag_id, EntityTag.entity_id == Entity.id)
+        )
+        if cursor_time is not None and cursor_id is not None:
+            query = query.filter(
+                (sort_key < cursor_time)
+                | ((sort_key == cursor_time) & (Entity.id < cursor_id))
+            )
+        return (
+            query.order_by(sort_key.desc(), Entity.id.desc())
+            .limit(limit + 1)  # fetch one extra to check for next cursor
+            .all()
+        )
     except Exception as e:
         logging.error(f"Error getting entities for tag {tag_id}: {e}")
         raise DatabaseError("Failed to get entities for tag")
@@ -108,6 +136,37 @@ def get_tags_for_entity(db: Session, entity_id: int) -> list[Tag]:
         raise DatabaseError("Failed to get tags for entity")
 
 
+def get_tags_for_entities(db: Session, entity_ids: list[int]) -> dict[int, list[Tag]]:
+    try:
+        rows = (
+            db.query(EntityTag.entity_id, Tag)
+            .join(Tag, Tag.id == EntityTag.tag_id)
+            .filter(EntityTag.entity_id.in_(entity_ids))
+            .all()
+        )
+        tags: dict[int, list[Tag]] = {entity_id: [] for entity_id in entity_ids}
+        for entity_id, tag in rows:
+            tags[entity_id].append(tag)
+        return tags
+    except Exception as e:
+        logging.error(f"Error getting tags for entities {entity_ids}: {e}")
+        raise DatabaseError("Failed to get tags for entities")
+
+
+def get_entity_tag_pairs(db: Session, entity_ids: list[int]) -> list[tuple[int, int]]:
+    """The (entity id, tag id) pair of every tag of the entities."""
+    try:
+        return [
+            tuple(row)
+            for row in db.query(EntityTag.entity_id, EntityTag.tag_id)
+            .filter(EntityTag.entity_id.in_(entity_ids))
+            .all()
+        ]
+    except Exception as e:
+        logging.error(f"Error getting tag ids for entities {entity_ids}: {e}")
+        raise DatabaseError("Failed to get entity tag pairs")
+
+
 def delete_entity_tags_for_entity(db: Session, entity_id: int) -> None:
     db.query(EntityTag).filter(EntityTag.entity_id == entity_id).delete()
-    db.commit()
+    commit_or_flush(db)
@@ -0,0 +1,20 @@
+from sqlalchemy.orm import Session
+from app.database.models import UserTagAffinity, TagStancePool
+from app.errors import DatabaseError
+import logging
+
+
+def get_tag_affinity(db: Session, user_id: int) -> UserTagAffinity | None:
+    try:
+        return db.get(UserTagAffinity, user_id)
+    except Exception as e:
+        logging.error(f"Error getting tag affinity of user {user_id}: {e}")
+        raise DatabaseError("Failed to get tag affinity")
+
+
+def get_tag_stance_pools(db: Session, tag_ids: list[int]) -> list[TagStancePool]:
+    try:
+        return db.query(TagStancePool).filter(TagStancePool.tag_id.in_(tag_ids)).all()
+    except Exception as e:
+        logging.error(f"Error getting stance pools of tags {tag_ids}: {e}")
+        raise DatabaseError("Failed to get tag stance pools")
@@ -1,5 +1,7 @@
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload
 from app.database.models import *
+from app.database.unit_of_work import commit_or_flush
+from app.database import outbox as outbox_db
 from app.errors import DatabaseError
 import logging
 from datetime import datetime
@@ -9,8 +11,10 @@ def create_follow(db: Session, follower_id: int, followed_id: int) -> Follow:
     try:
         follow = Follow(follower_id=follower_id, followed_id=followed_id)
         db.add(follow)
-        db.commit()
-        db.refresh(follow)
+        outbox_db.add_outbox_event(
+            db, outbox_db.FOLLOW_CREATED, followed_id, {"follower_id": follower_id}
+        )
+        commit_or_flush(db, follow)
         return follow
     except Exception as e:
         logging.error(f"Error creating follow from {follower_id} to {followed_id}: {e}")
@@ -44,7 +48,13 @@ def delete_follow(db: Session, follow_id: int) -> bool:
         follow = db.query(Follow).filter(Follow.id == follow_id).first()
         if follow:
             db.delete(follow)
-            db.commit()
+            outbox_db.add_outbox_event(
+                db,
+                outbox_db.FOLLOW_DELETED,
+                follow.followed_id,
+                {"follower_id": follow.follower_id},
+            )
+            commit_or_flush(db)
             return True
     except Exception as e:
         logging.error(f"Error deleting follow {follow_id}: {e}")
@@ -58,6 +68,7 @@ def read_user_followers(
     try:
         query = (
             db.query(Follow)
+            .options(joinedload(Follow.follower))
             .filter(Follow.followed_id == user_id)
             .order_by(Follow.created_at.desc())
         )
@@ -77,6 +88,7 @@ def read_user_following(
     try:
         query = (
             db.query(Follow)
+            .options(joinedload(Follow.followed))
             .filter(Follow.follower_id == user_id)
             .order_by(Follow.created_at.desc())
         )
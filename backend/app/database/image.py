@@ -1,5 +1,6 @@
 from sqlalchemy.orm import Session
 from app.database.models import Image
+from app.database.unit_of_work import commit_or_flush
 from app.errors import DatabaseError
 import logging
 
@@ -23,8 +24,7 @@ def create_image(
             file_type=file_type,
         )
         db.add(image)
-        db.commit()
-        db.refresh(image)
+        commit_or_flush(db, image)
         return image
     except Exception as e:
         db.rollback()
@@ -48,8 +48,7 @@ def update_image(db: Session, image_id: int, **kwargs) -> Image | None:
         for key, value in kwargs.items():
             if hasattr(image, key):
                 setattr(image, key, value)
-        db.commit()
-        db.refresh(image)
+        commit_or_flush(db, image)
         return image
     except Exception as e:
         logging.error(f"Error updating image {image_id}: {e}")
@@ -61,7 +60,7 @@ def delete_image(db: Session, image_id: int) -> bool:
         image = db.query(Image).filter(Image.id == image_id).first()
         if image:
             db.delete(image)
-            db.commit()
+            commit_or_flush(db)
             return True
     except Exception as e:
         logging.error(f"Error deleting image {image_id}: {e}")
@@ -9,3 +9,7 @@ from .profile import Profile
 from .refresh_token import RefreshToken
 from .rating import Rating
 from .follow import Follow
+from .stance_rating_stats import StanceRatingStats
+from .stance_demographic_stats import StanceDemographicStats
+from .outbox_event import OutboxEvent
+from .feed_ranking import UserTagAffinity, TagStancePool
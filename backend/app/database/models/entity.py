@@ -1,6 +1,7 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime
+from sqlalchemy import Column, Integer, String, Text, DateTime, Computed, Index
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.sql import func
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, deferred, column_property
 from app.database.connect import Base
 from enum import Enum
 
@@ -42,6 +43,11 @@ class Entity(Base):
         index=True,
     )
 
+    # when the entity last saw real-world activity, for activity-ordered feeds
+    activity_at = column_property(
+        func.coalesce(latest_action_date, start_time, created_at)
+    )
+
     stances = relationship(
         "Stance", back_populates="entity", cascade="all, delete-orphan"
     )
@@ -51,3 +57,25 @@ class Entity(Base):
     tags = relationship(
         "EntityTag", back_populates="entity", cascade="all, delete-orphan"
     )
+
+    # full-text search document, kept current by postgres on every write
+    search_vector = deferred(
+        Column(
+            TSVECTOR,
+            Computed(
+                "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+                "setweight(to_tsvector('english', coalesce(description, '')), 'B')",
+                persisted=True,
+            ),
+            nullable=True,
+        )
+    )
+
+    __table_args__ = (
+        Index("ix_entities_search_vector", "search_vector", postgresql_using="gin"),
+        Index(
+            "ix_entities_activity_at",
+            func.coalesce(latest_action_date, start_time, created_at).desc(),
+            id.desc(),
+        ),
+    )
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, ForeignKey
+from sqlalchemy import Column, Integer, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from app.database.connect import Base
 
@@ -8,7 +8,11 @@ class EntityTag(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     entity_id = Column(Integer, ForeignKey("entities.id"), nullable=False, index=True)
-    tag_id = Column(Integer, ForeignKey("tags.id"), nullable=False, index=True)
+    tag_id = Column(Integer, ForeignKey("tags.id"), nullable=False)
 
     tag = relationship("Tag", back_populates="entities")
     entity = relationship("Entity", back_populates="tags")
+
+    # covers lookups by tag and lets tag feeds probe (tag, entity) pairs
+    # without touching the table
+    __table_args__ = (Index("ix_entity_tags_tag_id_entity_id", tag_id, entity_id),)
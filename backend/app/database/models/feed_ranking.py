@@ -0,0 +1,43 @@
+from sqlalchemy import Column, Integer, Float, DateTime, ForeignKey
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.sql import func
+from app.database.connect import Base
+
+
+class UserTagAffinity(Base):
+    """
+    How much a user likes each tag, learned from their ratings; a sparse unit
+    vector of the user's strongest tags. Rebuilt by the feed ranking job.
+    """
+
+    __tablename__ = "user_tag_affinities"
+
+    user_id = Column(
+        Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True
+    )
+    # parallel arrays, strongest affinity first; weights are in [-1, 1]
+    tag_ids = Column(ARRAY(Integer), nullable=False)
+    weights = Column(ARRAY(Float), nullable=False)
+    updated_at = Column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False
+    )
+
+
+class TagStancePool(Base):
+    """
+    Candidate stances for personalized feeds of a tag: its most engaging and
+    its newest stances. Rebuilt by the feed ranking job.
+    """
+
+    __tablename__ = "tag_stance_pools"
+
+    tag_id = Column(
+        Integer, ForeignKey("tags.id", ondelete="CASCADE"), primary_key=True
+    )
+    # parallel arrays, one entry per stance
+    stance_ids = Column(ARRAY(Integer), nullable=False)
+    entity_ids = Column(ARRAY(Integer), nullable=False)
+    engagement_scores = Column(ARRAY(Float), nullable=False)
+    updated_at = Column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False
+    )
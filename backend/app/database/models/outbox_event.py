@@ -0,0 +1,40 @@
+from sqlalchemy import BigInteger, Column, Integer, String, Text, DateTime, Index
+from sqlalchemy.sql import func
+from app.database.connect import Base
+
+
+class OutboxEvent(Base):
+    """
+    A change to derived data, written in the transaction of the mutation that
+    caused it and processed by the outbox worker.
+    """
+
+    __tablename__ = "outbox_events"
+
+    id = Column(BigInteger, primary_key=True)
+    topic = Column(String(50), nullable=False)
+    # id of the row the topic is about, e.g. the stance of a rating change
+    aggregate_id = Column(Integer, nullable=False)
+    payload_json = Column(Text, nullable=False, default="{}")
+    created_at = Column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False
+    )
+    # pushed back after each failed attempt
+    available_at = Column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False
+    )
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text, nullable=True)
+    # set once the event has failed too often; it is kept for inspection
+    dead_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        # the worker only ever scans pending events
+        Index(
+            "ix_outbox_events_pending",
+            available_at,
+            id,
+            postgresql_where=dead_at.is_(None),
+        ),
+        Index("ix_outbox_events_dead", id, postgresql_where=dead_at.isnot(None)),
+    )
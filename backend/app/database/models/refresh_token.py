@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, Text, DateTime, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, Text, DateTime, ForeignKey, Boolean, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.database.connect import Base
@@ -11,7 +11,7 @@ class RefreshToken(Base):
     user_id = Column(
         Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False
     )
-    hashed_token = Column(Text, unique=True, nullable=False)
+    hashed_token = Column(Text, nullable=False)
     created_at = Column(
         DateTime(timezone=True), server_default=func.now(), nullable=False
     )
@@ -19,3 +19,17 @@ class RefreshToken(Base):
     revoked = Column(Boolean, default=False, nullable=False)
 
     user = relationship("User", back_populates="refresh_tokens")
+
+    __table_args__ = (
+        # lookups only ever want active tokens; revoked ones drop out of the
+        # index until compaction deletes them
+        Index(
+            "ix_refresh_tokens_active_hashed_token",
+            hashed_token,
+            unique=True,
+            postgresql_where=~revoked,
+        ),
+        # for compaction to find expired and revoked tokens
+        Index("ix_refresh_tokens_expires_at", expires_at),
+        Index("ix_refresh_tokens_revoked", id, postgresql_where=revoked),
+    )
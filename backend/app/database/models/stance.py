@@ -7,9 +7,12 @@ from sqlalchemy import (
     ForeignKey,
     CheckConstraint,
     Float,
+    Computed,
+    Index,
 )
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.sql import func
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, deferred
 from app.database.connect import Base
 
 
@@ -25,6 +28,12 @@ class Stance(Base):
     )
     headline = Column(String(200), nullable=False)
     content_json = Column(Text, nullable=False)
+    # plain text of content_json, extracted on write for search
+    content_text = deferred(Column(Text, nullable=True))
+    # feed preview of content_json, built on write so feeds can skip the document
+    excerpt = Column(Text, nullable=True)
+    word_count = Column(Integer, nullable=True)
+    preview_image_url = Column(Text, nullable=True)
     engagement_score = Column(Float, nullable=False, default=0.0, index=True)
     created_at = Column(
         DateTime(timezone=True), server_default=func.now(), nullable=False
@@ -44,3 +53,20 @@ class Stance(Base):
     ratings = relationship(
         "Rating", back_populates="stance", cascade="all, delete-orphan"
     )
+
+    # full-text search document, kept current by postgres on every write
+    search_vector = deferred(
+        Column(
+            TSVECTOR,
+            Computed(
+                "setweight(to_tsvector('english', coalesce(headline, '')), 'A') || "
+                "setweight(to_tsvector('english', coalesce(content_text, '')), 'B')",
+                persisted=True,
+            ),
+            nullable=True,
+        )
+    )
+
+    __table_args__ = (
+        Index("ix_stances_search_vector", "search_vector", postgresql_using="gin"),
+    )
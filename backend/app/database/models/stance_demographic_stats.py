@@ -0,0 +1,27 @@
+from sqlalchemy import Column, Integer, String, ForeignKey, Index
+from app.database.connect import Base
+
+
+class StanceDemographicStats(Base):
+    """
+    Rating count and sum per stance and demographic bucket, maintained by
+    rating writes and demographic changes.
+    """
+
+    __tablename__ = "stance_demographic_stats"
+
+    stance_id = Column(
+        Integer, ForeignKey("stances.id", ondelete="CASCADE"), primary_key=True
+    )
+    # 0 when unknown; the age band is derived from it when reading
+    birth_year = Column(Integer, primary_key=True)
+    gender = Column(String(20), primary_key=True)
+    region = Column(String(20), primary_key=True)
+    # denormalized from the stance so entity breakdowns need no join
+    entity_id = Column(
+        Integer, ForeignKey("entities.id", ondelete="CASCADE"), nullable=False
+    )
+    num_ratings = Column(Integer, nullable=False, default=0, server_default="0")
+    rating_sum = Column(Integer, nullable=False, default=0, server_default="0")
+
+    __table_args__ = (Index("ix_stance_demographic_stats_entity_id", entity_id),)
@@ -0,0 +1,25 @@
+from sqlalchemy import Column, Integer, DateTime, ForeignKey
+from sqlalchemy.sql import func
+from app.database.connect import Base
+
+
+class StanceRatingStats(Base):
+    """Per-stance rating histogram, maintained by rating_db.rate_stances."""
+
+    __tablename__ = "stance_rating_stats"
+
+    stance_id = Column(
+        Integer, ForeignKey("stances.id", ondelete="CASCADE"), primary_key=True
+    )
+    # number of ratings with each star value
+    count_1 = Column(Integer, nullable=False, default=0, server_default="0")
+    count_2 = Column(Integer, nullable=False, default=0, server_default="0")
+    count_3 = Column(Integer, nullable=False, default=0, server_default="0")
+    count_4 = Column(Integer, nullable=False, default=0, server_default="0")
+    count_5 = Column(Integer, nullable=False, default=0, server_default="0")
+    updated_at = Column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        onupdate=func.now(),
+        nullable=False,
+    )
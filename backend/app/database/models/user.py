@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean
+from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.database.connect import Base
@@ -21,6 +21,7 @@ class User(Base):
         server_default=func.now(),
         onupdate=func.now(),
         nullable=False,
+        index=True,
     )
 
     demographic = relationship("Demographic", back_populates="user", uselist=False)
@@ -43,3 +44,9 @@ class User(Base):
         back_populates="followed",
         cascade="all, delete-orphan",
     )
+
+    # usernames and emails are unique regardless of case
+    __table_args__ = (
+        Index("ix_users_username_lower", func.lower(username), unique=True),
+        Index("ix_users_email_lower", func.lower(email), unique=True),
+    )
@@ -0,0 +1,143 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import delete, func, select, update, extract
+from app.database.models.outbox_event import OutboxEvent
+from app.database.unit_of_work import commit_or_flush
+from app.errors import DatabaseError
+from datetime import timedelta
+from typing import NamedTuple
+import json
+import logging
+
+# event topics, as "<aggregate>.<change>"
+STANCE_CREATED = "stance.created"
+STANCE_UPDATED = "stance.updated"
+STANCE_DELETED = "stance.deleted"
+RATING_CHANGED = "rating.changed"
+FOLLOW_CREATED = "follow.created"
+FOLLOW_DELETED = "follow.deleted"
+ENTITY_CREATED = "entity.created"
+ENTITY_UPDATED = "entity.updated"
+ENTITY_DELETED = "entity.deleted"
+
+
+class OutboxLag(NamedTuple):
+    pending: int
+    oldest_pending_seconds: float
+    dead: int
+
+
+def add_outbox_event(
+    db: Session, topic: str, aggregate_id: int, payload: dict | None = None
+) -> None:
+    """
+    Record an event in the session's transaction, without flushing. It is
+    written by the caller's next commit, so it exists only if the change does.
+    """
+    try:
+        db.add(
+            OutboxEvent(
+                topic=topic,
+                aggregate_id=aggregate_id,
+                payload_json=json.dumps(payload or {}),
+            )
+        )
+    except Exception as e:
+        logging.error(f"Error adding {topic} event for {aggregate_id}: {e}")
+        raise DatabaseError("Failed to add outbox event")
+
+
+def claim_outbox_events(db: Session, limit: int) -> list[OutboxEvent]:
+    """
+    Lock up to limit pending events that are due, oldest first, for the rest of
+    the transaction. Events locked by another worker are skipped.
+    """
+    try:
+        return list(
+            db.scalars(
+                select(OutboxEvent)
+                .where(
+                    OutboxEvent.dead_at.is_(None),
+                    OutboxEvent.available_at <= func.now(),
+                )
+                .order_by(OutboxEvent.available_at, OutboxEvent.id)
+                .limit(limit)
+                .with_for_update(skip_locked=True)
+            )
+        )
+    except Exception as e:
+        logging.error(f"Error claiming outbox events: {e}")
+        raise DatabaseError("Failed to claim outbox events")
+
+
+def delete_outbox_events(db: Session, event_ids: list[int]) -> None:
+    try:
+        if event_ids:
+            db.execute(delete(OutboxEvent).where(OutboxEvent.id.in_(event_ids)))
+        commit_or_flush(db)
+    except Exception as e:
+        logging.error(f"Error deleting outbox events: {e}")
+        raise DatabaseError("Failed to delete outbox events")
+
+
+def fail_outbox_event(
+    db: Session, event_id: int, error: str, retry_after: float | None
+) -> None:
+    """
+    Record a failed attempt at an event. It is retried after retry_after
+    seconds, or dead-lettered when retry_after is None.
+    """
+    try:
+        values: dict = {
+            "attempts": OutboxEvent.attempts + 1,
+            "last_error": error[:2000],
+        }
+        if retry_after is None:
+            values["dead_at"] = func.now()
+        else:
+            values["available_at"] = func.now() + timedelta(seconds=retry_after)
+        db.execute(update(OutboxEvent).where(OutboxEvent.id == event_id).values(values))
+        commit_or_flush(db)
+    except Exception as e:
+        logging.error(f"Error failing outbox event {event_id}: {e}")
+        raise DatabaseError("Failed to fail outbox event")
+
+
+def requeue_dead_outbox_events(db: Session, topic: str | None = None) -> int:
+    """
+    Make dead-lettered events (of one topic, if given) pending again with
+    fresh attempts, once their cause is fixed. Returns the number requeued.
+    """
+    try:
+        statement = (
+            update(OutboxEvent)
+            .where(OutboxEvent.dead_at.isnot(None))
+            .values(dead_at=None, attempts=0, available_at=func.now())
+        )
+        if topic is not None:
+            statement = statement.where(OutboxEvent.topic == topic)
+        result = db.execute(statement)
+        commit_or_flush(db)
+        return result.rowcount
+    except Exception as e:
+        logging.error(f"Error requeueing dead outbox events: {e}")
+        raise DatabaseError("Failed to requeue dead outbox events")
+
+
+def get_outbox_lag(db: Session) -> OutboxLag:
+    """How many events wait, how long the oldest has waited, and how many died."""
+    try:
+        pending = OutboxEvent.dead_at.is_(None)
+        row = db.execute(
+            select(
+                func.count().filter(pending),
+                extract(
+                    "epoch",
+                    func.now() - func.min(OutboxEvent.created_at).filter(pending),
+                ),
+                func.count().filter(~pending),
+            )
+        ).one()
+        return OutboxLag(row[0], float(row[1] or 0), row[2])
+    except Exception as e:
+        logging.error(f"Error reading outbox lag: {e}")
+        raise DatabaseError("Failed to read outbox lag")
@@ -1,5 +1,6 @@
 from sqlalchemy.orm import Session
 from app.database.models import User, Profile
+from app.database.unit_of_work import commit_or_flush
 from app.errors import DatabaseError
 import logging
 
@@ -19,8 +20,7 @@ def create_profile(
             pinned_stance_id=pinned_stance_id,
         )
         db.add(profile)
-        db.commit()
-        db.refresh(profile)
+        commit_or_flush(db, profile)
         return profile
     except Exception as e:
         logging.error(f"Error creating profile: {e}")
@@ -43,8 +43,7 @@ def update_profile(db: Session, profile_id: int, **kwargs) -> Profile | None:
         for key, value in kwargs.items():
             if hasattr(profile, key):
                 setattr(profile, key, value)
-        db.commit()
-        db.refresh(profile)
+        commit_or_flush(db, profile)
         return profile
     except Exception as e:
         logging.error(f"Error updating profile {profile_id}: {e}")
@@ -56,7 +55,7 @@ def delete_profile(db: Session, profile_id: int) -> bool:
         profile = db.query(Profile).filter(Profile.id == profile_id).first()
         if profile:
             db.delete(profile)
-            db.commit()
+            commit_or_flush(db)
             return True
     except Exception as e:
         logging.error(f"Error deleting profile {profile_id}: {e}")
@@ -81,3 +80,18 @@ def get_profile_by_user_id(db: Session, user_id: int) -> Profile | None:
     except Exception as e:
         logging.error(f"Error getting profile by user_id {user_id}: {e}")
         raise DatabaseError("Failed to get profile by user_id")
+
+
+def get_profiles_by_user_ids(db: Session, user_ids: list[int]) -> dict[int, Profile]:
+    try:
+        profiles = (
+            db.query(Profile)
+            .filter(Profile.user_id.in_(user_ids))
+            .order_by(Profile.id.desc())
+            .all()
+        )
+        # like User.profile, the first profile of a user wins
+        return {profile.user_id: profile for profile in profiles}
+    except Exception as e:
+        logging.error(f"Error getting profiles by user_ids {user_ids}: {e}")
+        raise DatabaseError("Failed to get profiles by user_ids")
@@ -1,29 +1,18 @@
 from sqlalchemy.orm import Session
+from sqlalchemy import func, select, literal, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.dialects.postgresql import insert
 from app.database.models.rating import Rating
+from app.database.models.stance_rating_stats import StanceRatingStats
+from app.database.unit_of_work import commit_or_flush, in_unit_of_work, unit_of_work
+from app.database import demographic_stats as demographic_stats_db
+from app.database import outbox as outbox_db
+from app.service.demographics import DemographicBucket
+from typing import NamedTuple
 import logging
 from app.errors import DatabaseError
 
-
-def create_or_update_rating(
-    db: Session, stance_id: int, user_id: int, rating_value: int
-) -> Rating:
-    try:
-        existing = (
-            db.query(Rating).filter_by(stance_id=stance_id, user_id=user_id).first()
-        )
-        if existing:
-            existing.rating = rating_value
-            db.commit()
-            db.refresh(existing)
-            return existing
-        new_rating = Rating(stance_id=stance_id, user_id=user_id, rating=rating_value)
-        db.add(new_rating)
-        db.commit()
-        db.refresh(new_rating)
-        return new_rating
-    except Exception as e:
-        logging.error(f"Error creating/updating rating: {e}")
-        raise DatabaseError("Failed to create or update rating")
+RATING_VALUES = range(1, 6)
 
 
 def read_rating_by_user_and_stance(
@@ -38,6 +27,25 @@ def read_rating_by_user_and_stance(
         raise DatabaseError("Failed to read rating")
 
 
+def read_ratings_by_user_for_stances(
+    db: Session, user_id: int, stance_ids: list[int]
+) -> dict[int, int]:
+    """Return the user's rating of each of the stances they have rated."""
+    try:
+        # served by the (stance_id, user_id) unique index
+        rows = (
+            db.query(Rating.stance_id, Rating.rating)
+            .filter(Rating.user_id == user_id, Rating.stance_id.in_(stance_ids))
+            .all()
+        )
+        return {stance_id: rating for stance_id, rating in rows}
+    except Exception as e:
+        logging.error(
+            f"Error reading ratings of user {user_id} for stances {stance_ids}: {e}"
+        )
+        raise DatabaseError("Failed to read ratings")
+
+
 def read_ratings_for_stance(db: Session, stance_id: int) -> list[Rating]:
     try:
         return db.query(Rating).filter_by(stance_id=stance_id).all()
@@ -52,7 +60,7 @@ def delete_rating_by_id(db: Session, rating_id: int) -> bool:
         if not rating:
             return False
         db.delete(rating)
-        db.commit()
+        commit_or_flush(db)
         return True
     except Exception as e:
         logging.error(f"Error deleting rating {rating_id}: {e}")
@@ -72,19 +80,285 @@ def get_average_rating_for_stance(db: Session, stance_id: int) -> float:
         raise DatabaseError("Failed to get average rating for stance")
 
 
-def rate_stance(db: Session, user_id: int, stance_id: int, rating: int | None) -> bool:
+# One statement applies a user's ratings of several stances: it locks their
+# current ratings, writes or deletes them, moves the stances' histogram counts
+# and demographic cells by the difference, and returns the new histograms.
+# Unknown stance ids are dropped. The stances are locked first, in id order,
+# and everything else reads them; so writers of the shared histogram and
+# demographic rows of a stance take turns, without deadlocking each other.
+RATE_SQL = """
+WITH input AS (
+    SELECT i.stance_id, i.rating, s.entity_id
+    FROM unnest(CAST(:stance_ids AS integer[]), CAST(:ratings AS integer[]))
+        AS i (stance_id, rating)
+    JOIN stances s ON s.id = i.stance_id
+    ORDER BY s.id
+    FOR NO KEY UPDATE OF s
+),
+old AS (
+    SELECT r.stance_id, r.rating FROM ratings r
+    WHERE r.user_id = :user_id AND r.stance_id IN (SELECT stance_id FROM input)
+    FOR UPDATE
+),
+changes AS (
+    SELECT i.stance_id, i.entity_id, o.rating AS old_rating, i.rating AS new_rating
+    FROM input i
+    LEFT JOIN old o ON o.stance_id = i.stance_id
+    WHERE o.rating IS DISTINCT FROM i.rating
+),
+removed AS (
+    DELETE FROM ratings r USING changes c
+    WHERE r.user_id = :user_id AND r.stance_id = c.stance_id
+        AND c.new_rating IS NULL
+),
+written AS (
+    INSERT INTO ratings (stance_id, user_id, rating)
+    SELECT stance_id, :user_id, new_rating FROM changes
+    WHERE new_rating IS NOT NULL
+    ON CONFLICT (stance_id, user_id) DO UPDATE SET rating = EXCLUDED.rating
+    WHERE ratings.rating IS DISTINCT FROM EXCLUDED.rating
+    RETURNING stance_id, xmax = 0 AS inserted
+),
+stats AS (
+    UPDATE stance_rating_stats s SET
+        count_1 = s.count_1 + (c.new_rating IS NOT DISTINCT FROM 1)::int
+            - (c.old_rating IS NOT DISTINCT FROM 1)::int,
+        count_2 = s.count_2 + (c.new_rating IS NOT DISTINCT FROM 2)::int
+            - (c.old_rating IS NOT DISTINCT FROM 2)::int,
+        count_3 = s.count_3 + (c.new_rating IS NOT DISTINCT FROM 3)::int
+            - (c.old_rating IS NOT DISTINCT FROM 3)::int,
+        count_4 = s.count_4 + (c.new_rating IS NOT DISTINCT FROM 4)::int
+            - (c.old_rating IS NOT DISTINCT FROM 4)::int,
+        count_5 = s.count_5 + (c.new_rating IS NOT DISTINCT FROM 5)::int
+            - (c.old_rating IS NOT DISTINCT FROM 5)::int,
+        updated_at = now()
+    FROM changes c
+    WHERE s.stance_id = c.stance_id
+    RETURNING s.stance_id, s.count_1, s.count_2, s.count_3, s.count_4, s.count_5
+),
+-- a missing cell for a changed or removed rating means the rollup predates
+-- it; that is left to the rebuild rather than going negative
+cells_changed AS (
+    UPDATE stance_demographic_stats d SET
+        num_ratings = d.num_ratings - 1 + (c.new_rating IS NOT NULL)::int,
+        rating_sum = d.rating_sum - c.old_rating + coalesce(c.new_rating, 0)
+    FROM changes c
+    WHERE c.old_rating IS NOT NULL AND d.stance_id = c.stance_id
+        AND d.birth_year = :birth_year AND d.gender = :gender AND d.region = :region
+),
+cells_added AS (
+    INSERT INTO stance_demographic_stats (
+        stance_id, birth_year, gender, region, entity_id, num_ratings, rating_sum
+    )
+    SELECT stance_id, :birth_year, :gender, :region, entity_id, 1, new_rating
+    FROM changes WHERE old_rating IS NULL
+    ON CONFLICT (stance_id, birth_year, gender, region) DO UPDATE SET
+        num_ratings = stance_demographic_stats.num_ratings + EXCLUDED.num_ratings,
+        rating_sum = stance_demographic_stats.rating_sum + EXCLUDED.rating_sum
+)
+SELECT
+    i.stance_id,
+    i.entity_id,
+    c.old_rating,
+    -- the rating was inserted by a transaction that committed after this
+    -- statement's snapshot, so its old value was not seen
+    (c.old_rating IS NULL AND c.new_rating IS NOT NULL
+        AND w.inserted IS NOT TRUE) AS raced,
+    (c.stance_id IS NOT NULL AND st.stance_id IS NULL) AS unseeded,
+    (c.stance_id IS NOT NULL) AS changed,
+    coalesce(st.count_1, s0.count_1, 0),
+    coalesce(st.count_2, s0.count_2, 0),
+    coalesce(st.count_3, s0.count_3, 0),
+    coalesce(st.count_4, s0.count_4, 0),
+    coalesce(st.count_5, s0.count_5, 0)
+FROM input i
+LEFT JOIN changes c ON c.stance_id = i.stance_id
+LEFT JOIN written w ON w.stance_id = i.stance_id
+LEFT JOIN stats st ON st.stance_id = i.stance_id
+LEFT JOIN stance_rating_stats s0 ON s0.stance_id = i.stance_id
+"""
+
+# attempts of a rating write that lost a race with a concurrent first rating,
+# or deadlocked with a demographic change moving the same cells
+RATE_ATTEMPTS = 3
+DEADLOCK_DETECTED = "40P01"
+
+
+class ConcurrentRatingError(DatabaseError):
+    pass
+
+
+class RatedStance(NamedTuple):
+    entity_id: int
+    rating_histogram: list[int]
+
+
+def _seed_rating_stats(
+    db: Session, stance_id: int, old_rating: int | None, new_rating: int | None
+) -> list[int]:
+    """
+    Create the histogram of a stance rated for the first time since stats were
+    introduced, from the ratings already written (including this one). If a
+    concurrent writer seeded it first, apply this change on top of theirs.
+    """
+    stats = StanceRatingStats.__table__
+    changes: dict = {
+        f"count_{value}": stats.c[f"count_{value}"]
+        + int(new_rating == value)
+        - int(old_rating == value)
+        for value in RATING_VALUES
+    }
+    seed = insert(stats).from_select(
+        ["stance_id", *(f"count_{value}" for value in RATING_VALUES)],
+        select(
+            literal(stance_id),
+            *(
+                func.count(Rating.id).filter(Rating.rating == value)
+                for value in RATING_VALUES
+            ),
+        ).where(Rating.stance_id == stance_id),
+    )
+    row = db.execute(
+        seed.on_conflict_do_update(
+            index_elements=[stats.c.stance_id],
+            set_={**changes, "updated_at": func.now()},
+        ).returning(*(stats.c[f"count_{value}"] for value in RATING_VALUES))
+    ).one()
+    return list(row)
+
+
+def _apply_ratings(
+    db: Session,
+    user_id: int,
+    ratings: dict[int, int | None],
+    bucket: DemographicBucket,
+) -> dict[int, RatedStance]:
+    rows = db.execute(
+        text(RATE_SQL),
+        {
+            "user_id": user_id,
+            "stance_ids": list(ratings),
+            "ratings": list(ratings.values()),
+            "birth_year": bucket.birth_year,
+            "gender": bucket.gender,
+            "region": bucket.region,
+        },
+    ).all()
+    if any(row.raced for row in rows):
+        raise ConcurrentRatingError("Rating changed concurrently")
+
+    rated: dict[int, RatedStance] = {}
+    for stance_id, entity_id, old_rating, _, unseeded, changed, *histogram in rows:
+        if unseeded:
+            histogram = _seed_rating_stats(
+                db, stance_id, old_rating, ratings[stance_id]
+            )
+        if changed:
+            outbox_db.add_outbox_event(
+                db,
+                outbox_db.RATING_CHANGED,
+                stance_id,
+                {"entity_id": entity_id, "user_id": user_id},
+            )
+        rated[stance_id] = RatedStance(entity_id, histogram)
+    return rated
+
+
+def rate_stances(
+    db: Session, user_id: int, ratings: dict[int, int | None]
+) -> dict[int, RatedStance]:
+    """
+    Set, change or (with None) remove a user's ratings of several stances, and
+    update their rating histograms and demographic rollup and record an outbox
+    event for each change, in one transaction.
+    Returns the entity and new histogram of each stance that exists.
+    """
+    owns_transaction: bool = not in_unit_of_work(db)
+    for attempt in range(RATE_ATTEMPTS):
+        try:
+            with unit_of_work(db):
+                # hold the rater's demographic bucket first, in the same lock
+                # order as demographic updates, which move the user's ratings
+                bucket: DemographicBucket = demographic_stats_db.get_user_bucket(
+                    db, user_id, lock=True
+                )
+                return _apply_ratings(db, user_id, ratings, bucket)
+        except (ConcurrentRatingError, OperationalError) as e:
+            # the next attempt reads the concurrently inserted rating; the
+            # caller's transaction, if any, has to be retried by the caller
+            retryable: bool = isinstance(e, ConcurrentRatingError) or (
+                getattr(e.orig, "pgcode", None) == DEADLOCK_DETECTED
+            )
+            if retryable and owns_transaction and attempt < RATE_ATTEMPTS - 1:
+                continue
+            logging.error(
+                f"Error rating stances {list(ratings)} by user {user_id}: {e}"
+            )
+            raise DatabaseError("Failed to rate stances")
+        except Exception as e:
+            logging.error(
+                f"Error rating stances {list(ratings)} by user {user_id}: {e}"
+            )
+            raise DatabaseError("Failed to rate stances")
+
+
+def rate_stance(
+    db: Session, user_id: int, stance_id: int, rating: int | None
+) -> list[int] | None:
+    """
+    Set, change or (with rating None) remove a user's rating. Returns the
+    stance's new rating histogram, or None if the rating could not be saved.
+    """
     try:
-        if rating is None:
-            existing = read_rating_by_user_and_stance(db, stance_id, user_id)
-            if not existing:
-                return True
-            return delete_rating_by_id(db, existing.id)
-        else:
-            create_or_update_rating(db, stance_id, user_id, rating)
-            return True
+        rated: dict[int, RatedStance] = rate_stances(db, user_id, {stance_id: rating})
+        return rated[stance_id].rating_histogram
     except Exception as e:
         logging.error(f"Error in rate_stance: {e}")
-        return False
+        return None
+
+
+def get_rating_histograms(db: Session, stance_ids: list[int]) -> dict[int, list[int]]:
+    """
+    Return the rating histogram of each stance, as counts of 1 to 5 star
+    ratings, read from stance_rating_stats only.
+    """
+    try:
+        rows = (
+            db.query(
+                StanceRatingStats.stance_id,
+                StanceRatingStats.count_1,
+                StanceRatingStats.count_2,
+                StanceRatingStats.count_3,
+                StanceRatingStats.count_4,
+                StanceRatingStats.count_5,
+            )
+            .filter(StanceRatingStats.stance_id.in_(stance_ids))
+            .all()
+        )
+        histograms: dict[int, list[int]] = {
+            stance_id: [0] * len(RATING_VALUES) for stance_id in stance_ids
+        }
+        for stance_id, *counts in rows:
+            histograms[stance_id] = counts
+        return histograms
+    except Exception as e:
+        logging.error(f"Error getting rating histograms for stances {stance_ids}: {e}")
+        raise DatabaseError("Failed to get rating histograms")
+
+
+def get_rating_histogram(db: Session, stance_id: int) -> list[int]:
+    return get_rating_histograms(db, [stance_id])[stance_id]
+
+
+def summarize_histogram(histogram: list[int]) -> tuple[int, float | None]:
+    """Return (number of ratings, average rating) of a histogram."""
+    num_ratings: int = sum(histogram)
+    if not num_ratings:
+        return 0, None
+    rating_sum: int = sum(
+        value * count for value, count in zip(RATING_VALUES, histogram)
+    )
+    return num_ratings, rating_sum / num_ratings
 
 
 def get_num_ratings_for_stance(db: Session, stance_id: int) -> int:
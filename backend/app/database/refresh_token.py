@@ -1,5 +1,7 @@
 from sqlalchemy.orm import Session
+from sqlalchemy import delete, func, or_, select
 from app.database.models import User, RefreshToken
+from app.database.unit_of_work import commit_or_flush
 from app.errors import DatabaseError
 import logging
 
@@ -15,8 +17,7 @@ def create_refresh_token(
             revoked=revoked,
         )
         db.add(token)
-        db.commit()
-        db.refresh(token)
+        commit_or_flush(db, token)
         return token
     except Exception as e:
         logging.error(f"Error creating refresh token for user {user_id}: {e}")
@@ -32,10 +33,11 @@ def get_refresh_token(db: Session, token_id: int) -> RefreshToken | None:
 
 
 def get_refresh_token_by_hash(db: Session, hashed_token: str) -> RefreshToken | None:
+    """Return the unrevoked token with the hash; expiry is left to the caller."""
     try:
         return (
             db.query(RefreshToken)
-            .filter(RefreshToken.hashed_token == hashed_token)
+            .filter(RefreshToken.hashed_token == hashed_token, ~RefreshToken.revoked)
             .first()
         )
     except Exception as e:
@@ -62,8 +64,7 @@ def update_refresh_token(db: Session, token_id: int, **kwargs) -> RefreshToken |
         for key, value in kwargs.items():
             if hasattr(token, key):
                 setattr(token, key, value)
-        db.commit()
-        db.refresh(token)
+        commit_or_flush(db, token)
         return token
     except Exception as e:
         logging.error(f"Error updating refresh token {token_id}: {e}")
@@ -75,9 +76,32 @@ def delete_refresh_token(db: Session, token_id: int) -> bool:
         token = db.query(RefreshToken).filter(RefreshToken.id == token_id).first()
         if token:
             db.delete(token)
-            db.commit()
+            commit_or_flush(db)
             return True
     except Exception as e:
         logging.error(f"Error deleting refresh token {token_id}: {e}")
         raise DatabaseError("Failed to delete refresh token")
     return False
+
+
+def delete_stale_refresh_tokens(db: Session, batch_size: int) -> int:
+    """
+    Delete up to batch_size expired or revoked tokens and commit. Rows locked by
+    a concurrent compaction or refresh are skipped. Returns the number deleted.
+    """
+    try:
+        stale = (
+            select(RefreshToken.id)
+            .where(or_(RefreshToken.revoked, RefreshToken.expires_at <= func.now()))
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        result = db.execute(
+            delete(RefreshToken).where(RefreshToken.id.in_(stale.scalar_subquery()))
+        )
+        db.commit()
+        return result.rowcount
+    except Exception as e:
+        db.rollback()
+        logging.error(f"Error deleting stale refresh tokens: {e}")
+        raise DatabaseError("Failed to delete stale refresh tokens")
@@ -0,0 +1,170 @@
+from sqlalchemy.orm import Session, Query, load_only
+from sqlalchemy import func, exists, cast, Float
+from app.database.models import *
+from app.errors import DatabaseError
+import logging
+import os
+
+SEARCH_CONFIG = "english"
+SNIPPET_OPTIONS = "MaxWords=30, MinWords=10, MaxFragments=2"
+# matches ranked per search; the newest are kept when a term matches more,
+# and the results are flagged as truncated
+SEARCH_MAX_CANDIDATES = int(os.getenv("SEARCH_MAX_CANDIDATES", "1000"))
+
+
+def _ts_query(query: str):
+    # websearch syntax: quoted phrases, "or" and -exclusions
+    return func.websearch_to_tsquery(SEARCH_CONFIG, query)
+
+
+def _rank(search_vector, ts_query):
+    # ts_rank returns a real; as a double it round-trips exactly through the cursor
+    return cast(func.ts_rank(search_vector, ts_query), Float)
+
+
+def _filter_entities(
+    query: Query, entity_type: int | None, tag_id: int | None
+) -> Query:
+    if entity_type is not None:
+        query = query.filter(Entity.type == entity_type)
+    if tag_id is not None:
+        query = query.filter(
+            exists().where(EntityTag.entity_id == Entity.id, EntityTag.tag_id == tag_id)
+        )
+    return query
+
+
+def _candidates(query: Query, id_column):
+    """
+    The ids of the newest SEARCH_MAX_CANDIDATES matches. ts_rank reads each
+    row's whole tsvector, so ranking every match of a common term would not
+    fit in a request; the GIN index finds the matches without reading them.
+    The cap keeps the candidate set the same from page to page.
+    """
+    return query.order_by(id_column.desc()).limit(SEARCH_MAX_CANDIDATES).subquery()
+
+
+def _truncated(query: Query):
+    """Whether there are matches beyond the candidates, evaluated once per query."""
+    return query.offset(SEARCH_MAX_CANDIDATES).limit(1).exists()
+
+
+def _split_truncated(rows: list) -> tuple[list[tuple], bool]:
+    return [tuple(row[:-1]) for row in rows], bool(rows) and rows[0][-1]
+
+
+def _paginate(
+    query: Query,
+    rank,
+    id_column,
+    cursor_rank: float | None,
+    cursor_id: int | None,
+    limit: int,
+) -> Query:
+    if cursor_rank is not None and cursor_id is not None:
+        query = query.filter(
+            (rank < cursor_rank) | ((rank == cursor_rank) & (id_column < cursor_id))
+        )
+    # fetch one extra to check for next cursor
+    return query.order_by(rank.desc(), id_column.desc()).limit(limit + 1)
+
+
+def search_entities(
+    db: Session,
+    query: str,
+    entity_type: int | None,
+    tag_id: int | None,
+    cursor_rank: float | None,
+    cursor_id: int | None,
+    limit: int,
+) -> tuple[list[tuple[Entity, float]], bool]:
+    """
+    Entities whose title or description match, best match first among the
+    newest SEARCH_MAX_CANDIDATES matches, and whether there were more matches.
+    """
+    try:
+        ts_query = _ts_query(query)
+        matches: Query = _filter_entities(
+            db.query(Entity.id).filter(Entity.search_vector.op("@@")(ts_query)),
+            entity_type,
+            tag_id,
+        )
+        candidates = _candidates(matches, Entity.id)
+        rank = _rank(Entity.search_vector, ts_query)
+        q = (
+            db.query(Entity, rank, _truncated(matches))
+            .join(candidates, candidates.c.id == Entity.id)
+            .options(
+                load_only(
+                    Entity.id,
+                    Entity.type,
+                    Entity.title,
+                    Entity.images_json,
+                    Entity.description,
+                    Entity.start_time,
+                    Entity.end_time,
+                )
+            )
+        )
+        return _split_truncated(
+            _paginate(q, rank, Entity.id, cursor_rank, cursor_id, limit).all()
+        )
+    except Exception as e:
+        logging.error(f"Error searching entities for {query!r}: {e}")
+        raise DatabaseError("Failed to search entities")
+
+
+def search_stances(
+    db: Session,
+    query: str,
+    entity_type: int | None,
+    tag_id: int | None,
+    cursor_rank: float | None,
+    cursor_id: int | None,
+    limit: int,
+) -> tuple[list[tuple[Stance, Entity, float, str]], bool]:
+    """
+    Stances whose headline or text match, best match first among the newest
+    SEARCH_MAX_CANDIDATES matches, with their entity and a highlighted snippet
+    of the matching text; and whether there were more matches.
+    """
+    try:
+        ts_query = _ts_query(query)
+        matches: Query = _filter_entities(
+            db.query(Stance.id)
+            .join(Entity, Entity.id == Stance.entity_id)
+            .filter(Stance.search_vector.op("@@")(ts_query)),
+            entity_type,
+            tag_id,
+        )
+        candidates = _candidates(matches, Stance.id)
+        rank = _rank(Stance.search_vector, ts_query)
+        # only computed for the returned page, after the sort and limit
+        snippet = func.ts_headline(
+            SEARCH_CONFIG,
+            func.coalesce(Stance.content_text, ""),
+            ts_query,
+            SNIPPET_OPTIONS,
+        )
+        # results show neither the document nor the entity's details
+        q = (
+            db.query(Stance, Entity, rank, snippet, _truncated(matches))
+            .join(candidates, candidates.c.id == Stance.id)
+            .join(Entity, Entity.id == Stance.entity_id)
+            .options(
+                load_only(
+                    Stance.id,
+                    Stance.user_id,
+                    Stance.entity_id,
+                    Stance.headline,
+                    Stance.created_at,
+                ),
+                load_only(Entity.id, Entity.type, Entity.title),
+            )
+        )
+        return _split_truncated(
+            _paginate(q, rank, Stance.id, cursor_rank, cursor_id, limit).all()
+        )
+    except Exception as e:
+        logging.error(f"Error searching stances for {query!r}: {e}")
+        raise DatabaseError("Failed to search stances")
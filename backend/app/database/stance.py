@@ -1,13 +1,40 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy.orm import Session, defer, load_only
+from sqlalchemy import Float, cast, func, literal, select, update
 from app.database.models import *
+from app.database.unit_of_work import commit_or_flush
+from app.database import outbox as outbox_db
 from app.errors import DatabaseError
 import logging
 import datetime
 
+# small columns list queries always load, for joins, ordering and cursors
+STANCE_KEY_COLUMNS = (
+    Stance.id,
+    Stance.user_id,
+    Stance.entity_id,
+    Stance.engagement_score,
+    Stance.created_at,
+)
+# the other columns, by the list item field that reads them
+STANCE_FIELD_COLUMNS: dict[str, tuple] = {
+    "headline": (Stance.headline,),
+    "content_json": (Stance.content_json,),
+    "excerpt": (Stance.excerpt,),
+    "word_count": (Stance.word_count,),
+    "preview_image_url": (Stance.preview_image_url,),
+}
+
 
 def create_stance(
-    db: Session, user_id: int, entity_id: int, headline: str, content_json: str
+    db: Session,
+    user_id: int,
+    entity_id: int,
+    headline: str,
+    content_json: str,
+    content_text: str | None = None,
+    excerpt: str | None = None,
+    word_count: int | None = None,
+    preview_image_url: str | None = None,
 ) -> Stance:
     try:
         stance_obj = Stance(
@@ -15,10 +42,20 @@ def create_stance(
             entity_id=entity_id,
             headline=headline,
             content_json=content_json,
+            content_text=content_text,
+            excerpt=excerpt,
+            word_count=word_count,
+            preview_image_url=preview_image_url,
         )
         db.add(stance_obj)
-        db.commit()
-        db.refresh(stance_obj)
+        db.flush()
+        outbox_db.add_outbox_event(
+            db,
+            outbox_db.STANCE_CREATED,
+            stance_obj.id,
+            {"entity_id": entity_id, "user_id": user_id},
+        )
+        commit_or_flush(db, stance_obj)
         return stance_obj
     except Exception as e:
         logging.error(f"Error creating stance: {e}")
@@ -34,7 +71,15 @@ def read_stance(db: Session, stance_id: int) -> Stance | None:
 
 
 def update_stance(db: Session, stance_id: int, **kwargs) -> Stance | None:
-    ALLOWED_FIELDS = {"headline", "content_json", "entity_id"}
+    ALLOWED_FIELDS = {
+        "headline",
+        "content_json",
+        "content_text",
+        "excerpt",
+        "word_count",
+        "preview_image_url",
+        "entity_id",
+    }
     try:
         stance_obj = db.query(Stance).filter(Stance.id == stance_id).first()
         if not stance_obj:
@@ -42,8 +87,13 @@ def update_stance(db: Session, stance_id: int, **kwargs) -> Stance | None:
         for key, value in kwargs.items():
             if hasattr(stance_obj, key) and key in ALLOWED_FIELDS:
                 setattr(stance_obj, key, value)
-        db.commit()
-        db.refresh(stance_obj)
+        outbox_db.add_outbox_event(
+            db,
+            outbox_db.STANCE_UPDATED,
+            stance_id,
+            {"entity_id": stance_obj.entity_id},
+        )
+        commit_or_flush(db, stance_obj)
         return stance_obj
     except Exception as e:
         logging.error(f"Error updating stance {stance_id}: {e}")
@@ -55,7 +105,13 @@ def delete_stance(db: Session, stance_id: int) -> bool:
         stance_obj = db.query(Stance).filter(Stance.id == stance_id).first()
         if stance_obj:
             db.delete(stance_obj)
-            db.commit()
+            outbox_db.add_outbox_event(
+                db,
+                outbox_db.STANCE_DELETED,
+                stance_id,
+                {"entity_id": stance_obj.entity_id, "user_id": stance_obj.user_id},
+            )
+            commit_or_flush(db)
             return True
     except Exception as e:
         logging.error(f"Error deleting stance {stance_id}: {e}")
@@ -63,6 +119,58 @@ def delete_stance(db: Session, stance_id: int) -> bool:
     return False
 
 
+def refresh_engagement_scores(db: Session, stance_ids: list[int]) -> None:
+    """
+    Recompute the feed ranking score of stances from their rating histograms:
+    the log of the number of ratings, weighted by the average rating out of 5.
+    """
+    try:
+        stats = StanceRatingStats
+        num_ratings = (
+            stats.count_1
+            + stats.count_2
+            + stats.count_3
+            + stats.count_4
+            + stats.count_5
+        )
+        rating_sum = (
+            stats.count_1
+            + 2 * stats.count_2
+            + 3 * stats.count_3
+            + 4 * stats.count_4
+            + 5 * stats.count_5
+        )
+        score = (
+            select(
+                func.ln(1 + num_ratings)
+                * cast(rating_sum, Float)
+                / (5 * func.greatest(num_ratings, 1))
+            )
+            .where(StanceRatingStats.stance_id == Stance.id)
+            .scalar_subquery()
+        )
+        # lock in id order, as rating writes do, so the two cannot deadlock
+        db.execute(
+            select(Stance.id)
+            .where(Stance.id.in_(stance_ids))
+            .order_by(Stance.id)
+            .with_for_update(key_share=True)
+        )
+        db.execute(
+            update(Stance)
+            .where(Stance.id.in_(stance_ids))
+            # a score change is not an edit of the stance
+            .values(
+                engagement_score=func.coalesce(score, 0.0), updated_at=Stance.updated_at
+            )
+            .execution_options(synchronize_session=False)
+        )
+        commit_or_flush(db)
+    except Exception as e:
+        logging.error(f"Error refreshing engagement scores of {stance_ids}: {e}")
+        raise DatabaseError("Failed to refresh engagement scores")
+
+
 def get_all_stances(db: Session) -> list[Stance]:
     try:
         return db.query(Stance).all()
@@ -104,6 +212,38 @@ def get_n_stances_by_entity(db: Session, entity_id: int, n: int) -> list[Stance]
         raise DatabaseError("Failed to get n stances by entity")
 
 
+def get_n_stances_by_entities(
+    db: Session, entity_ids: list[int], n: int
+) -> dict[int, list[Stance]]:
+    """Return up to n stances of each entity in one query, with only their headlines."""
+    try:
+        position = (
+            func.row_number()
+            .over(partition_by=Stance.entity_id, order_by=Stance.id)
+            .label("position")
+        )
+        ranked = (
+            db.query(Stance.id, position)
+            .filter(Stance.entity_id.in_(entity_ids))
+            .subquery()
+        )
+        rows = (
+            db.query(Stance)
+            .options(load_only(Stance.id, Stance.entity_id, Stance.headline))
+            .join(ranked, ranked.c.id == Stance.id)
+            .filter(ranked.c.position <= n)
+            .order_by(Stance.entity_id, Stance.id)
+            .all()
+        )
+        stances: dict[int, list[Stance]] = {entity_id: [] for entity_id in entity_ids}
+        for stance in rows:
+            stances[stance.entity_id].append(stance)
+        return stances
+    except Exception as e:
+        logging.error(f"Error getting {n} stances for entities {entity_ids}: {e}")
+        raise DatabaseError("Failed to get n stances by entities")
+
+
 def get_user_stance_by_entity(
     db: Session, entity_id: int, user_id: int
 ) -> Stance | None:
@@ -121,9 +261,33 @@ def get_user_stance_by_entity(
         raise DatabaseError("Failed to get user stance by entity")
 
 
-def get_random_stances(db: Session, n: int) -> list[Stance]:
+def _query_stances(db: Session, preview: bool, columns: list | None = None):
+    query = db.query(Stance)
+    if columns is not None:
+        if preview:
+            columns = [
+                column for column in columns if column is not Stance.content_json
+            ]
+        # load only the requested columns; raise rather than lazy-load the rest
+        query = query.options(load_only(*STANCE_KEY_COLUMNS, *columns, raiseload=True))
+    elif preview:
+        # previews show the excerpt; raise rather than lazy-load the document
+        query = query.options(defer(Stance.content_json, raiseload=True))
+    return query
+
+
+def get_random_stances(
+    db: Session,
+    n: int,
+    preview: bool = False,
+    columns: list | None = None,
+    entity_ids: list[int] | None = None,
+) -> list[Stance]:
     try:
-        return db.query(Stance).order_by(func.random()).limit(n).all()
+        query = _query_stances(db, preview, columns)
+        if entity_ids is not None:
+            query = query.filter(Stance.entity_id.in_(entity_ids))
+        return query.order_by(func.random()).limit(n).all()
     except Exception as e:
         logging.error(f"Error getting {n} random stances: {e}")
         raise DatabaseError("Failed to get n random stances")
@@ -147,16 +311,56 @@ def get_random_stances_by_entities(
         raise DatabaseError("Failed to get n random stances by entities")
 
 
+def read_stances(
+    db: Session,
+    stance_ids: list[int],
+    preview: bool = False,
+    columns: list | None = None,
+) -> list[Stance]:
+    """Return the stances that exist, in the order of stance_ids."""
+    try:
+        stances: dict[int, Stance] = {
+            stance.id: stance
+            for stance in _query_stances(db, preview, columns)
+            .filter(Stance.id.in_(stance_ids))
+            .all()
+        }
+        return [stances[stance_id] for stance_id in stance_ids if stance_id in stances]
+    except Exception as e:
+        logging.error(f"Error reading stances {stance_ids}: {e}")
+        raise DatabaseError("Failed to read stances")
+
+
+def get_feed_candidates_by_entities(
+    db: Session, entity_ids: list[int], limit: int
+) -> list[tuple[int, int, float]]:
+    """The id, entity and engagement score of up to limit stances of the entities."""
+    try:
+        return [
+            tuple(row)
+            for row in db.query(Stance.id, Stance.entity_id, Stance.engagement_score)
+            .filter(Stance.entity_id.in_(entity_ids))
+            .order_by(Stance.engagement_score.desc(), Stance.id.desc())
+            .limit(limit)
+            .all()
+        ]
+    except Exception as e:
+        logging.error(f"Error getting feed candidates of entities {entity_ids}: {e}")
+        raise DatabaseError("Failed to get feed candidates by entities")
+
+
 def get_entity_stances(
     db: Session,
     entity_ids: list[int],
     cursor_score: float | None,
     cursor_id: int | None,
     limit: int | None,
+    preview: bool = False,
+    columns: list | None = None,
 ) -> list[Stance]:
     try:
         query = (
-            db.query(Stance)
+            _query_stances(db, preview, columns)
             .filter(Stance.entity_id.in_(entity_ids))
             .order_by(Stance.engagement_score.desc(), Stance.id.desc())
         )
@@ -174,11 +378,16 @@ def get_entity_stances(
 
 
 def get_user_stances(
-    db: Session, user_id: int, cursor: str | None, limit: int | None
+    db: Session,
+    user_id: int,
+    cursor: str | None,
+    limit: int | None,
+    preview: bool = False,
+    columns: list | None = None,
 ) -> list[Stance]:
     try:
         query = (
-            db.query(Stance)
+            _query_stances(db, preview, columns)
             .filter(Stance.user_id == user_id)
             .order_by(Stance.created_at.desc(), Stance.id.desc())
         )
@@ -194,11 +403,16 @@ def get_user_stances(
 
 
 def get_stance_feed_for_user(
-    db: Session, user_id: int, cursor: datetime.datetime | None, limit: int
+    db: Session,
+    user_id: int,
+    cursor: datetime.datetime | None,
+    limit: int,
+    preview: bool = False,
+    columns: list | None = None,
 ) -> list[Stance]:
     try:
         query = (
-            db.query(Stance)
+            _query_stances(db, preview, columns)
             .join(User)
             .join(Follow, Follow.followed_id == Stance.user_id)
             .filter(Follow.follower_id == user_id)
@@ -213,3 +427,44 @@ def get_stance_feed_for_user(
     except Exception as e:
         logging.error(f"Error getting stance feed for user {user_id}: {e}")
         raise DatabaseError("Failed to get stance feed for user")
+
+
+def get_stance_page_version(db: Session, stance_id: int, user_id: int | None) -> tuple:
+    """
+    Fetch everything that determines a stance page in one query: the update
+    times of the stance, its entity, author and author profile, the five
+    rating histogram counts, and the viewer's own rating.
+    """
+    try:
+        my_rating = (
+            db.query(Rating.rating)
+            .filter(Rating.stance_id == stance_id, Rating.user_id == user_id)
+            .scalar_subquery()
+            if user_id
+            else literal(None)
+        )
+        return (
+            db.query(
+                Stance.updated_at,
+                Entity.updated_at,
+                User.updated_at,
+                Profile.updated_at,
+                StanceRatingStats.count_1,
+                StanceRatingStats.count_2,
+                StanceRatingStats.count_3,
+                StanceRatingStats.count_4,
+                StanceRatingStats.count_5,
+                my_rating,
+            )
+            .select_from(Stance)
+            .join(Entity, Entity.id == Stance.entity_id)
+            .join(User, User.id == Stance.user_id)
+            .outerjoin(Profile, Profile.user_id == User.id)
+            .outerjoin(StanceRatingStats, StanceRatingStats.stance_id == Stance.id)
+            .filter(Stance.id == stance_id)
+            .one()
+            ._tuple()
+        )
+    except Exception as e:
+        logging.error(f"Error getting page version for stance {stance_id}: {e}")
+        raise DatabaseError("Failed to get stance page version")
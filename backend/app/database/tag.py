@@ -1,13 +1,13 @@
 from sqlalchemy.orm import Session
 from app.database.models import Tag, TagType
+from app.database.unit_of_work import commit_or_flush
 from app.database.connect import SessionLocal
 
 
 def create_tag(db: Session, name: str, tag_type: int) -> Tag:
     tag = Tag(name=name, tag_type=tag_type)
     db.add(tag)
-    db.commit()
-    db.refresh(tag)
+    commit_or_flush(db, tag)
     return tag
 
 
@@ -27,8 +27,7 @@ def update_tag(db: Session, tag_id: int, name: str = None, tag_type: int = None)
         tag.name = name
     if tag_type is not None:
         tag.tag_type = tag_type
-    db.commit()
-    db.refresh(tag)
+    commit_or_flush(db, tag)
     return tag
 
 
@@ -37,7 +36,7 @@ def delete_tag(db: Session, tag_id: int) -> bool:
     if not tag:
         return False
     db.delete(tag)
-    db.commit()
+    commit_or_flush(db)
     return True
 
 
@@ -0,0 +1,48 @@
+from contextlib import contextmanager
+from typing import Iterator
+from sqlalchemy.orm import Session
+
+UNIT_OF_WORK_KEY = "unit_of_work"
+
+
+def in_unit_of_work(db: Session) -> bool:
+    return db.info.get(UNIT_OF_WORK_KEY, False)
+
+
+def commit_or_flush(db: Session, *instances) -> None:
+    """
+    Commit and refresh the given instances, or only flush them when a unit of
+    work is open on the session so that the unit commits once at the end.
+    """
+    if in_unit_of_work(db):
+        db.flush()
+        return
+    db.commit()
+    for instance in instances:
+        db.refresh(instance)
+
+
+@contextmanager
+def unit_of_work(db: Session) -> Iterator[Session]:
+    """
+    Group every CRUD call made inside the block into one transaction that is
+    committed on exit and rolled back on error. Nested blocks join the outer one.
+    """
+    if in_unit_of_work(db):
+        yield db
+        return
+
+    db.info[UNIT_OF_WORK_KEY] = True
+    # flushed instances already hold their generated values, so keep them loaded
+    # instead of re-selecting every one of them after the commit
+    expire_on_commit: bool = db.expire_on_commit
+    db.expire_on_commit = False
+    try:
+        yield db
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.expire_on_commit = expire_on_commit
+        db.info.pop(UNIT_OF_WORK_KEY, None)
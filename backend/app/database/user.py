@@ -1,6 +1,11 @@
 from sqlalchemy.orm import Session
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
 from app.database.models import User
-from app.errors import DatabaseError
+from app.database.unit_of_work import commit_or_flush
+from app.errors import DatabaseError, UniqueViolationError
+from typing import Iterator
+from datetime import datetime
 import logging
 
 
@@ -21,9 +26,12 @@ def create_user(
             is_admin=is_admin,
         )
         db.add(user)
-        db.commit()
-        db.refresh(user)
+        commit_or_flush(db, user)
         return user
+    except IntegrityError as e:
+        db.rollback()
+        logging.warning(f"Username or email already exists: {e.orig}")
+        raise UniqueViolationError("Username or email already exists")
     except Exception as e:
         logging.error(f"Error creating user: {e}")
         raise DatabaseError("Failed to create user")
@@ -37,6 +45,15 @@ def read_user(db: Session, user_id: int) -> User | None:
         raise DatabaseError("Failed to read user")
 
 
+def read_users(db: Session, user_ids: list[int]) -> dict[int, User]:
+    try:
+        users = db.query(User).filter(User.id.in_(user_ids)).all()
+        return {user.id: user for user in users}
+    except Exception as e:
+        logging.error(f"Error reading users {user_ids}: {e}")
+        raise DatabaseError("Failed to read users")
+
+
 def update_user(
     db: Session,
     user_id: int,
@@ -54,9 +71,12 @@ def update_user(
             user.full_name = full_name
         if email is not None:
             user.email = email
-        db.commit()
-        db.refresh(user)
+        commit_or_flush(db, user)
         return user
+    except IntegrityError as e:
+        db.rollback()
+        logging.warning(f"Username or email already exists: {e.orig}")
+        raise UniqueViolationError("Username or email already exists")
     except Exception as e:
         logging.error(f"Error updating user {user_id}: {e}")
         raise DatabaseError("Failed to update user")
@@ -70,8 +90,7 @@ def update_user_password(
         if not user:
             return None
         user.password_hash = new_password_hash
-        db.commit()
-        db.refresh(user)
+        commit_or_flush(db, user)
         return user
     except Exception as e:
         logging.error(f"Error updating password for user {user_id}: {e}")
@@ -83,7 +102,7 @@ def delete_user(db: Session, user_id: int) -> bool:
         user = db.query(User).filter(User.id == user_id).first()
         if user:
             db.delete(user)
-            db.commit()
+            commit_or_flush(db)
             return True
     except Exception as e:
         logging.error(f"Error deleting user {user_id}: {e}")
@@ -93,7 +112,10 @@ def delete_user(db: Session, user_id: int) -> bool:
 
 def get_user_by_username(db: Session, username: str) -> User | None:
     try:
-        return db.query(User).filter(User.username == username).first()
+        # usernames are unique regardless of case, like the availability check
+        return (
+            db.query(User).filter(func.lower(User.username) == username.lower()).first()
+        )
     except Exception as e:
         logging.error(f"Error getting user by username {username}: {e}")
         raise DatabaseError("Failed to get user by username")
@@ -101,7 +123,7 @@ def get_user_by_username(db: Session, username: str) -> User | None:
 
 def get_user_by_email(db: Session, email: str) -> User | None:
     try:
-        return db.query(User).filter(User.email == email).first()
+        return db.query(User).filter(func.lower(User.email) == email.lower()).first()
     except Exception as e:
         logging.error(f"Error getting user by email {email}: {e}")
         raise DatabaseError("Failed to get user by email")
@@ -118,7 +140,45 @@ def is_user_admin(db: Session, user_id: int) -> bool:
 
 def is_username_taken(db: Session, username: str) -> bool:
     try:
-        return db.query(User).filter(User.username == username).count() > 0
+        return (
+            db.query(User.id)
+            .filter(func.lower(User.username) == username.lower())
+            .first()
+            is not None
+        )
     except Exception as e:
         logging.error(f"Error checking if username {username} is taken: {e}")
         raise DatabaseError("Failed to check if username is taken")
+
+
+def is_email_taken(db: Session, email: str) -> bool:
+    try:
+        return (
+            db.query(User.id).filter(func.lower(User.email) == email.lower()).first()
+            is not None
+        )
+    except Exception as e:
+        logging.error(f"Error checking if email {email} is taken: {e}")
+        raise DatabaseError("Failed to check if email is taken")
+
+
+def count_users(db: Session) -> int:
+    try:
+        return db.query(func.count(User.id)).scalar()
+    except Exception as e:
+        logging.error(f"Error counting users: {e}")
+        raise DatabaseError("Failed to count users")
+
+
+def iter_usernames_and_emails(
+    db: Session, updated_since: datetime | None = None
+) -> Iterator[tuple[str, str]]:
+    """Stream the lowercased username and email of every (recently updated) user."""
+    try:
+        query = db.query(func.lower(User.username), func.lower(User.email))
+        if updated_since is not None:
+            query = query.filter(User.updated_at >= updated_since)
+        yield from query.yield_per(10000)
+    except Exception as e:
+        logging.error(f"Error streaming usernames and emails: {e}")
+        raise DatabaseError("Failed to stream usernames and emails")
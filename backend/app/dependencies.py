@@ -1,12 +1,40 @@
-from app.database.connect import SessionLocal
+from app.database.connect import SessionLocal, ReplicaSessionLocal
 from sqlalchemy.orm import Session
-from fastapi import Depends, HTTPException, status, Request, status
+from fastapi import Depends, HTTPException, status, Request, Response, Query, status
 from fastapi.security import OAuth2PasswordBearer
+from pydantic import BaseModel
 from app.service.auth import verify_access_token, is_admin_token
+from app.service.fieldsets import parse_fields
+from app.service.replica import (
+    READ_PRIMARY_COOKIE,
+    REPLICA_READ_YOUR_WRITES_SECONDS,
+    SAFE_METHODS,
+    should_read_from_replica,
+)
+import math
+import time
 
 
-def get_db():
-    db = SessionLocal()
+def get_db(request: Request, response: Response):
+    """
+    Open a session for the request. Safe requests are served by the replica
+    when there is one, unless it lags or the client wrote within the last few
+    seconds; a cookie set on every write keeps that client on the primary.
+    """
+    if ReplicaSessionLocal is not None and should_read_from_replica(
+        request.method, request.cookies.get(READ_PRIMARY_COOKIE)
+    ):
+        db = ReplicaSessionLocal()
+    else:
+        db = SessionLocal()
+        if ReplicaSessionLocal is not None and request.method not in SAFE_METHODS:
+            response.set_cookie(
+                READ_PRIMARY_COOKIE,
+                str(time.time() + REPLICA_READ_YOUR_WRITES_SECONDS),
+                max_age=math.ceil(REPLICA_READ_YOUR_WRITES_SECONDS),
+                httponly=True,
+                samesite="lax",
+            )
     try:
         yield db
     finally:
@@ -41,3 +69,24 @@ def get_is_admin(
     token: str = Depends(OAuth2PasswordBearer(tokenUrl="/auth/token")),
 ) -> bool:
     return is_admin_token(token)
+
+
+def get_fields(item_model: type[BaseModel]):
+    """
+    Dependency parsing the fields= parameter of a list endpoint against the
+    fields of its items. Resolves to None when the parameter is absent.
+    """
+
+    def fields_dependency(
+        fields: str | None = Query(
+            None,
+            description="comma separated item fields to return, "
+            f"from: {', '.join(item_model.model_fields)}",
+        ),
+    ) -> set[str] | None:
+        try:
+            return parse_fields(fields, item_model.model_fields)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    return fields_dependency
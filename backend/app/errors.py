@@ -8,3 +8,9 @@ class DatabaseError(DefaultError):
     """An error type for database-related issues."""
 
     pass
+
+
+class UniqueViolationError(DatabaseError):
+    """An error type for writes that conflict with a unique constraint."""
+
+    pass
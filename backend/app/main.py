@@ -4,18 +4,132 @@ load_dotenv()
 
 from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
 from app.dependencies import get_db
+import asyncio
 import logging
+import re
 from app.api.auth import router as auth_router
 from app.api.entities import router as entities_router
 from app.api.stances import stance_router, user_stances_router, entity_stances_router
 from app.api.images import router as images_router
 from app.api.users import router as users_router
+from app.api.search import router as search_router
+from app.api.tags import router as tags_router
+from app.api.metrics import router as metrics_router
+from app.middleware.response_cache import ResponseCacheMiddleware, CacheRule
+from app.middleware.rate_limit import RateLimitMiddleware, RateLimitRule
+from app.middleware.admission import AdmissionControlMiddleware
+from app.middleware.metrics import MetricsMiddleware
+from app.middleware.log_context import LogContextMiddleware
+from app.middleware.compression import CompressionMiddleware
+from app.service.response_cache import response_cache
+from app.service.rate_limit import rate_limiter
+from app.database.connect import engine
+from app.service.token_compaction import run_refresh_token_compaction
+from app.service.availability import run_availability_refresh
+from app.service.replica import run_replica_lag_monitor
+from app.service.log import configure_logging
+from app.service.rating_events import rating_broker
 
-logging.basicConfig(level=logging.INFO)
+# JSON lines written off the request threads; page views are sampled
+configure_logging(
+    sample_rates={
+        "GET /users/{user_id}/profile_page": 0.01,
+        "GET /users/{user_id}/profile": 0.01,
+        "GET /users/{user_id}/demographics": 0.01,
+    }
+)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(dependencies=[Depends(get_db)])
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    compaction = asyncio.create_task(run_refresh_token_compaction())
+    replica_monitor = asyncio.create_task(run_replica_lag_monitor())
+    availability_refresh = asyncio.create_task(run_availability_refresh())
+    rating_broker.start()
+    yield
+    rating_broker.stop()
+    compaction.cancel()
+    replica_monitor.cancel()
+    availability_refresh.cancel()
+
+
+app = FastAPI(dependencies=[Depends(get_db)], lifespan=lifespan)
+
+# shed load before it queues; added before the cache so cache hits are still served
+app.add_middleware(
+    AdmissionControlMiddleware,
+    engine=engine,
+    streams=re.compile(r"/ratings/stream$"),
+)
+
+# anonymous reads of public pages are identical for everyone; added before CORS
+# so that CORS headers are applied per request rather than cached
+app.add_middleware(
+    ResponseCacheMiddleware,
+    backend=response_cache,
+    rules=[
+        CacheRule(re.compile(r"^/entities/$")),
+        CacheRule(re.compile(r"^/entities/\d+$")),
+        CacheRule(re.compile(r"^/entities/\d+/stances/$")),
+        CacheRule(re.compile(r"^/entities/\d+/stances/\d+$")),
+        CacheRule(re.compile(r"^/entities/\d+/stances/\d+/page$")),
+        CacheRule(re.compile(r"^/entities/\d+(/stances/\d+)?/demographics$")),
+        CacheRule(re.compile(r"^/search/(entities|stances)$")),
+        CacheRule(re.compile(r"^/tags/\d+/entities$")),
+    ],
+)
+
+# bcrypt endpoints per address, expensive reads per user; added before CORS so
+# that 429 responses carry CORS headers
+app.add_middleware(
+    RateLimitMiddleware,
+    backend=rate_limiter,
+    rules=[
+        RateLimitRule(
+            "login",
+            re.compile(r"^/auth/(login|token)$"),
+            rate=10 / 60,
+            burst=10,
+            methods={"POST"},
+        ),
+        RateLimitRule(
+            "signup",
+            re.compile(r"^/auth/signup$"),
+            rate=20 / 3600,
+            burst=20,
+            methods={"POST"},
+        ),
+        RateLimitRule(
+            "refresh",
+            re.compile(r"^/auth/refresh$"),
+            rate=1,
+            burst=30,
+            methods={"POST"},
+        ),
+        RateLimitRule(
+            "feed",
+            re.compile(r"^/stances/(feed|following-feed)$"),
+            rate=1,
+            burst=10,
+            per="user",
+        ),
+        RateLimitRule("search", re.compile(r"^/search/"), rate=2, burst=20, per="user"),
+        RateLimitRule(
+            "batch-rating",
+            re.compile(r"^/stances/ratings$"),
+            rate=2,
+            burst=20,
+            per="user",
+            methods={"POST"},
+        ),
+    ],
+)
+
+# outside the cache, whose hits arrive precompressed and pass through
+app.add_middleware(CompressionMiddleware)
 
 origins = [
     "http://localhost:3000",
@@ -29,6 +143,12 @@ app.add_middleware(
     allow_headers=["*"],  # Allow all headers
 )
 
+# outermost, so that every response is timed, including those from the cache,
+# the rate limiter and admission control
+app.add_middleware(MetricsMiddleware, routes=app.routes, exclude={"/metrics"})
+# lets log records find their request, including those logged by the middleware
+app.add_middleware(LogContextMiddleware)
+
 app.include_router(entities_router.router)
 app.include_router(stance_router.router)
 app.include_router(user_stances_router.router)
@@ -36,3 +156,6 @@ app.include_router(entity_stances_router.router)
 app.include_router(users_router.router)
 app.include_router(auth_router.router)
 app.include_router(images_router.router)
+app.include_router(search_router.router)
+app.include_router(tags_router.router)
+app.include_router(metrics_router.router)
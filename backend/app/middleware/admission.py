@@ -0,0 +1,74 @@
+import logging
+import os
+import re
+
+import anyio.to_thread
+from sqlalchemy.engine import Engine
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.middleware.rate_limit import send_error
+
+# requests waiting for a worker thread before new ones are shed; 0 disables
+ADMISSION_MAX_THREAD_QUEUE = int(os.getenv("ADMISSION_MAX_THREAD_QUEUE", "40"))
+# requests beyond the DB pool's capacity before new ones are shed; 0 disables
+ADMISSION_MAX_DB_QUEUE = int(os.getenv("ADMISSION_MAX_DB_QUEUE", "30"))
+ADMISSION_RETRY_AFTER_SECONDS = float(os.getenv("ADMISSION_RETRY_AFTER_SECONDS", "1"))
+
+
+class AdmissionControlMiddleware:
+    """
+    Shed load with 503 and Retry-After once requests queue up, so that latency
+    stays bounded for the requests that are admitted.
+
+    Two queues are watched. Sync endpoints wait for a thread of the anyio
+    thread limiter, which reports how many are waiting. Every request opens a
+    session, so requests in flight beyond the connection pool's capacity
+    approximate those waiting for a connection. Long-lived streams matching
+    the streams pattern give their connection back before streaming, so they
+    are not counted.
+    """
+
+    def __init__(self, app: ASGIApp, engine: Engine, streams: re.Pattern | None = None):
+        self.app = app
+        self.engine = engine
+        self.streams = streams
+        self.in_flight = 0
+
+    def _pool_capacity(self) -> int:
+        pool = self.engine.pool
+        return pool.size() + max(0, getattr(pool, "_max_overflow", 0))
+
+    def _overloaded(self) -> str | None:
+        if ADMISSION_MAX_THREAD_QUEUE > 0:
+            limiter = anyio.to_thread.current_default_thread_limiter()
+            if limiter.statistics().tasks_waiting >= ADMISSION_MAX_THREAD_QUEUE:
+                return "thread pool"
+        if ADMISSION_MAX_DB_QUEUE > 0:
+            if self.in_flight - self._pool_capacity() >= ADMISSION_MAX_DB_QUEUE:
+                return "database pool"
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        queue = self._overloaded()
+        if queue is not None:
+            logging.warning(
+                f"Shedding {scope['method']} {scope['path']}: {queue} queue full"
+            )
+            await send_error(
+                send, 503, "Service overloaded", ADMISSION_RETRY_AFTER_SECONDS
+            )
+            return
+
+        if self.streams is not None and self.streams.search(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+
+        self.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.in_flight -= 1
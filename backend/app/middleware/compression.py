@@ -0,0 +1,65 @@
+import anyio
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.service.compression import (
+    compress,
+    encode_headers,
+    is_compressible,
+    negotiate_encoding,
+    vary_on_encoding,
+)
+
+
+class CompressionMiddleware:
+    """
+    Compress response bodies with the content coding the client prefers,
+    brotli when it is installed or gzip. Small bodies, streamed responses and
+    responses that are already encoded, such as precompressed cache hits,
+    are sent as they are.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding: str | None = negotiate_encoding(
+            Headers(scope=scope).get("accept-encoding")
+        )
+        start: Message | None = None
+
+        async def send_compressed(message: Message) -> None:
+            nonlocal start
+            if message["type"] == "http.response.start":
+                # held until the first body message shows what is being sent
+                start = message
+                return
+            if start is None or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            start_message, start = start, None
+            body: bytes = message.get("body", b"")
+            headers = MutableHeaders(raw=list(start_message.get("headers", [])))
+            if message.get("more_body") or not is_compressible(headers, len(body)):
+                await send(start_message)
+                await send(message)
+                return
+
+            if encoding is None:
+                vary_on_encoding(headers)
+                await send({**start_message, "headers": headers.raw})
+                await send(message)
+                return
+
+            # in a worker thread, so a large body does not stall the event loop
+            compressed: bytes = await anyio.to_thread.run_sync(compress, body, encoding)
+            encode_headers(headers, encoding, len(compressed))
+            await send({**start_message, "headers": headers.raw})
+            await send({**message, "body": compressed})
+
+        await self.app(scope, receive, send_compressed)
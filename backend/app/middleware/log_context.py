@@ -0,0 +1,21 @@
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.service.log import current_log_scope
+
+
+class LogContextMiddleware:
+    """Expose the current request to log records, for their route and sampling."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        token = current_log_scope.set(scope)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_log_scope.reset(token)
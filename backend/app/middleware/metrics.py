@@ -0,0 +1,84 @@
+import time
+
+from starlette.datastructures import Headers
+from starlette.routing import BaseRoute, Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.service.metrics import RequestStats, current_request_stats, record_request
+
+UNMATCHED_ROUTE = "unmatched"
+# streamed until the client leaves; timed only until the stream starts
+EVENT_STREAM = "text/event-stream"
+
+
+class MetricsMiddleware:
+    """
+    Time each request and the SQL run for it, record both in the Prometheus
+    histograms labelled by route template, and report them to the client in a
+    Server-Timing header. Event streams are timed until their response
+    starts, as their length is up to the client.
+    """
+
+    def __init__(
+        self, app: ASGIApp, routes: list[BaseRoute], exclude: set[str] = frozenset()
+    ):
+        self.app = app
+        self.routes = routes
+        self.exclude = exclude
+
+    def _route(self, scope: Scope) -> str:
+        # set by FastAPI once routed; requests answered by the cache, rate
+        # limiter or admission control never reach the router
+        route = scope.get("route")
+        if route is None:
+            route = next(
+                (r for r in self.routes if r.matches(scope)[0] == Match.FULL), None
+            )
+        return getattr(route, "path", UNMATCHED_ROUTE)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] in self.exclude:
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = current_request_stats.set(stats)
+        start: float = time.perf_counter()
+        status: int = 500
+        stream_start: float | None = None
+
+        async def send_with_timing(message: Message) -> None:
+            nonlocal status, stream_start
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                content_type: str = Headers(raw=message.get("headers", [])).get(
+                    "content-type", ""
+                )
+                if content_type.startswith(EVENT_STREAM):
+                    stream_start = time.perf_counter()
+                elapsed_ms: float = (time.perf_counter() - start) * 1000
+                timing: str = (
+                    f'db;dur={stats.db_seconds * 1000:.1f};desc="queries: {stats.queries}", '
+                    f"pool;dur={stats.pool_wait_seconds * 1000:.1f}, "
+                    f"total;dur={elapsed_ms:.1f}"
+                )
+                message = {
+                    **message,
+                    "headers": [
+                        *message.get("headers", []),
+                        (b"server-timing", timing.encode()),
+                    ],
+                }
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_request_stats.reset(token)
+            record_request(
+                scope["method"],
+                self._route(scope),
+                status,
+                (stream_start or time.perf_counter()) - start,
+                stats,
+            )
@@ -0,0 +1,101 @@
+import json
+import math
+import re
+from dataclasses import dataclass, field
+from typing import Literal
+
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.service.auth import verify_access_token
+from app.service.rate_limit import (
+    RATE_LIMIT_ENABLED,
+    RATE_LIMIT_TRUST_FORWARDED_FOR,
+    RateLimitBackend,
+)
+
+
+@dataclass
+class RateLimitRule:
+    name: str
+    path: re.Pattern
+    rate: float  # tokens per second
+    burst: int
+    # "user" buckets fall back to the client address for anonymous requests
+    per: Literal["ip", "user"] = "ip"
+    methods: set[str] = field(default_factory=lambda: {"GET", "POST", "PUT", "DELETE"})
+
+
+async def send_error(send: Send, status: int, detail: str, retry_after: float) -> None:
+    """Send a JSON error in the shape of FastAPI's HTTPException responses."""
+    body = json.dumps({"detail": detail}).encode()
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+def client_address(scope: Scope) -> str:
+    if RATE_LIMIT_TRUST_FORWARDED_FOR:
+        forwarded = Headers(scope=scope).get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[-1].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+def _user_id(scope: Scope) -> int | None:
+    authorization = Headers(scope=scope).get("authorization", "")
+    if not authorization.startswith("Bearer "):
+        return None
+    return verify_access_token(authorization[len("Bearer ") :])
+
+
+class RateLimitMiddleware:
+    """
+    Limit requests to matching paths with token buckets per client address or
+    per user, answering 429 with Retry-After once a bucket is empty. Every
+    matching rule takes a token, so a path can be limited both ways.
+    """
+
+    def __init__(
+        self, app: ASGIApp, backend: RateLimitBackend, rules: list[RateLimitRule]
+    ):
+        self.app = app
+        self.backend = backend
+        self.rules = rules
+
+    def _client_key(self, scope: Scope, rule: RateLimitRule) -> str:
+        if rule.per == "user":
+            user_id = _user_id(scope)
+            if user_id is not None:
+                return f"user:{user_id}"
+        return f"ip:{client_address(scope)}"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not RATE_LIMIT_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        retry_after = 0.0
+        for rule in self.rules:
+            if scope["method"] not in rule.methods or not rule.path.match(
+                scope["path"]
+            ):
+                continue
+            key = f"{rule.name}:{self._client_key(scope, rule)}"
+            retry_after = max(
+                retry_after, self.backend.take(key, rule.rate, rule.burst)
+            )
+        if retry_after > 0:
+            await send_error(send, 429, "Too many requests", retry_after)
+            return
+        await self.app(scope, receive, send)
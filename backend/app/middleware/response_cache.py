@@ -0,0 +1,205 @@
+import asyncio
+import logging
+import re
+import time
+from dataclasses import dataclass
+
+import anyio
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.service.compression import (
+    encode_headers,
+    negotiate_encoding,
+    precompress,
+    vary_on_encoding,
+)
+from app.service.http_cache import etag_matches
+from app.service.metrics import (
+    RequestStats,
+    current_request_stats,
+    record_cache_refresh,
+)
+from app.service.response_cache import (
+    CachedResponse,
+    ResponseCacheBackend,
+    cache_key,
+    RESPONSE_CACHE_TTL_SECONDS,
+    RESPONSE_CACHE_STALE_SECONDS,
+)
+
+CONDITIONAL_HEADERS = {b"if-none-match", b"if-modified-since"}
+VALIDATOR_HEADERS = {b"etag", b"cache-control", b"vary", b"last-modified"}
+
+
+@dataclass
+class CacheRule:
+    path: re.Pattern
+    ttl: float = RESPONSE_CACHE_TTL_SECONDS
+    stale: float = RESPONSE_CACHE_STALE_SECONDS
+
+
+class ResponseCacheMiddleware:
+    """
+    Serve anonymous GET requests for matching paths from a shared response
+    cache. Responses are only cached when the request carries no Authorization
+    header, so every viewer of a key would have received the same body.
+
+    Fresh entries are served directly. Entries past their TTL but inside the
+    stale window are served immediately while one background request per key
+    refreshes them (stale-while-revalidate). Concurrent misses of a key
+    share one request to the app, so an expired entry does not send a burst
+    of identical requests to the database.
+
+    Compressible bodies are stored with a precompressed copy per content
+    coding, and hits are sent in the coding the client accepts.
+    """
+
+    def __init__(
+        self, app: ASGIApp, backend: ResponseCacheBackend, rules: list[CacheRule]
+    ):
+        self.app = app
+        self.backend = backend
+        self.rules = rules
+        # keys being fetched, holding a reference to each fetch task
+        self._fetching: dict[str, asyncio.Task] = {}
+
+    def _match(self, scope: Scope) -> CacheRule | None:
+        if scope["type"] != "http" or scope["method"] != "GET":
+            return None
+        if "authorization" in Headers(scope=scope):
+            return None
+        return next((r for r in self.rules if r.path.match(scope["path"])), None)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        rule = self._match(scope)
+        if rule is None:
+            await self.app(scope, receive, send)
+            return
+
+        key = cache_key(scope["path"], scope["query_string"].decode("latin-1"))
+        now = time.time()
+        entry = self.backend.get(key)
+        if entry is not None and entry.is_usable(now):
+            if not entry.is_fresh(now) and key not in self._fetching:
+                self._start_fetch(scope, key, rule, refresh=True).add_done_callback(
+                    lambda task: self._log_refresh_error(key, task)
+                )
+            state = "HIT" if entry.is_fresh(now) else "STALE"
+            await self._send_entry(scope, send, entry, state)
+            return
+
+        task = self._fetching.get(key) or self._start_fetch(scope, key, rule)
+        # shielded so that a client going away does not cancel the others' fetch
+        entry = await asyncio.shield(task)
+        await self._send_entry(scope, send, entry, "MISS")
+
+    def _start_fetch(
+        self, scope: Scope, key: str, rule: CacheRule, refresh: bool = False
+    ) -> asyncio.Task:
+        """Fetch and store a key in the background, once however many wait on it."""
+        fetch = self._refresh if refresh else self._fetch_and_store
+        task = asyncio.create_task(fetch(dict(scope), key, rule))
+        self._fetching[key] = task
+        task.add_done_callback(lambda _: self._fetching.pop(key, None))
+        return task
+
+    async def _fetch_and_store(
+        self, scope: Scope, key: str, rule: CacheRule
+    ) -> CachedResponse:
+        entry = await self._fetch(scope, rule)
+        if entry.status == 200:
+            self.backend.set(key, entry)
+        return entry
+
+    async def _refresh(self, scope: Scope, key: str, rule: CacheRule) -> CachedResponse:
+        # the refresh outlives the request that found the entry stale, so its
+        # SQL is recorded on its own instead of being added to that request;
+        # the task runs in a copy of the context, which this set leaves alone
+        stats = RequestStats()
+        current_request_stats.set(stats)
+        start: float = time.perf_counter()
+        try:
+            return await self._fetch_and_store(scope, key, rule)
+        finally:
+            record_cache_refresh(rule.path.pattern, time.perf_counter() - start, stats)
+
+    @staticmethod
+    def _log_refresh_error(key: str, task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            logging.error(f"Error refreshing cached response {key}: {task.exception()}")
+
+    async def _fetch(self, scope: Scope, rule: CacheRule) -> CachedResponse:
+        """Run the request without conditional headers and buffer the response."""
+        scope = dict(scope)
+        scope["headers"] = [
+            (k, v) for k, v in scope["headers"] if k not in CONDITIONAL_HEADERS
+        ]
+        start: Message = {}
+        body = bytearray()
+
+        async def receive() -> Message:
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def capture(message: Message) -> None:
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message
+            elif message["type"] == "http.response.body":
+                body.extend(message.get("body", b""))
+
+        await self.app(scope, receive, capture)
+        headers = list(start.get("headers", []))
+        encoded: dict[str, bytes] = {}
+        if start["status"] == 200:
+            # compressing at the cached levels is slow; keep it off the event loop
+            encoded = await anyio.to_thread.run_sync(
+                precompress, MutableHeaders(raw=list(headers)), bytes(body)
+            )
+        now = time.time()
+        return CachedResponse(
+            status=start["status"],
+            headers=headers,
+            body=bytes(body),
+            stored_at=now,
+            fresh_until=now + rule.ttl,
+            stale_until=now + rule.ttl + rule.stale,
+            encoded=encoded,
+        )
+
+    async def _send_entry(
+        self, scope: Scope, send: Send, entry: CachedResponse, state: str
+    ) -> None:
+        age = str(int(time.time() - entry.stored_at)).encode()
+        etag = entry.header(b"etag")
+        if_none_match = Headers(scope=scope).get("if-none-match")
+        if etag and if_none_match and etag_matches(if_none_match, etag.decode()):
+            headers = [(k, v) for k, v in entry.headers if k in VALIDATOR_HEADERS]
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": 304,
+                    "headers": headers + [(b"age", age), (b"x-cache", state.encode())],
+                }
+            )
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        headers = MutableHeaders(raw=list(entry.headers))
+        body: bytes = entry.body
+        if entry.encoded:
+            encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding"))
+            if encoding in entry.encoded:
+                body = entry.encoded[encoding]
+                encode_headers(headers, encoding, len(body))
+            else:
+                vary_on_encoding(headers)
+        await send(
+            {
+                "type": "http.response.start",
+                "status": entry.status,
+                "headers": headers.raw + [(b"age", age), (b"x-cache", state.encode())],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
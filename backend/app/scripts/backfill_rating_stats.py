@@ -0,0 +1,91 @@
+"""
+Rebuild stance_rating_stats from the ratings table.
+
+Usage:
+    python -m app.scripts.backfill_rating_stats [--batch-size 10000]
+
+Run once after deploying the histogram counters, or at any time to repair
+drift. Stances are processed in id ranges, one transaction per range. Each
+transaction locks the existing stats rows it rewrites, so ratings arriving
+during the run wait briefly instead of being lost. Rows seeded by rate_stance
+while their range is being rebuilt are not covered by that lock; a second run
+settles them.
+"""
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import argparse
+import logging
+
+from sqlalchemy import text
+
+from app.database.connect import engine
+
+DEFAULT_BATCH_SIZE = 10000
+
+# stances without ratings get an all-zero row, so that every stance has stats
+REBUILD_SQL = """
+INSERT INTO stance_rating_stats (
+    stance_id, count_1, count_2, count_3, count_4, count_5, updated_at
+)
+SELECT
+    s.id,
+    count(r.id) FILTER (WHERE r.rating = 1),
+    count(r.id) FILTER (WHERE r.rating = 2),
+    count(r.id) FILTER (WHERE r.rating = 3),
+    count(r.id) FILTER (WHERE r.rating = 4),
+    count(r.id) FILTER (WHERE r.rating = 5),
+    now()
+FROM stances s
+LEFT JOIN ratings r ON r.stance_id = s.id
+WHERE s.id > :start AND s.id <= :end
+GROUP BY s.id
+ON CONFLICT (stance_id) DO UPDATE SET
+    count_1 = EXCLUDED.count_1,
+    count_2 = EXCLUDED.count_2,
+    count_3 = EXCLUDED.count_3,
+    count_4 = EXCLUDED.count_4,
+    count_5 = EXCLUDED.count_5,
+    updated_at = now()
+"""
+
+LOCK_SQL = """
+SELECT stance_id FROM stance_rating_stats
+WHERE stance_id > :start AND stance_id <= :end
+FOR UPDATE
+"""
+
+
+def backfill_rating_stats(batch_size: int) -> int:
+    with engine.connect() as connection:
+        max_id: int = connection.execute(
+            text("SELECT coalesce(max(id), 0) FROM stances")
+        ).scalar()
+
+    rebuilt = 0
+    for start in range(0, max_id, batch_size):
+        end = start + batch_size
+        with engine.begin() as connection:
+            # serialize with rate_stance, which updates these rows in place
+            connection.execute(text(LOCK_SQL), {"start": start, "end": end})
+            rebuilt += connection.execute(
+                text(REBUILD_SQL), {"start": start, "end": end}
+            ).rowcount
+        logging.info("Rebuilt rating stats for stances up to id %d", end)
+    return rebuilt
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    rebuilt = backfill_rating_stats(args.batch_size)
+    logging.info("Backfill finished: %d stances", rebuilt)
+
+
+if __name__ == "__main__":
+    main()
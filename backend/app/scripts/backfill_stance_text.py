@@ -0,0 +1,82 @@
+"""
+Fill Stance.content_text and the feed preview for stances written before
+they existed.
+
+Usage:
+    python -m app.scripts.backfill_stance_text [--batch-size 1000] [--all]
+
+Stances are walked in id order and updated one batch per transaction, so the
+job can be stopped and rerun at any time. Postgres recomputes each stance's
+search_vector as its content_text is written.
+"""
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import argparse
+import logging
+
+from app.database.connect import SessionLocal
+from app.database.models import Stance
+from app.service.stance import StanceExcerpt, build_stance_excerpt, extract_stance_text
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+def backfill_stance_text(batch_size: int, rewrite_all: bool = False) -> int:
+    updated = 0
+    last_id = 0
+    db = SessionLocal()
+    try:
+        while True:
+            query = db.query(Stance.id, Stance.content_json).filter(Stance.id > last_id)
+            if not rewrite_all:
+                query = query.filter(
+                    Stance.content_text.is_(None) | Stance.excerpt.is_(None)
+                )
+            rows = query.order_by(Stance.id).limit(batch_size).all()
+            if not rows:
+                break
+            mappings: list[dict] = []
+            for id, content_json in rows:
+                content_text: str = extract_stance_text(content_json)
+                excerpt: StanceExcerpt = build_stance_excerpt(
+                    content_json, content_text
+                )
+                mappings.append(
+                    {
+                        "id": id,
+                        "content_text": content_text,
+                        "excerpt": excerpt.excerpt,
+                        "word_count": excerpt.word_count,
+                        "preview_image_url": excerpt.preview_image_url,
+                    }
+                )
+            db.bulk_update_mappings(Stance, mappings)
+            db.commit()
+            updated += len(rows)
+            last_id = rows[-1].id
+            logging.info("Backfilled %d stances (last id %d)", updated, last_id)
+    finally:
+        db.close()
+    return updated
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument(
+        "--all",
+        action="store_true",
+        help="re-extract every stance, not only those without text or preview",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    updated = backfill_stance_text(args.batch_size, rewrite_all=args.all)
+    logging.info("Backfill finished: %d stances", updated)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+Build the related entities and similar stances index.
+
+Usage:
+    python -m app.scripts.build_related_index [--neighbours 20]
+
+Run periodically (e.g. nightly), on a host whose RELATED_INDEX_DIR the API
+processes can read. Entity titles and descriptions, and stance headlines and
+text, become hashed TF-IDF vectors, blended with the tags of their entity.
+Entities are compared with every entity; a stance with the stances of its
+own and of its entity's most related entities. Each run writes a new
+version of the index and then points the CURRENT file at it; the API picks
+it up within RELATED_INDEX_CHECK_SECONDS. Older versions but the previous
+one are removed.
+"""
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import argparse
+import logging
+import os
+import shutil
+import time
+
+import numpy as np
+
+from app.database.connect import engine
+from app.service.related import (
+    CURRENT_FILE,
+    ENTITIES,
+    RELATED_INDEX_DIR,
+    RELATED_NEIGHBOURS,
+    RELATED_TAG_WEIGHT,
+    STANCES,
+    Neighbours,
+    RelatedIndex,
+    TextHasher,
+    combine,
+    nearest_neighbours,
+    publish_related_index,
+    tag_vectors,
+)
+
+# related entities whose stances are compared with a stance
+RELATED_STANCE_ENTITIES = 10
+CHUNK_ROWS = 10_000
+
+
+def _entity_index(cursor, pairs: np.ndarray, neighbours: int) -> RelatedIndex:
+    cursor.execute("SELECT id, title, description FROM entities ORDER BY id")
+    rows = cursor.fetchall()
+    ids: np.ndarray = np.array([row[0] for row in rows], dtype=np.int32)
+    texts: list[str] = [
+        f"{title} {description or ''}" for _, title, description in rows
+    ]
+
+    hasher = TextHasher()
+    for text in texts:
+        hasher.count(text)
+    vectors: np.ndarray = combine(
+        hasher.transform(texts), tag_vectors(ids, pairs), RELATED_TAG_WEIGHT
+    )
+    return RelatedIndex(ids, nearest_neighbours(ids, vectors, ids, vectors, neighbours))
+
+
+def _stance_texts(connection, name: str):
+    cursor = connection.cursor(name=name)
+    cursor.itersize = CHUNK_ROWS
+    cursor.execute(
+        "SELECT id, entity_id, headline || ' ' || coalesce(content_text, '') "
+        "FROM stances ORDER BY id"
+    )
+    while True:
+        rows = cursor.fetchmany(CHUNK_ROWS)
+        if not rows:
+            break
+        yield rows
+    cursor.close()
+
+
+def _stance_index(
+    connection, pairs: np.ndarray, entities: RelatedIndex, neighbours: int
+) -> RelatedIndex:
+    # count every stance first, to weigh words by how rare they are
+    hasher = TextHasher()
+    for rows in _stance_texts(connection, "related_stance_counts"):
+        for row in rows:
+            hasher.count(row[2])
+
+    id_chunks, entity_chunks, vector_chunks = [], [], []
+    for rows in _stance_texts(connection, "related_stance_texts"):
+        chunk_ids = np.array([row[0] for row in rows], dtype=np.int32)
+        chunk_entities = np.array([row[1] for row in rows], dtype=np.int32)
+        id_chunks.append(chunk_ids)
+        entity_chunks.append(chunk_entities)
+        vector_chunks.append(
+            combine(
+                hasher.transform([row[2] for row in rows]),
+                tag_vectors(chunk_ids, pairs, chunk_entities),
+                RELATED_TAG_WEIGHT,
+            )
+        )
+    if not id_chunks:
+        empty = np.empty((0, neighbours))
+        return RelatedIndex(
+            np.empty(0, dtype=np.int32),
+            Neighbours(empty.astype(np.int32), empty.astype(np.float16)),
+        )
+    ids: np.ndarray = np.concatenate(id_chunks)
+    stance_entities: np.ndarray = np.concatenate(entity_chunks)
+    vectors: np.ndarray = np.vstack(vector_chunks)
+
+    # the stances of each entity, as runs of positions sorted by entity
+    by_entity: np.ndarray = np.argsort(stance_entities, kind="stable")
+    sorted_entities: np.ndarray = stance_entities[by_entity]
+    groups, starts = np.unique(sorted_entities, return_index=True)
+    ends: np.ndarray = np.append(starts[1:], len(by_entity))
+
+    def stances_of(entity_ids: list[int]) -> np.ndarray:
+        runs: np.ndarray = np.searchsorted(groups, entity_ids)
+        return np.concatenate(
+            [
+                by_entity[starts[run] : ends[run]]
+                for run, entity_id in zip(runs, entity_ids)
+                if run < len(groups) and groups[run] == entity_id
+            ]
+        )
+
+    neighbour_ids: np.ndarray = np.full((len(ids), neighbours), -1, dtype=np.int32)
+    neighbour_scores: np.ndarray = np.zeros((len(ids), neighbours), dtype=np.float16)
+    for entity_id, start, end in zip(groups, starts, ends):
+        queries: np.ndarray = by_entity[start:end]
+        related: list[int] = [
+            related_id
+            for related_id, _ in entities.lookup(
+                int(entity_id), RELATED_STANCE_ENTITIES
+            )
+        ]
+        candidates: np.ndarray = stances_of([int(entity_id), *related])
+        found: Neighbours = nearest_neighbours(
+            ids[queries],
+            vectors[queries],
+            ids[candidates],
+            vectors[candidates],
+            neighbours,
+        )
+        neighbour_ids[queries] = found.ids
+        neighbour_scores[queries] = found.scores
+    return RelatedIndex(ids, Neighbours(neighbour_ids, neighbour_scores))
+
+
+def _remove_old_versions(root: str, keep: set[str]) -> None:
+    for name in os.listdir(root):
+        path: str = os.path.join(root, name)
+        if name not in keep and os.path.isdir(path):
+            # processes still mapping the files keep them until they reload
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def build_related_index(
+    root: str = RELATED_INDEX_DIR, neighbours: int = RELATED_NEIGHBOURS
+) -> str:
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute("SELECT entity_id, tag_id FROM entity_tags")
+        pairs: np.ndarray = np.array(cursor.fetchall(), dtype=np.int64).reshape(-1, 2)
+        entities: RelatedIndex = _entity_index(cursor, pairs, neighbours)
+        stances: RelatedIndex = _stance_index(connection, pairs, entities, neighbours)
+        cursor.close()
+        connection.rollback()
+    finally:
+        connection.close()
+
+    try:
+        with open(os.path.join(root, CURRENT_FILE)) as f:
+            previous: str | None = f.read().strip()
+    except FileNotFoundError:
+        previous = None
+    version: str = time.strftime("%Y%m%d%H%M%S")
+    publish_related_index(root, version, {ENTITIES: entities, STANCES: stances})
+    _remove_old_versions(root, {version, previous})
+    return version
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--neighbours", type=int, default=RELATED_NEIGHBOURS)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    version = build_related_index(neighbours=args.neighbours)
+    logging.info("Build finished: related index %s", version)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+Delete expired and revoked refresh tokens.
+
+Usage:
+    python -m app.scripts.compact_refresh_tokens [--batch-size 1000]
+
+The API processes already do this periodically in bounded runs (see
+REFRESH_TOKEN_COMPACTION_SECONDS); this works off a whole backlog at once,
+such as the one built up before compaction existed. Each batch is its own
+short transaction and skips rows locked by concurrent refreshes, so it is
+safe to run against a live database.
+"""
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import argparse
+import logging
+
+from app.database.connect import SessionLocal
+from app.service.token_compaction import (
+    REFRESH_TOKEN_COMPACTION_BATCH_SIZE,
+    compact_refresh_tokens,
+)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--batch-size", type=int, default=REFRESH_TOKEN_COMPACTION_BATCH_SIZE
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    db = SessionLocal()
+    try:
+        deleted = compact_refresh_tokens(db, args.batch_size)
+    finally:
+        db.close()
+    logging.info("Compaction finished: %d tokens deleted", deleted)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+"""
+Stream a large JSON or NDJSON dump of entities into the database.
+
+Usage:
+    python -m app.scripts.import_entities bills.ndjson [--batch-size 5000] [--force]
+
+Records are decoded incrementally, so memory stays bounded by the batch size no
+matter how large the dump is. Each batch is COPY'd into temporary staging tables
+and merged into entities, tags and entity_tags in a single transaction. Existing
+entities are only rewritten when their latest_action_date has advanced, which
+keeps nightly re-imports of the same export cheap.
+
+Each record has the same shape as EntityCreateRequest, except that images are
+already-hosted URLs:
+    {"unique_id": "hr1-118", "type": 3, "title": "...", "images": ["https://..."],
+     "tags": [{"name": "Ohio", "tag_type": 1}], "latest_action_date": "2024-01-09"}
+"""
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import argparse
+import gzip
+import io
+import json
+import logging
+from datetime import datetime
+from typing import Iterator, TextIO
+
+from app.database.connect import engine
+
+READ_CHUNK_SIZE = 1 << 20  # 1 MiB
+DEFAULT_BATCH_SIZE = 5000
+
+ENTITY_COLUMNS = (
+    "unique_id",
+    "type",
+    "title",
+    "description",
+    "location",
+    "start_time",
+    "end_time",
+    "images_json",
+    "latest_action_date",
+    "latest_action_text",
+)
+TIMESTAMP_COLUMNS = {"start_time", "end_time", "latest_action_date"}
+
+CREATE_STAGING_SQL = """
+CREATE TEMP TABLE IF NOT EXISTS entity_import_staging (
+    unique_id text NOT NULL,
+    type integer NOT NULL,
+    title text NOT NULL,
+    description text,
+    location text,
+    start_time timestamptz,
+    end_time timestamptz,
+    images_json text,
+    latest_action_date timestamptz,
+    latest_action_text text
+) ON COMMIT DELETE ROWS;
+
+CREATE TEMP TABLE IF NOT EXISTS entity_import_tag_staging (
+    unique_id text NOT NULL,
+    name text NOT NULL,
+    tag_type integer NOT NULL
+) ON COMMIT DELETE ROWS;
+
+CREATE TEMP TABLE IF NOT EXISTS entity_import_merged (
+    id integer NOT NULL,
+    unique_id text NOT NULL
+) ON COMMIT DELETE ROWS;
+"""
+
+# upsert staged entities, skipping rows whose latest_action_date has not advanced;
+# every merged row gets a new updated_at, and only merged rows get their tags
+# replaced, so the entity ETag (built from updated_at) changes with any import
+MERGE_ENTITIES_SQL = """
+WITH merged AS (
+    INSERT INTO entities (
+        unique_id, type, title, description, location, start_time, end_time,
+        images_json, latest_action_date, latest_action_text, created_at, updated_at
+    )
+    SELECT DISTINCT ON (unique_id)
+        unique_id, type, title, description, location, start_time, end_time,
+        images_json, latest_action_date, latest_action_text, now(), now()
+    FROM entity_import_staging
+    ORDER BY unique_id, latest_action_date DESC NULLS LAST
+    ON CONFLICT (unique_id) DO UPDATE SET
+        type = EXCLUDED.type,
+        title = EXCLUDED.title,
+        description = EXCLUDED.description,
+        location = EXCLUDED.location,
+        start_time = EXCLUDED.start_time,
+        end_time = EXCLUDED.end_time,
+        images_json = EXCLUDED.images_json,
+        latest_action_date = EXCLUDED.latest_action_date,
+        latest_action_text = EXCLUDED.latest_action_text,
+        updated_at = now()
+    {where}
+    RETURNING id, unique_id
+)
+INSERT INTO entity_import_merged (id, unique_id)
+SELECT id, unique_id FROM merged
+"""
+
+ADVANCED_ONLY_SQL = """
+    WHERE EXCLUDED.latest_action_date > entities.latest_action_date
+       OR (entities.latest_action_date IS NULL
+           AND EXCLUDED.latest_action_date IS NOT NULL)
+"""
+
+# tags has no unique constraint on (name, tag_type), so insert only missing ones
+MERGE_TAGS_SQL = """
+INSERT INTO tags (name, tag_type)
+SELECT DISTINCT s.name, s.tag_type
+FROM entity_import_tag_staging s
+JOIN entity_import_merged m ON m.unique_id = s.unique_id
+WHERE NOT EXISTS (
+    SELECT 1 FROM tags t WHERE t.name = s.name AND t.tag_type = s.tag_type
+)
+"""
+
+# replace the tag set of every merged entity, like update_entity_endpoint does
+MERGE_ENTITY_TAGS_SQL = """
+DELETE FROM entity_tags et
+USING entity_import_merged m
+WHERE et.entity_id = m.id;
+
+INSERT INTO entity_tags (entity_id, tag_id)
+SELECT DISTINCT m.id, t.id
+FROM entity_import_tag_staging s
+JOIN entity_import_merged m ON m.unique_id = s.unique_id
+JOIN LATERAL (
+    SELECT id FROM tags
+    WHERE tags.name = s.name AND tags.tag_type = s.tag_type
+    ORDER BY id
+    LIMIT 1
+) t ON true;
+"""
+
+
+def open_dump(path: str) -> TextIO:
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+def iter_json_values(stream: TextIO) -> Iterator[dict]:
+    """
+    Incrementally decode a top-level JSON array or a sequence of whitespace
+    separated JSON values (NDJSON). Only the current chunk and the record being
+    decoded are held in memory.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    eof = False
+    in_array: bool | None = None
+
+    while True:
+        # skip whitespace and array separators
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos < len(buffer) or eof:
+                break
+            buffer, pos = stream.read(READ_CHUNK_SIZE), 0
+            eof = not buffer
+
+        if pos >= len(buffer):
+            return
+
+        if in_array is None:
+            in_array = buffer[pos] == "["
+            if in_array:
+                pos += 1
+                continue
+        if in_array and buffer[pos] == "]":
+            return
+
+        try:
+            value, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            # the value spans past the current chunk; read more and retry
+            chunk = stream.read(READ_CHUNK_SIZE)
+            eof = not chunk
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+
+        yield value
+        pos = end
+        # drop consumed input so the buffer does not grow with the file
+        if pos > READ_CHUNK_SIZE:
+            buffer, pos = buffer[pos:], 0
+
+
+def parse_timestamp(value: str | None) -> datetime | None:
+    if not value:
+        return None
+    # python 3.10 fromisoformat does not accept a trailing Z
+    if value.endswith("Z"):
+        value = value[:-1] + "+00:00"
+    return datetime.fromisoformat(value)
+
+
+def normalize_record(record: dict) -> tuple[dict, list[tuple[str, int]]]:
+    """Map a dump record onto entity columns and (tag name, tag type) pairs."""
+    if not record.get("unique_id") or not record.get("title"):
+        raise ValueError("record is missing unique_id or title")
+
+    row: dict = {column: record.get(column) for column in ENTITY_COLUMNS}
+    row["type"] = int(record["type"])
+    for column in TIMESTAMP_COLUMNS:
+        timestamp = parse_timestamp(record.get(column))
+        row[column] = timestamp.isoformat() if timestamp else None
+    if row["images_json"] is None:
+        row["images_json"] = json.dumps(record.get("images") or [])
+    elif not isinstance(row["images_json"], str):
+        # some dumps carry the images as a JSON array rather than encoded text
+        row["images_json"] = json.dumps(row["images_json"])
+
+    tags: list[tuple[str, int]] = [
+        (tag["name"], int(tag["tag_type"])) for tag in record.get("tags") or []
+    ]
+    return row, tags
+
+
+def _copy_value(value) -> str:
+    # COPY text format: \N is NULL, and backslash/tab/newline must be escaped
+    if value is None:
+        return "\\N"
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def _copy_rows(cursor, table: str, columns: tuple[str, ...], rows: list) -> None:
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(_copy_value(value) for value in row))
+        buffer.write("\n")
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", buffer)
+
+
+def import_batch(connection, batch: list[tuple[dict, list]], force: bool) -> int:
+    """Stage and merge one batch in a single transaction; returns entities written."""
+    cursor = connection.cursor()
+    try:
+        _copy_rows(
+            cursor,
+            "entity_import_staging",
+            ENTITY_COLUMNS,
+            [[row[column] for column in ENTITY_COLUMNS] for row, _ in batch],
+        )
+        _copy_rows(
+            cursor,
+            "entity_import_tag_staging",
+            ("unique_id", "name", "tag_type"),
+            [
+                (row["unique_id"], name, tag_type)
+                for row, tags in batch
+                for name, tag_type in tags
+            ],
+        )
+        cursor.execute(
+            MERGE_ENTITIES_SQL.format(where="" if force else ADVANCED_ONLY_SQL)
+        )
+        merged: int = cursor.rowcount
+        if merged:
+            cursor.execute(MERGE_TAGS_SQL)
+            cursor.execute(MERGE_ENTITY_TAGS_SQL)
+        connection.commit()
+        return merged
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def import_entities(path: str, batch_size: int, force: bool = False) -> dict:
+    stats = {"read": 0, "invalid": 0, "merged": 0, "skipped": 0}
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute(CREATE_STAGING_SQL)
+        cursor.close()
+        connection.commit()
+
+        batch: list[tuple[dict, list]] = []
+
+        def flush() -> None:
+            merged = import_batch(connection, batch, force)
+            stats["merged"] += merged
+            stats["skipped"] += len({row["unique_id"] for row, _ in batch}) - merged
+            logging.info("Imported batch: %s", stats)
+            batch.clear()
+
+        with open_dump(path) as stream:
+            for record in iter_json_values(stream):
+                stats["read"] += 1
+                try:
+                    batch.append(normalize_record(record))
+                except (AttributeError, KeyError, TypeError, ValueError) as e:
+                    stats["invalid"] += 1
+                    logging.warning("Skipping invalid record #%d: %s", stats["read"], e)
+                    continue
+                if len(batch) >= batch_size:
+                    flush()
+            if batch:
+                flush()
+    finally:
+        connection.close()
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("path", help="JSON array or NDJSON dump (optionally .gz)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="rewrite entities even if latest_action_date has not advanced",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    stats = import_entities(args.path, args.batch_size, force=args.force)
+    logging.info("Import finished: %s", stats)
+
+
+if __name__ == "__main__":
+    main()
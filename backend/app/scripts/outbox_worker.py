@@ -0,0 +1,78 @@
+"""
+Process outbox events: the derived data changes recorded by stance, rating,
+follow and entity writes.
+
+Usage:
+    python -m app.scripts.outbox_worker [--batch-size 100] [--metrics-port 9102]
+    python -m app.scripts.outbox_worker --drain
+    python -m app.scripts.outbox_worker --requeue-dead [--topic rating.changed]
+
+Run one or more of these next to the API processes. Each batch is claimed
+with SKIP LOCKED, so workers never process the same event. With
+--metrics-port the worker serves its lag and processing metrics at
+/metrics. --drain processes due events until none are left, and
+--requeue-dead makes dead-lettered events pending again.
+"""
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import logging
+import threading
+
+from app.database.connect import SessionLocal
+from app.database import outbox as outbox_db
+from app.service.metrics import render_metrics
+from app.service.outbox import OUTBOX_BATCH_SIZE, run_outbox_worker
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body: bytes = render_metrics().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--batch-size", type=int, default=OUTBOX_BATCH_SIZE)
+    parser.add_argument("--metrics-port", type=int, default=None)
+    parser.add_argument("--drain", action="store_true")
+    parser.add_argument("--requeue-dead", action="store_true")
+    parser.add_argument("--topic", default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.requeue_dead:
+        db = SessionLocal()
+        try:
+            requeued = outbox_db.requeue_dead_outbox_events(db, args.topic)
+        finally:
+            db.close()
+        logging.info("Requeued %d dead outbox events", requeued)
+        return
+
+    if args.metrics_port is not None:
+        server = ThreadingHTTPServer(("", args.metrics_port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        run_outbox_worker(args.batch_size, drain=args.drain)
+    except KeyboardInterrupt:
+        pass
+    logging.info("Outbox worker stopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Rebuild stance_demographic_stats from ratings and demographics.
+
+Usage:
+    python -m app.scripts.rebuild_demographic_stats
+
+Run once after deploying the rollup, or to repair it. The bucket of every
+user with demographics is computed with the same code the API uses, COPY'd
+into a temporary table, and the rollup is rebuilt from it in one transaction.
+Rating writes wait on the rollup's lock while the rebuild runs.
+"""
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import io
+import logging
+
+from app.database.connect import engine
+from app.service.demographics import demographic_bucket, UNKNOWN, UNKNOWN_BIRTH_YEAR
+
+CREATE_BUCKETS_SQL = """
+CREATE TEMP TABLE demographic_rebuild_buckets (
+    user_id integer PRIMARY KEY,
+    birth_year integer NOT NULL,
+    gender text NOT NULL,
+    region text NOT NULL
+) ON COMMIT DROP
+"""
+
+REBUILD_SQL = f"""
+LOCK TABLE stance_demographic_stats IN EXCLUSIVE MODE;
+
+DELETE FROM stance_demographic_stats;
+
+INSERT INTO stance_demographic_stats (
+    stance_id, birth_year, gender, region, entity_id, num_ratings, rating_sum
+)
+SELECT
+    r.stance_id,
+    coalesce(b.birth_year, {UNKNOWN_BIRTH_YEAR}),
+    coalesce(b.gender, '{UNKNOWN}'),
+    coalesce(b.region, '{UNKNOWN}'),
+    s.entity_id,
+    count(*),
+    sum(r.rating)
+FROM ratings r
+JOIN stances s ON s.id = r.stance_id
+LEFT JOIN demographic_rebuild_buckets b ON b.user_id = r.user_id
+GROUP BY 1, 2, 3, 4, 5;
+"""
+
+
+def rebuild_demographic_stats() -> int:
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute(CREATE_BUCKETS_SQL)
+
+        # demographics.user_id is not unique; count each user once
+        cursor.execute(
+            "SELECT user_id, birth_year, gender, zip_code FROM demographics ORDER BY id"
+        )
+        user_buckets = {
+            user_id: demographic_bucket(birth_year, gender, zip_code)
+            for user_id, birth_year, gender, zip_code in cursor.fetchall()
+        }
+        buckets = io.StringIO()
+        for user_id, bucket in user_buckets.items():
+            buckets.write(f"{user_id}\t" + "\t".join(map(str, bucket)) + "\n")
+        buckets.seek(0)
+        cursor.copy_expert("COPY demographic_rebuild_buckets FROM STDIN", buckets)
+
+        cursor.execute(REBUILD_SQL)
+        cursor.execute("SELECT count(*) FROM stance_demographic_stats")
+        cells: int = cursor.fetchone()[0]
+        connection.commit()
+        cursor.close()
+        return cells
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+    cells = rebuild_demographic_stats()
+    logging.info("Rebuild finished: %d rollup cells", cells)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Rebuild the inputs of personalized stance feeds: every user's tag affinity
+vector and every tag's pool of candidate stances.
+
+Usage:
+    python -m app.scripts.rebuild_feed_ranking [--chunk-rows 500000]
+
+Run periodically (e.g. hourly); ratings, new stances and engagement changes
+reach personalized feeds with the next run. Ratings are streamed joined to
+the tags of the rated stances' entities, ordered by user, and turned into
+vectors a chunk of whole users at a time with NumPy. The vectors are COPY'd
+into a temporary table, and both tables are replaced in one transaction, so
+feeds never see a half-built ranking.
+"""
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import argparse
+import io
+import logging
+
+import numpy as np
+
+from app.database.connect import engine
+from app.service.feed_ranking import (
+    FEED_AFFINITY_TAGS,
+    FEED_POOL_SIZE,
+    build_tag_affinity_vectors,
+)
+
+CREATE_VECTORS_SQL = """
+CREATE TEMP TABLE feed_rebuild_affinities (
+    user_id integer PRIMARY KEY,
+    tag_ids integer[] NOT NULL,
+    weights double precision[] NOT NULL
+) ON COMMIT DROP
+"""
+
+RATING_TAGS_SQL = """
+SELECT r.user_id, et.tag_id, r.rating
+FROM ratings r
+JOIN stances s ON s.id = r.stance_id
+JOIN entity_tags et ON et.entity_id = s.entity_id
+ORDER BY r.user_id
+"""
+
+REBUILD_SQL = """
+DELETE FROM user_tag_affinities;
+
+INSERT INTO user_tag_affinities (user_id, tag_ids, weights)
+SELECT user_id, tag_ids, weights FROM feed_rebuild_affinities;
+
+DELETE FROM tag_stance_pools;
+
+INSERT INTO tag_stance_pools (tag_id, stance_ids, entity_ids, engagement_scores)
+SELECT
+    tag_id,
+    array_agg(stance_id ORDER BY engagement_score DESC, stance_id DESC),
+    array_agg(entity_id ORDER BY engagement_score DESC, stance_id DESC),
+    array_agg(engagement_score ORDER BY engagement_score DESC, stance_id DESC)
+FROM (
+    SELECT
+        et.tag_id,
+        s.id AS stance_id,
+        s.entity_id,
+        s.engagement_score,
+        row_number() OVER (
+            PARTITION BY et.tag_id ORDER BY s.engagement_score DESC, s.id DESC
+        ) AS engaging,
+        row_number() OVER (
+            PARTITION BY et.tag_id ORDER BY s.created_at DESC, s.id DESC
+        ) AS newest
+    FROM stances s
+    JOIN entity_tags et ON et.entity_id = s.entity_id
+) ranked
+WHERE engaging <= %(half_pool)s OR newest <= %(half_pool)s
+GROUP BY tag_id;
+"""
+
+
+def _copy_vectors(cursor, rows: np.ndarray, top_k: int) -> int:
+    vectors = build_tag_affinity_vectors(rows[:, 0], rows[:, 1], rows[:, 2], top_k)
+    buffer = io.StringIO()
+    for vector in vectors:
+        tag_ids: str = ",".join(map(str, vector.tag_ids))
+        weights: str = ",".join(map(repr, vector.weights))
+        buffer.write(f"{vector.user_id}\t{{{tag_ids}}}\t{{{weights}}}\n")
+    buffer.seek(0)
+    cursor.copy_expert("COPY feed_rebuild_affinities FROM STDIN", buffer)
+    return len(vectors)
+
+
+def rebuild_feed_ranking(
+    chunk_rows: int, top_k: int = FEED_AFFINITY_TAGS, pool_size: int = FEED_POOL_SIZE
+) -> int:
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute(CREATE_VECTORS_SQL)
+
+        ratings = connection.cursor(name="feed_rebuild_ratings")
+        ratings.itersize = chunk_rows
+        ratings.execute(RATING_TAGS_SQL)
+        users: int = 0
+        carry: np.ndarray = np.empty((0, 3), dtype=np.int64)
+        while True:
+            fetched = ratings.fetchmany(chunk_rows)
+            rows: np.ndarray = np.vstack(
+                [carry, np.array(fetched, dtype=np.int64).reshape(-1, 3)]
+            )
+            if fetched:
+                # the chunk's last user may go on in the next one
+                split: int = int(np.searchsorted(rows[:, 0], rows[-1, 0]))
+                rows, carry = rows[:split], rows[split:]
+            if len(rows):
+                users += _copy_vectors(cursor, rows, top_k)
+            if not fetched:
+                break
+        ratings.close()
+
+        cursor.execute(REBUILD_SQL, {"half_pool": max(pool_size // 2, 1)})
+        connection.commit()
+        cursor.close()
+        return users
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--chunk-rows", type=int, default=500_000)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    users = rebuild_feed_ranking(args.chunk_rows)
+    logging.info("Rebuild finished: %d affinity vectors", users)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Find users whose usernames or emails differ only in case.
+
+Usage:
+    python -m app.scripts.resolve_case_duplicate_users [--rename]
+
+Run before creating the lower(username) and lower(email) unique indexes on a
+database that predates them; the indexes cannot be built while such users
+exist. Every group of duplicates is listed. With --rename, all but the
+oldest account of each username group are renamed to username_<id>, which
+their owners can change again. Duplicate emails are only listed: which
+account owns an address has to be settled by hand.
+"""
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import argparse
+import logging
+import sys
+
+from sqlalchemy import text
+
+from app.database.connect import engine
+
+# username is varchar(50), which the _<id> suffix must fit in
+USERNAME_LENGTH = 50
+
+DUPLICATES_SQL = """
+SELECT lower({column}), array_agg(id ORDER BY id), array_agg({column} ORDER BY id)
+FROM users
+GROUP BY lower({column})
+HAVING count(*) > 1
+ORDER BY 1
+"""
+
+
+def find_duplicates(connection, column: str) -> list[tuple[str, list[int], list[str]]]:
+    return [
+        tuple(row)
+        for row in connection.execute(text(DUPLICATES_SQL.format(column=column)))
+    ]
+
+
+def renamed_username(username: str, user_id: int) -> str:
+    suffix: str = f"_{user_id}"
+    return username[: USERNAME_LENGTH - len(suffix)] + suffix
+
+
+def resolve_case_duplicate_users(rename: bool) -> int:
+    """List and optionally rename duplicates; returns the groups left over."""
+    with engine.begin() as connection:
+        usernames = find_duplicates(connection, "username")
+        emails = find_duplicates(connection, "email")
+        for key, ids, values in usernames:
+            logging.info("Username %r is shared by users %s (%s)", key, ids, values)
+            if not rename:
+                continue
+            # the oldest account keeps the name
+            for user_id, username in zip(ids[1:], values[1:]):
+                connection.execute(
+                    text(
+                        "UPDATE users SET username = :username, updated_at = now() "
+                        "WHERE id = :id"
+                    ),
+                    {"username": renamed_username(username, user_id), "id": user_id},
+                )
+        for key, ids, values in emails:
+            logging.info("Email %r is shared by users %s (%s)", key, ids, values)
+    return len(emails) + (0 if rename else len(usernames))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--rename",
+        action="store_true",
+        help="rename all but the oldest account of each duplicate username",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    remaining: int = resolve_case_duplicate_users(args.rename)
+    if remaining:
+        logging.info("%d duplicate groups remain", remaining)
+        sys.exit(1)
+    logging.info("No case-duplicate users left; the indexes can be created")
+
+
+if __name__ == "__main__":
+    main()
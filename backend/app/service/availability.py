@@ -0,0 +1,164 @@
+from sqlalchemy.orm import Session
+from datetime import datetime, timedelta, timezone
+import asyncio
+import hashlib
+import logging
+import math
+import os
+import threading
+import time
+
+from app.database.connect import SessionLocal
+from app.database import user as user_db
+
+AVAILABILITY_FALSE_POSITIVE_RATE = float(
+    os.getenv("AVAILABILITY_FALSE_POSITIVE_RATE", "0.01")
+)
+# pick up users created or renamed by other workers
+AVAILABILITY_SYNC_SECONDS = float(os.getenv("AVAILABILITY_SYNC_SECONDS", "10"))
+# rebuild from scratch to shed deleted and renamed-away names and to resize
+AVAILABILITY_REBUILD_SECONDS = float(os.getenv("AVAILABILITY_REBUILD_SECONDS", "3600"))
+# overlap between syncs, covering transactions that commit after their now()
+SYNC_OVERLAP = timedelta(seconds=60)
+MIN_CAPACITY = 10000
+
+
+class BloomFilter:
+    """
+    Fixed-size set membership filter. A miss means the value was never added;
+    a hit means it probably was, wrong at most at the configured rate while
+    fewer than capacity values have been added.
+    """
+
+    def __init__(self, capacity: int, false_positive_rate: float):
+        self.capacity = capacity
+        self.num_bits = max(
+            8,
+            int(-capacity * math.log(false_positive_rate) / math.log(2) ** 2),
+        )
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, value: str) -> list[int]:
+        # double hashing: k positions from two independent 64 bit hashes
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, value: str) -> None:
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value: str) -> bool:
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(value)
+        )
+
+
+class AvailabilityIndex:
+    """
+    Answers "is this username / email taken?" case-insensitively. Names the
+    filters have never seen are reported available without a query; possible
+    hits are confirmed against the lower() unique indexes on users. Until the
+    filters are first built every check is answered by the database.
+
+    The filters are built and kept current by run_availability_refresh, off
+    the request path. They are per process, so a name taken on another
+    worker is only seen after the next sync. The unique indexes remain the
+    final guard, and writers must treat UniqueViolationError as "taken".
+    """
+
+    def __init__(self):
+        # held while the filters are changed; bits are set read-modify-write
+        self._lock = threading.Lock()
+        self._usernames: BloomFilter | None = None
+        self._emails: BloomFilter | None = None
+        self._built_at: float = 0.0
+        self._sync_since: datetime | None = None
+
+    def _rebuild(self, db: Session) -> None:
+        started: datetime = datetime.now(timezone.utc)
+        capacity: int = max(MIN_CAPACITY, 2 * user_db.count_users(db))
+        usernames = BloomFilter(capacity, AVAILABILITY_FALSE_POSITIVE_RATE)
+        emails = BloomFilter(capacity, AVAILABILITY_FALSE_POSITIVE_RATE)
+        for username, email in user_db.iter_usernames_and_emails(db):
+            usernames.add(username)
+            emails.add(email)
+        with self._lock:
+            self._usernames, self._emails = usernames, emails
+            self._built_at = time.monotonic()
+            self._sync_since = started - SYNC_OVERLAP
+        logging.info(f"Rebuilt availability filters with {usernames.count} users")
+
+    def _sync(self, db: Session) -> None:
+        started: datetime = datetime.now(timezone.utc)
+        rows: list[tuple[str, str]] = list(
+            user_db.iter_usernames_and_emails(db, updated_since=self._sync_since)
+        )
+        with self._lock:
+            for username, email in rows:
+                self._usernames.add(username)
+                self._emails.add(email)
+            self._sync_since = started - SYNC_OVERLAP
+
+    def refresh(self, db: Session) -> None:
+        """
+        Build the filters, or add users changed since the last refresh.
+        Rebuilds every AVAILABILITY_REBUILD_SECONDS and once more users have
+        been added than the filters were sized for.
+        """
+        if (
+            self._usernames is None
+            or time.monotonic() - self._built_at >= AVAILABILITY_REBUILD_SECONDS
+            or self._usernames.count > self._usernames.capacity
+        ):
+            self._rebuild(db)
+        else:
+            self._sync(db)
+
+    def is_username_taken(self, db: Session, username: str) -> bool:
+        usernames: BloomFilter | None = self._usernames
+        if usernames is not None and username.lower() not in usernames:
+            return False
+        return user_db.is_username_taken(db, username)
+
+    def is_email_taken(self, db: Session, email: str) -> bool:
+        emails: BloomFilter | None = self._emails
+        if emails is not None and email.lower() not in emails:
+            return False
+        return user_db.is_email_taken(db, email)
+
+    def add(self, username: str | None = None, email: str | None = None) -> None:
+        """Record a committed signup or rename so this process sees it at once."""
+        with self._lock:
+            if self._usernames is None:
+                return
+            if username is not None:
+                self._usernames.add(username.lower())
+            if email is not None:
+                self._emails.add(email.lower())
+
+
+availability = AvailabilityIndex()
+
+
+def _refresh() -> None:
+    db: Session = SessionLocal()
+    try:
+        availability.refresh(db)
+    finally:
+        db.close()
+
+
+async def run_availability_refresh() -> None:
+    """Build the availability filters, then keep them current until cancelled."""
+    while True:
+        try:
+            await asyncio.to_thread(_refresh)
+        except Exception as e:
+            logging.error(f"Availability filter refresh failed: {e}")
+        await asyncio.sleep(AVAILABILITY_SYNC_SECONDS)
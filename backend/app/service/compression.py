@@ -0,0 +1,117 @@
+import gzip
+import os
+import time
+
+from starlette.datastructures import MutableHeaders
+
+from app.service.metrics import record_compression
+
+try:
+    import brotli
+except ImportError:  # optional; without it only gzip is offered
+    brotli = None
+
+# bodies smaller than this are sent as they are
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+# levels for responses compressed on every request
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+# cached bodies are compressed once per fill, so they can afford more effort
+COMPRESSION_CACHED_GZIP_LEVEL = int(os.getenv("COMPRESSION_CACHED_GZIP_LEVEL", "9"))
+COMPRESSION_CACHED_BROTLI_QUALITY = int(
+    os.getenv("COMPRESSION_CACHED_BROTLI_QUALITY", "8")
+)
+
+# offered content codings, most preferred first
+ENCODINGS: tuple[str, ...] = ("br", "gzip") if brotli is not None else ("gzip",)
+
+COMPRESSIBLE_TYPES = {
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+}
+# streamed event by event; buffering it to compress would stall the stream
+UNCOMPRESSIBLE_TEXT_TYPES = {"text/event-stream"}
+
+
+def negotiate_encoding(accept_encoding: str | None) -> str | None:
+    """
+    The offered content coding the client weights highest in its
+    Accept-Encoding header, ties going to the server's preference, or None
+    when the body should be sent as it is.
+    """
+    if not accept_encoding:
+        return None
+    weights: dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        weight: float = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key.lower() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[name.strip().lower()] = weight
+
+    best: str | None = None
+    best_weight: float = 0.0
+    for encoding in ENCODINGS:
+        weight = weights.get(encoding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+def is_compressible(headers: MutableHeaders, size: int) -> bool:
+    """Whether a response body of this size and these headers is worth compressing."""
+    if size < COMPRESSION_MIN_SIZE or "content-encoding" in headers:
+        return False
+    media_type: str = headers.get("content-type", "").split(";")[0].strip().lower()
+    if media_type.startswith("text/"):
+        return media_type not in UNCOMPRESSIBLE_TEXT_TYPES
+    return media_type in COMPRESSIBLE_TYPES
+
+
+def compress(body: bytes, encoding: str, cached: bool = False) -> bytes:
+    """Compress a body, recording the CPU time and ratio in the metrics."""
+    start: float = time.thread_time()
+    if encoding == "br":
+        level: int = (
+            COMPRESSION_CACHED_BROTLI_QUALITY if cached else COMPRESSION_BROTLI_QUALITY
+        )
+        compressed: bytes = brotli.compress(body, quality=level)
+    else:
+        level = COMPRESSION_CACHED_GZIP_LEVEL if cached else COMPRESSION_GZIP_LEVEL
+        # a fixed mtime keeps the output identical for identical bodies
+        compressed = gzip.compress(body, compresslevel=level, mtime=0)
+    record_compression(
+        encoding,
+        level,
+        "cache" if cached else "response",
+        time.thread_time() - start,
+        len(compressed) / len(body),
+    )
+    return compressed
+
+
+def precompress(headers: MutableHeaders, body: bytes) -> dict[str, bytes]:
+    """A compressed copy of a body in every offered coding, if it is compressible."""
+    if not is_compressible(headers, len(body)):
+        return {}
+    return {encoding: compress(body, encoding, cached=True) for encoding in ENCODINGS}
+
+
+def vary_on_encoding(headers: MutableHeaders) -> None:
+    """Tell shared caches the body depends on Accept-Encoding."""
+    if "accept-encoding" not in headers.get("vary", "").lower():
+        headers.add_vary_header("Accept-Encoding")
+
+
+def encode_headers(headers: MutableHeaders, encoding: str, size: int) -> None:
+    """Describe a body compressed with encoding, of size bytes."""
+    headers["content-encoding"] = encoding
+    headers["content-length"] = str(size)
+    vary_on_encoding(headers)
@@ -0,0 +1,99 @@
+from datetime import date
+from typing import NamedTuple
+import os
+
+# breakdown buckets with fewer ratings are suppressed, so that small groups
+# cannot be used to infer how an individual rated
+DEMOGRAPHIC_MIN_BUCKET_SIZE = int(os.getenv("DEMOGRAPHIC_MIN_BUCKET_SIZE", "5"))
+
+UNKNOWN = "unknown"
+
+DIMENSIONS = ("age_band", "gender", "region")
+
+# (upper age bound exclusive, label)
+AGE_BANDS = (
+    (18, "under_18"),
+    (30, "18_29"),
+    (45, "30_44"),
+    (65, "45_64"),
+    (200, "65_plus"),
+)
+
+GENDERS = {"female", "male", "nonbinary"}
+
+# first digit of a US ZIP code is its USPS national area
+ZIP_REGIONS = {
+    "0": "new_england",
+    "1": "northeast",
+    "2": "mid_atlantic",
+    "3": "southeast",
+    "4": "great_lakes",
+    "5": "upper_midwest",
+    "6": "central",
+    "7": "south_central",
+    "8": "mountain",
+    "9": "pacific",
+}
+
+
+# birth year of a rollup cell whose raters did not give theirs
+UNKNOWN_BIRTH_YEAR = 0
+
+
+# ratings are counted by birth year rather than age band, so that a rater's
+# cell does not change as they age; bands are worked out when reading
+class DemographicBucket(NamedTuple):
+    birth_year: int
+    gender: str
+    region: str
+
+
+UNKNOWN_BUCKET = DemographicBucket(UNKNOWN_BIRTH_YEAR, UNKNOWN, UNKNOWN)
+
+
+def age_band(birth_year: int | None, today: date | None = None) -> str:
+    if birth_year is None or birth_year == UNKNOWN_BIRTH_YEAR:
+        return UNKNOWN
+    age: int = (today or date.today()).year - birth_year
+    if age < 0:
+        return UNKNOWN
+    return next(label for bound, label in AGE_BANDS if age < bound)
+
+
+def gender_bucket(gender: str | None) -> str:
+    if not gender or not gender.strip():
+        return UNKNOWN
+    normalized: str = gender.strip().lower().replace("-", "")
+    return normalized if normalized in GENDERS else "other"
+
+
+def region(zip_code: str | None) -> str:
+    if not zip_code or not zip_code.strip():
+        return UNKNOWN
+    return ZIP_REGIONS.get(zip_code.strip()[0], UNKNOWN)
+
+
+def demographic_bucket(
+    birth_year: int | None, gender: str | None, zip_code: str | None
+) -> DemographicBucket:
+    """Map raw demographic answers onto the rollup's coarse buckets."""
+    return DemographicBucket(
+        birth_year=UNKNOWN_BIRTH_YEAR if birth_year is None else birth_year,
+        gender=gender_bucket(gender),
+        region=region(zip_code),
+    )
+
+
+def suppress_small_buckets(rows: list[tuple]) -> tuple[list[tuple], int]:
+    """
+    Split breakdown rows of (*bucket, num_ratings, rating_sum) into those large
+    enough to publish and the number of ratings in the suppressed ones.
+    """
+    kept: list[tuple] = []
+    suppressed: int = 0
+    for row in rows:
+        if row[-2] >= DEMOGRAPHIC_MIN_BUCKET_SIZE:
+            kept.append(row)
+        else:
+            suppressed += row[-2]
+    return kept, suppressed
@@ -0,0 +1,167 @@
+from typing import NamedTuple
+import os
+
+import numpy as np
+
+# tags kept in each user's affinity vector
+FEED_AFFINITY_TAGS = int(os.getenv("FEED_AFFINITY_TAGS", "32"))
+# stances in each tag's candidate pool, half most engaging and half newest
+FEED_POOL_SIZE = int(os.getenv("FEED_POOL_SIZE", "400"))
+# a user's strongest tags whose pools supply the candidates of a request
+FEED_CANDIDATE_TAGS = int(os.getenv("FEED_CANDIDATE_TAGS", "8"))
+# candidates scored for a feed restricted to given entities
+FEED_MAX_CANDIDATES = int(os.getenv("FEED_MAX_CANDIDATES", "2000"))
+# share of a stance's score that comes from engagement rather than affinity
+FEED_ENGAGEMENT_WEIGHT = float(os.getenv("FEED_ENGAGEMENT_WEIGHT", "0.25"))
+
+
+class TagAffinityVector(NamedTuple):
+    user_id: int
+    tag_ids: list[int]
+    weights: list[float]
+
+
+class FeedCandidates(NamedTuple):
+    stance_ids: np.ndarray
+    entity_ids: np.ndarray
+    engagement_scores: np.ndarray
+
+
+def build_tag_affinity_vectors(
+    user_ids: np.ndarray,
+    tag_ids: np.ndarray,
+    ratings: np.ndarray,
+    top_k: int = FEED_AFFINITY_TAGS,
+) -> list[TagAffinityVector]:
+    """
+    Affinity vectors from one row per (rating, tag of the rated stance's
+    entity). A rating counts for each tag by how far it is from neutral: 5
+    stars adds 1, 1 star subtracts 1. Each user's sums are scaled to unit
+    length, and their top_k tags by strength are kept, strongest first.
+    """
+    if len(user_ids) == 0:
+        return []
+    users, user_index = np.unique(user_ids, return_inverse=True)
+    tags, tag_index = np.unique(tag_ids, return_inverse=True)
+
+    # sum the weights of each (user, tag) pair
+    pairs, pair_index = np.unique(
+        user_index.astype(np.int64) * len(tags) + tag_index, return_inverse=True
+    )
+    sums: np.ndarray = np.bincount(pair_index, weights=(ratings - 3) / 2.0)
+    pair_user: np.ndarray = pairs // len(tags)
+    pair_tag: np.ndarray = tags[pairs % len(tags)]
+
+    nonzero: np.ndarray = sums != 0
+    sums, pair_user, pair_tag = sums[nonzero], pair_user[nonzero], pair_tag[nonzero]
+    norms: np.ndarray = np.sqrt(
+        np.bincount(pair_user, weights=sums**2, minlength=len(users))
+    )
+    weights: np.ndarray = sums / norms[pair_user]
+
+    # strongest first within each user, then keep each user's first top_k
+    order: np.ndarray = np.lexsort((-np.abs(weights), pair_user))
+    sorted_users: np.ndarray = pair_user[order]
+    starts: np.ndarray = np.searchsorted(sorted_users, np.arange(len(users)))
+    rank: np.ndarray = np.arange(len(order)) - starts[sorted_users]
+    order = order[rank < top_k]
+
+    kept_users: np.ndarray = pair_user[order]
+    bounds: np.ndarray = np.flatnonzero(np.diff(kept_users)) + 1
+    return [
+        TagAffinityVector(
+            int(users[user_group[0]]), tag_group.tolist(), weight_group.tolist()
+        )
+        for user_group, tag_group, weight_group in zip(
+            np.split(kept_users, bounds),
+            np.split(pair_tag[order], bounds),
+            np.split(weights[order], bounds),
+        )
+    ]
+
+
+def pooled_candidates(
+    pools: list[tuple[list[int], list[int], list[float]]],
+) -> FeedCandidates:
+    """Merge the (stance ids, entity ids, engagement scores) of several tag pools."""
+    if not pools:
+        empty = np.array([], dtype=np.int64)
+        return FeedCandidates(empty, empty, np.array([], dtype=np.float64))
+    stance_ids = np.concatenate([np.asarray(p[0], dtype=np.int64) for p in pools])
+    entity_ids = np.concatenate([np.asarray(p[1], dtype=np.int64) for p in pools])
+    engagement = np.concatenate([np.asarray(p[2], dtype=np.float64) for p in pools])
+    # a stance of an entity with several of the tags is in each of their pools
+    stance_ids, first = np.unique(stance_ids, return_index=True)
+    return FeedCandidates(stance_ids, entity_ids[first], engagement[first])
+
+
+def score_candidates(
+    affinity_tag_ids: list[int],
+    affinity_weights: list[float],
+    candidates: FeedCandidates,
+    entity_tag_pairs: list[tuple[int, int]],
+) -> np.ndarray:
+    """
+    Score candidates in one pass: the cosine similarity between the user's
+    affinity vector and the tags of each candidate's entity, plus the
+    candidate's engagement relative to the most engaging candidate.
+    """
+    num_candidates: int = len(candidates.stance_ids)
+    if num_candidates == 0:
+        return np.array([], dtype=np.float64)
+
+    entities, candidate_entity = np.unique(candidates.entity_ids, return_inverse=True)
+    pairs = np.asarray(entity_tag_pairs, dtype=np.int64).reshape(-1, 2)
+    # pairs of entities outside the candidates are ignored
+    pair_entity: np.ndarray = np.searchsorted(entities, pairs[:, 0])
+    known: np.ndarray = (pair_entity < len(entities)) & (
+        entities[np.minimum(pair_entity, len(entities) - 1)] == pairs[:, 0]
+    )
+    pair_entity, pair_tags = pair_entity[known], pairs[known, 1]
+
+    # the weight of each pair's tag in the user's vector, 0 when absent
+    tag_order: np.ndarray = np.argsort(affinity_tag_ids)
+    sorted_tags = np.asarray(affinity_tag_ids, dtype=np.int64)[tag_order]
+    sorted_weights = np.asarray(affinity_weights, dtype=np.float64)[tag_order]
+    pair_weight: np.ndarray = np.zeros(len(pair_tags))
+    if len(sorted_tags):
+        position: np.ndarray = np.minimum(
+            np.searchsorted(sorted_tags, pair_tags), len(sorted_tags) - 1
+        )
+        match: np.ndarray = sorted_tags[position] == pair_tags
+        pair_weight[match] = sorted_weights[position[match]]
+
+    # an entity's tags form a unit vector, so its dot product is a cosine
+    entity_dot: np.ndarray = np.bincount(
+        pair_entity, weights=pair_weight, minlength=len(entities)
+    )
+    entity_tags: np.ndarray = np.bincount(pair_entity, minlength=len(entities))
+    entity_affinity: np.ndarray = entity_dot / np.sqrt(np.maximum(entity_tags, 1))
+
+    engagement: np.ndarray = candidates.engagement_scores
+    top: float = float(engagement.max())
+    relative: np.ndarray = engagement / top if top > 0 else np.zeros(num_candidates)
+    affinity: np.ndarray = entity_affinity[candidate_entity]
+    return (1 - FEED_ENGAGEMENT_WEIGHT) * affinity + FEED_ENGAGEMENT_WEIGHT * relative
+
+
+def rank_candidates(
+    stance_ids: np.ndarray,
+    scores: np.ndarray,
+    limit: int,
+    cursor_score: float | None = None,
+    cursor_id: int | None = None,
+) -> np.ndarray:
+    """
+    Positions of the best limit candidates by score, then by id, both
+    descending; with a cursor, only of those ranked after it.
+    """
+    if cursor_score is not None and cursor_id is not None:
+        after: np.ndarray = (scores < cursor_score) | (
+            (scores == cursor_score) & (stance_ids < cursor_id)
+        )
+        positions: np.ndarray = np.flatnonzero(after)
+    else:
+        positions = np.arange(len(stance_ids))
+    order: np.ndarray = np.lexsort((-stance_ids[positions], -scores[positions]))
+    return positions[order[:limit]]
@@ -0,0 +1,59 @@
+from collections.abc import Iterable
+from datetime import datetime
+
+# every list item keeps its id, whatever fields were asked for
+ALWAYS_INCLUDED = {"id"}
+
+
+def parse_fields(fields: str | None, allowed: Iterable[str]) -> set[str] | None:
+    """
+    The item fields named by a comma separated fields= parameter, or None
+    when every field was requested. Raises ValueError for unknown names.
+    """
+    if fields is None:
+        return None
+    requested: set[str] = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown: set[str] = requested - set(allowed)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return requested | ALWAYS_INCLUDED
+
+
+def wants(fields: set[str] | None, *names: str) -> bool:
+    """Whether any of the named fields was requested."""
+    return fields is None or any(name in fields for name in names)
+
+
+def columns_for(fields: set[str] | None, columns: dict[str, tuple]) -> list | None:
+    """
+    The ORM columns behind the requested fields, given the columns each
+    field reads, or None when whole rows should be loaded.
+    """
+    if fields is None:
+        return None
+    return [
+        column
+        for name, field_columns in columns.items()
+        if name in fields
+        for column in field_columns
+    ]
+
+
+def pick(fields: set[str] | None, values: dict) -> dict:
+    """The requested fields of a list item, to build its response model from."""
+    if fields is None:
+        return values
+    return {name: value for name, value in values.items() if name in fields}
+
+
+def column_fields(row, fields: set[str] | None, columns: dict[str, tuple]) -> dict:
+    """
+    The requested fields of a list item that are read straight from the
+    same-named attributes of its row, with datetimes as ISO strings.
+    """
+    values: dict = {}
+    for name in columns:
+        if wants(fields, name):
+            value = getattr(row, name)
+            values[name] = value.isoformat() if isinstance(value, datetime) else value
+    return values
@@ -0,0 +1,75 @@
+from fastapi import HTTPException, Request, Response, status
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+import hashlib
+import os
+
+# browsers always revalidate; shared caches (CDN) may reuse a public response
+PUBLIC_CACHE_S_MAXAGE = int(os.getenv("PUBLIC_CACHE_S_MAXAGE", "30"))
+
+PUBLIC_CACHE_CONTROL = f"public, max-age=0, s-maxage={PUBLIC_CACHE_S_MAXAGE}"
+PRIVATE_CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(*version) -> str:
+    """Build a weak ETag from the values that determine a response body."""
+    digest = hashlib.sha1(repr(version).encode()).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    # weak comparison: W/"x" and "x" are the same validator
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag.removeprefix("W/") in candidates
+
+
+def _not_modified_since(if_modified_since: str, last_modified: datetime) -> bool:
+    try:
+        since: datetime = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    # http dates have second precision
+    return last_modified.replace(microsecond=0) <= since
+
+
+def check_not_modified(
+    request: Request,
+    response: Response,
+    version: tuple,
+    last_modified: datetime | None = None,
+    public: bool = True,
+) -> None:
+    """
+    Attach validator headers for a read endpoint and answer a matching
+    conditional request with 304 Not Modified, before the body is built.
+
+    version must change whenever the response body would; last_modified should
+    only be passed when every input of the body is covered by that timestamp.
+    """
+    headers: dict[str, str] = {
+        "ETag": make_etag(*version),
+        "Cache-Control": PUBLIC_CACHE_CONTROL if public else PRIVATE_CACHE_CONTROL,
+        "Vary": "Authorization",
+    }
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(
+            last_modified.astimezone(timezone.utc), usegmt=True
+        )
+
+    # If-None-Match takes precedence over If-Modified-Since (RFC 9110 13.2.2)
+    if_none_match: str | None = request.headers.get("if-none-match")
+    if_modified_since: str | None = request.headers.get("if-modified-since")
+    if if_none_match is not None:
+        not_modified = etag_matches(if_none_match, headers["ETag"])
+    elif if_modified_since is not None and last_modified is not None:
+        not_modified = _not_modified_since(if_modified_since, last_modified)
+    else:
+        not_modified = False
+
+    if not_modified:
+        raise HTTPException(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
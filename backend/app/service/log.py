@@ -0,0 +1,185 @@
+from contextvars import ContextVar
+from datetime import datetime, timezone
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+
+from starlette.types import Scope
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# records waiting to be written before new ones are dropped
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# fraction of info and debug records kept on routes without their own rate
+LOG_INFO_SAMPLE_RATE = float(os.getenv("LOG_INFO_SAMPLE_RATE", "1"))
+
+REDACTED = "[redacted]"
+CREDENTIAL_KEY = re.compile(
+    r"pass(word)?|secret|token|authorization|cookie|api[-_]?key", re.IGNORECASE
+)
+# key=value and "key": "value" pairs in messages; an unquoted value runs on
+# past an auth scheme ("Bearer <token>") and through "; "-separated cookies
+CREDENTIAL_PAIR = re.compile(
+    r"""(?P<key>["']?[\w-]*(?:pass(?:word)?|secret|token|authorization|cookie|api[-_]?key)"""
+    r"""[\w-]*["']?\s*[:=]\s*)"""
+    r"""(?P<value>"[^"]*"|'[^']*'|(?:(?:bearer|basic)\s+)?[^\s;]+(?:;\s*[^\s;]+)*)""",
+    re.IGNORECASE,
+)
+
+# attributes every LogRecord has; anything else was passed in extra=
+RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+# set by LogContextMiddleware; FastAPI stores the matched route in the scope,
+# so records know their route once the request has been routed
+current_log_scope: ContextVar[Scope | None] = ContextVar(
+    "current_log_scope", default=None
+)
+
+
+def _route(scope: Scope | None) -> str | None:
+    if scope is None:
+        return None
+    return getattr(scope.get("route"), "path", None)
+
+
+def redact(value):
+    """Replace credential-looking fields of dicts and pairs in strings."""
+    if isinstance(value, dict):
+        return {
+            key: (
+                REDACTED
+                if isinstance(key, str) and CREDENTIAL_KEY.search(key)
+                else redact(item)
+            )
+            for key, item in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [redact(item) for item in value]
+    if isinstance(value, str):
+        return CREDENTIAL_PAIR.sub(lambda m: m.group("key") + REDACTED, value)
+    return value
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with extra= fields and credentials redacted."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: dict = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": redact(record.getMessage()),
+        }
+        for key in ("method", "route", "path"):
+            if getattr(record, key, None) is not None:
+                entry[key] = getattr(record, key)
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES and key not in entry:
+                entry[key] = REDACTED if CREDENTIAL_KEY.search(key) else redact(value)
+        if record.exc_info:
+            entry["exception"] = redact(self.formatException(record.exc_info))
+        return json.dumps(entry, default=str)
+
+
+class RequestContextFilter(logging.Filter):
+    """
+    Tag records with the request they were logged in, and keep only a sample
+    of info and debug records on high-volume routes.
+    """
+
+    def __init__(self, sample_rates: dict[str, float], default_rate: float):
+        super().__init__()
+        self.sample_rates = sample_rates
+        self.default_rate = default_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        scope: Scope | None = current_log_scope.get()
+        route: str | None = _route(scope)
+        if scope is not None:
+            record.method = scope.get("method")
+            record.path = scope.get("path")
+            record.route = route
+        if record.levelno > logging.INFO:
+            return True
+        rate: float = self.sample_rates.get(
+            f"{record.method} {route}" if scope is not None else None,
+            self.default_rate,
+        )
+        return rate >= 1 or random.random() < rate
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that never blocks the caller: records are dropped while the
+    queue is full, and the count is logged once there is room again. Records
+    are enqueued unformatted so that messages are built on the writer thread.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # objects such as ORM instances may lazy-load when rendered, which is
+        # only safe on the thread that owns their session
+        if record.args and not all(
+            isinstance(arg, (str, int, float, bool, type(None)))
+            for arg in (
+                record.args.values() if isinstance(record.args, dict) else record.args
+            )
+        ):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            if self.dropped:
+                self.queue.put_nowait(
+                    logging.makeLogRecord(
+                        {
+                            "name": "app.log",
+                            "levelno": logging.WARNING,
+                            "levelname": "WARNING",
+                            "msg": "Dropped %d log records while the log queue was full",
+                            "args": (self.dropped,),
+                        }
+                    )
+                )
+                self.dropped = 0
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def configure_logging(
+    sample_rates: dict[str, float] | None = None,
+) -> logging.handlers.QueueListener:
+    """
+    Route every record through a bounded queue to a thread that writes JSON
+    lines to stderr. sample_rates maps "METHOD /route/{template}" to the
+    fraction of its info records kept.
+    """
+    log_queue: queue.Queue = queue.Queue(LOG_QUEUE_SIZE)
+    handler = DroppingQueueHandler(log_queue)
+    handler.addFilter(RequestContextFilter(sample_rates or {}, LOG_INFO_SAMPLE_RATE))
+
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(JsonFormatter())
+    listener = logging.handlers.QueueListener(
+        log_queue, output, respect_handler_level=True
+    )
+    listener.start()
+    atexit.register(listener.stop)
+
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(LOG_LEVEL)
+    return listener
@@ -0,0 +1,315 @@
+from collections import Counter
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+import logging
+import os
+import re
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+# log a route that runs one statement shape more often than this in a single
+# request; 0 disables the detector
+METRICS_N_PLUS_ONE_THRESHOLD = int(os.getenv("METRICS_N_PLUS_ONE_THRESHOLD", "10"))
+
+# bearer token a scraper sends to read /metrics; unset, /metrics is not served
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+ROWS_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000)
+CPU_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+RATIO_BUCKETS = (0.05, 0.1, 0.15, 0.2, 0.3, 0.5, 0.75, 1)
+DELAY_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 15, 60, 300, 900, 3600)
+
+# an expanded IN list renders one placeholder per value; collapse it so that
+# lists of any length share a shape
+PLACEHOLDER_LIST = re.compile(r"%\(\w+\)s(?:, %\(\w+\)s)+")
+WHITESPACE = re.compile(r"\s+")
+
+
+@dataclass
+class RequestStats:
+    """SQL work done on behalf of one request."""
+
+    queries: int = 0
+    db_seconds: float = 0.0
+    rows: int = 0
+    pool_wait_seconds: float = 0.0
+    statements: Counter = field(default_factory=Counter)
+
+
+# set by MetricsMiddleware; copied into the worker threads that run sync
+# endpoints, so their queries are added to the request that issued them
+current_request_stats: ContextVar[RequestStats | None] = ContextVar(
+    "current_request_stats", default=None
+)
+
+
+def statement_shape(statement: str) -> str:
+    return PLACEHOLDER_LIST.sub("%(...)s", WHITESPACE.sub(" ", statement).strip())
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed: float = time.perf_counter() - conn.info["query_start"].pop()
+    stats: RequestStats | None = current_request_stats.get()
+    if stats is None:
+        return
+    stats.queries += 1
+    stats.db_seconds += elapsed
+    # client-side cursors have fetched every row by now
+    if cursor.description is not None and cursor.rowcount > 0:
+        stats.rows += cursor.rowcount
+    if METRICS_N_PLUS_ONE_THRESHOLD > 0:
+        stats.statements[statement_shape(statement)] += 1
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Count queries, rows and time per request on every connection of engine."""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that adds the time spent waiting for a connection to the request."""
+
+    def connect(self):
+        start: float = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            stats: RequestStats | None = current_request_stats.get()
+            if stats is not None:
+                stats.pool_wait_seconds += time.perf_counter() - start
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Histogram:
+    """Thread-safe Prometheus histogram with a fixed set of label names."""
+
+    def __init__(
+        self, name: str, help: str, label_names: tuple[str, ...], buckets: tuple
+    ):
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self.buckets = buckets
+        # label values -> (cumulative bucket counts, sum, count)
+        self._series: dict[tuple[str, ...], tuple[list[int], float, int]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: tuple[str, ...], value: float) -> None:
+        with self._lock:
+            counts, total, count = self._series.get(
+                labels, ([0] * len(self.buckets), 0.0, 0)
+            )
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._series[labels] = (counts, total + value, count + 1)
+
+    def render(self) -> list[str]:
+        lines: list[str] = [
+            f"# HELP {self.name} {self.help}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self._lock:
+            series = [
+                (labels, list(counts), total, count)
+                for labels, (counts, total, count) in self._series.items()
+            ]
+        for labels, counts, total, count in sorted(series):
+            label_text: str = ",".join(
+                f'{name}="{_escape(value)}"'
+                for name, value in zip(self.label_names, labels)
+            )
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(
+                    f'{self.name}_bucket{{{label_text},le="{bound}"}} {bucket_count}'
+                )
+            lines.append(f'{self.name}_bucket{{{label_text},le="+Inf"}} {count}')
+            lines.append(f"{self.name}_sum{{{label_text}}} {total}")
+            lines.append(f"{self.name}_count{{{label_text}}} {count}")
+        return lines
+
+
+class Gauge:
+    """Thread-safe Prometheus gauge without labels; not rendered until set."""
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._value: float | None = None
+        self._lock = threading.Lock()
+
+    def set(self, value: float) -> None:
+        with self._lock:
+            self._value = value
+
+    def render(self) -> list[str]:
+        with self._lock:
+            value = self._value
+        if value is None:
+            return []
+        return [
+            f"# HELP {self.name} {self.help}",
+            f"# TYPE {self.name} gauge",
+            f"{self.name} {value}",
+        ]
+
+
+REQUEST_LABELS = ("method", "route")
+
+request_latency = Histogram(
+    "http_request_duration_seconds",
+    "Time to complete a request.",
+    (*REQUEST_LABELS, "status"),
+    LATENCY_BUCKETS,
+)
+request_queries = Histogram(
+    "http_request_db_queries",
+    "SQL statements run per request.",
+    REQUEST_LABELS,
+    COUNT_BUCKETS,
+)
+request_db_time = Histogram(
+    "http_request_db_duration_seconds",
+    "Time spent executing SQL per request.",
+    REQUEST_LABELS,
+    LATENCY_BUCKETS,
+)
+request_rows = Histogram(
+    "http_request_db_rows",
+    "Rows returned by SQL statements per request.",
+    REQUEST_LABELS,
+    ROWS_BUCKETS,
+)
+request_pool_wait = Histogram(
+    "http_request_db_pool_wait_seconds",
+    "Time spent waiting for a database connection per request.",
+    REQUEST_LABELS,
+    LATENCY_BUCKETS,
+)
+
+# stale cache entries refreshed in the background, outside any request;
+# labelled by the path pattern of the cache rule
+refresh_latency = Histogram(
+    "response_cache_refresh_duration_seconds",
+    "Time to refresh a stale cached response in the background.",
+    ("rule",),
+    LATENCY_BUCKETS,
+)
+refresh_queries = Histogram(
+    "response_cache_refresh_db_queries",
+    "SQL statements run per background refresh of a cached response.",
+    ("rule",),
+    COUNT_BUCKETS,
+)
+
+# source is "response" for bodies compressed per request, "cache" for the
+# precompressed copies stored with cached responses
+COMPRESSION_LABELS = ("encoding", "level", "source")
+
+compression_cpu = Histogram(
+    "http_response_compression_cpu_seconds",
+    "CPU time spent compressing one response body.",
+    COMPRESSION_LABELS,
+    CPU_BUCKETS,
+)
+compression_ratio = Histogram(
+    "http_response_compression_ratio",
+    "Compressed size of a response body as a fraction of its original size.",
+    COMPRESSION_LABELS,
+    RATIO_BUCKETS,
+)
+# result is "processed", "retried" or "dead"
+outbox_event_delay = Histogram(
+    "outbox_event_delay_seconds",
+    "Time from an outbox event being written to an attempt at processing it.",
+    ("topic", "result"),
+    DELAY_BUCKETS,
+)
+HISTOGRAMS = (
+    request_latency,
+    request_queries,
+    request_db_time,
+    request_rows,
+    request_pool_wait,
+    refresh_latency,
+    refresh_queries,
+    compression_cpu,
+    compression_ratio,
+    outbox_event_delay,
+)
+
+# set by the outbox worker
+outbox_pending = Gauge(
+    "outbox_pending_events", "Outbox events waiting to be processed."
+)
+outbox_oldest_pending = Gauge(
+    "outbox_oldest_pending_event_age_seconds",
+    "Age of the oldest outbox event waiting to be processed.",
+)
+outbox_dead = Gauge("outbox_dead_events", "Outbox events dead-lettered after failing.")
+GAUGES = (outbox_pending, outbox_oldest_pending, outbox_dead)
+
+
+def record_request(
+    method: str, route: str, status: int, seconds: float, stats: RequestStats
+) -> None:
+    labels: tuple[str, str] = (method, route)
+    request_latency.observe((*labels, str(status)), seconds)
+    request_queries.observe(labels, stats.queries)
+    request_db_time.observe(labels, stats.db_seconds)
+    request_rows.observe(labels, stats.rows)
+    request_pool_wait.observe(labels, stats.pool_wait_seconds)
+
+    if METRICS_N_PLUS_ONE_THRESHOLD > 0 and stats.statements:
+        shape, count = stats.statements.most_common(1)[0]
+        if count > METRICS_N_PLUS_ONE_THRESHOLD:
+            logging.warning(
+                f"Possible N+1 in {method} {route}: {count} runs of {shape[:300]}"
+            )
+
+
+def record_cache_refresh(rule: str, seconds: float, stats: RequestStats) -> None:
+    refresh_latency.observe((rule,), seconds)
+    refresh_queries.observe((rule,), stats.queries)
+
+
+def record_compression(
+    encoding: str, level: int, source: str, cpu_seconds: float, ratio: float
+) -> None:
+    labels: tuple[str, str, str] = (encoding, str(level), source)
+    compression_cpu.observe(labels, cpu_seconds)
+    compression_ratio.observe(labels, ratio)
+
+
+def record_outbox_event(topic: str, result: str, delay_seconds: float) -> None:
+    outbox_event_delay.observe((topic, result), delay_seconds)
+
+
+def record_outbox_lag(pending: int, oldest_pending_seconds: float, dead: int) -> None:
+    outbox_pending.set(pending)
+    outbox_oldest_pending.set(oldest_pending_seconds)
+    outbox_dead.set(dead)
+
+
+def render_metrics() -> str:
+    """The metrics of this process in the Prometheus text format."""
+    lines: list[str] = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    for gauge in GAUGES:
+        lines.extend(gauge.render())
+    return "\n".join(lines) + "\n"
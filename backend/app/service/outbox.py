@@ -0,0 +1,144 @@
+from collections.abc import Callable
+from datetime import datetime, timezone
+from sqlalchemy.orm import Session
+import logging
+import os
+import time
+
+from app.database.connect import SessionLocal
+from app.database.models.outbox_event import OutboxEvent
+from app.database import outbox as outbox_db
+from app.database import stance as stance_db
+from app.database.unit_of_work import unit_of_work
+from app.service.metrics import record_outbox_event, record_outbox_lag
+
+# events claimed, processed and committed together by one worker transaction
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+# how long the worker waits before polling again once the outbox is drained
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "1"))
+# failed attempts before an event is dead-lettered
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+# delay before the first retry, doubled for every further one up to the max
+OUTBOX_RETRY_SECONDS = float(os.getenv("OUTBOX_RETRY_SECONDS", "5"))
+OUTBOX_RETRY_MAX_SECONDS = float(os.getenv("OUTBOX_RETRY_MAX_SECONDS", "600"))
+# seconds between refreshes of the lag gauges
+OUTBOX_LAG_CHECK_SECONDS = float(os.getenv("OUTBOX_LAG_CHECK_SECONDS", "15"))
+
+# a handler gets every claimed event of its topic, so that it can do the work
+# of many events at once; it runs in the worker's transaction and must not
+# commit, and it must be safe to run again for the same events
+OutboxHandler = Callable[[Session, list[OutboxEvent]], None]
+
+
+def refresh_engagement_scores(db: Session, events: list[OutboxEvent]) -> None:
+    stance_db.refresh_engagement_scores(
+        db, sorted({event.aggregate_id for event in events})
+    )
+
+
+# topics without a handler are consumed without doing anything, so that
+# derived data can start to follow a topic without touching its producers
+OUTBOX_HANDLERS: dict[str, OutboxHandler] = {
+    outbox_db.RATING_CHANGED: refresh_engagement_scores,
+}
+
+
+def retry_delay(attempts: int) -> float:
+    """Seconds to wait before the next attempt at an event that failed attempts times."""
+    # the exponent is bounded so that a high OUTBOX_MAX_ATTEMPTS cannot overflow
+    doublings: int = min(max(attempts - 1, 0), 64)
+    return min(OUTBOX_RETRY_SECONDS * 2.0**doublings, OUTBOX_RETRY_MAX_SECONDS)
+
+
+def _run_handler(
+    db: Session, handler: OutboxHandler, events: list[OutboxEvent]
+) -> Exception | None:
+    """Run a handler in a savepoint, so that a failure undoes only its work."""
+    try:
+        with db.begin_nested():
+            handler(db, events)
+        return None
+    except Exception as e:
+        return e
+
+
+def process_outbox_batch(db: Session, batch_size: int) -> int:
+    """
+    Claim up to batch_size due events and run their handlers, in one
+    transaction. When a topic's events fail together they are retried one by
+    one, and only those that fail on their own are scheduled for a retry, or
+    dead-lettered after OUTBOX_MAX_ATTEMPTS. Returns the number claimed.
+    """
+    with unit_of_work(db):
+        events: list[OutboxEvent] = outbox_db.claim_outbox_events(db, batch_size)
+        by_topic: dict[str, list[OutboxEvent]] = {}
+        for event in events:
+            by_topic.setdefault(event.topic, []).append(event)
+
+        now: datetime = datetime.now(timezone.utc)
+        done: list[int] = []
+        for topic, topic_events in by_topic.items():
+            handler: OutboxHandler | None = OUTBOX_HANDLERS.get(topic)
+            failed: set[int] = set()
+            if (
+                handler is not None
+                and _run_handler(db, handler, topic_events) is not None
+            ):
+                for event in topic_events:
+                    error = _run_handler(db, handler, [event])
+                    if error is None:
+                        continue
+                    failed.add(event.id)
+                    attempts: int = event.attempts + 1
+                    retry_after: float | None = (
+                        retry_delay(attempts)
+                        if attempts < OUTBOX_MAX_ATTEMPTS
+                        else None
+                    )
+                    logging.error(
+                        f"Outbox event {event.id} ({topic}) failed "
+                        f"attempt {attempts}: {error}"
+                    )
+                    outbox_db.fail_outbox_event(db, event.id, str(error), retry_after)
+                    record_outbox_event(
+                        topic,
+                        "dead" if retry_after is None else "retried",
+                        (now - event.created_at).total_seconds(),
+                    )
+
+            for event in topic_events:
+                if event.id not in failed:
+                    done.append(event.id)
+                    record_outbox_event(
+                        topic, "processed", (now - event.created_at).total_seconds()
+                    )
+        outbox_db.delete_outbox_events(db, done)
+    return len(events)
+
+
+def run_outbox_worker(batch_size: int = OUTBOX_BATCH_SIZE, drain: bool = False) -> None:
+    """
+    Process outbox events until interrupted, or with drain until none are due.
+    Several workers may run side by side; each claims different events.
+    """
+    last_lag_check: float | None = None
+    while True:
+        db: Session = SessionLocal()
+        claimed: int = 0
+        try:
+            claimed = process_outbox_batch(db, batch_size)
+            if (
+                last_lag_check is None
+                or time.monotonic() - last_lag_check >= OUTBOX_LAG_CHECK_SECONDS
+            ):
+                lag: outbox_db.OutboxLag = outbox_db.get_outbox_lag(db)
+                record_outbox_lag(lag.pending, lag.oldest_pending_seconds, lag.dead)
+                last_lag_check = time.monotonic()
+        except Exception as e:
+            logging.error(f"Outbox batch failed: {e}")
+        finally:
+            db.close()
+        if claimed < batch_size:
+            if drain:
+                return
+            time.sleep(OUTBOX_POLL_SECONDS)
@@ -0,0 +1,71 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+import os
+import threading
+import time
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() != "false"
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+# behind a reverse proxy, the client address is the last X-Forwarded-For hop
+RATE_LIMIT_TRUST_FORWARDED_FOR = (
+    os.getenv("RATE_LIMIT_TRUST_FORWARDED_FOR", "false").lower() == "true"
+)
+
+
+class RateLimitBackend(ABC):
+    """
+    Token buckets keyed by client and rule. A bucket holds up to burst tokens
+    and refills at rate tokens per second; each request takes one.
+
+    The in-memory backend is local to one worker process, so the effective
+    limit is multiplied by the number of workers. A shared backend (e.g. Redis
+    with an atomic script) implements the same interface to enforce one limit
+    across all of them.
+    """
+
+    @abstractmethod
+    def take(self, key: str, rate: float, burst: int) -> float:
+        """
+        Take a token from the bucket. Returns 0 if one was available, or else
+        the number of seconds until one will be.
+        """
+        ...
+
+    @abstractmethod
+    def clear(self) -> None: ...
+
+
+class InMemoryRateLimitBackend(RateLimitBackend):
+    """
+    Thread-safe buckets in an LRU of at most max_keys clients; an evicted
+    client starts again from a full bucket.
+    """
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        # key -> (tokens, monotonic time of last update)
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rate: float, burst: int) -> float:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                retry_after = 0.0
+            else:
+                self._buckets[key] = (tokens, now)
+                retry_after = (1 - tokens) / rate
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return retry_after
+
+    def clear(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+
+rate_limiter: RateLimitBackend = InMemoryRateLimitBackend()
@@ -0,0 +1,213 @@
+from abc import ABC, abstractmethod
+from collections.abc import AsyncIterator, Callable
+from dataclasses import asdict, dataclass
+import asyncio
+import json
+import os
+import threading
+import time
+import weakref
+
+# shortest time between two batches sent to one stream
+RATING_EVENTS_INTERVAL_SECONDS = float(os.getenv("RATING_EVENTS_INTERVAL_SECONDS", "1"))
+# comment lines sent on idle streams, so proxies and clients keep them open
+RATING_EVENTS_KEEPALIVE_SECONDS = float(
+    os.getenv("RATING_EVENTS_KEEPALIVE_SECONDS", "15")
+)
+# how long EventSource clients wait before reconnecting
+RATING_EVENTS_RETRY_MS = int(os.getenv("RATING_EVENTS_RETRY_MS", "3000"))
+
+
+@dataclass(frozen=True)
+class RatingUpdate:
+    entity_id: int
+    stance_id: int
+    num_ratings: int
+    average_rating: float | None
+    rating_histogram: tuple[int, ...]  # counts of 1 to 5 star ratings
+
+
+def stance_channel(stance_id: int) -> str:
+    return f"stance:{stance_id}"
+
+
+def entity_channel(entity_id: int) -> str:
+    return f"entity:{entity_id}"
+
+
+class Subscription:
+    """
+    The updates waiting to be sent to one stream. Updates may be offered from
+    any thread; a newer update of a stance replaces the one still waiting.
+    """
+
+    def __init__(self):
+        self._pending: dict[int, RatingUpdate] = {}
+        self._lock = threading.Lock()
+        # bound to the stream's event loop on its first wait
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._ready: asyncio.Event | None = None
+
+    def offer(self, update: RatingUpdate, replace: bool = True) -> None:
+        with self._lock:
+            if replace or update.stance_id not in self._pending:
+                self._pending[update.stance_id] = update
+            loop, ready = self._loop, self._ready
+        if loop is not None:
+            loop.call_soon_threadsafe(ready.set)
+
+    async def next_batch(self, timeout: float) -> list[RatingUpdate]:
+        """The waiting updates, or [] when none arrived within timeout seconds."""
+        with self._lock:
+            if self._ready is None:
+                self._loop = asyncio.get_running_loop()
+                self._ready = asyncio.Event()
+        deadline: float = time.monotonic() + timeout
+        while True:
+            self._ready.clear()
+            with self._lock:
+                batch: list[RatingUpdate] = list(self._pending.values())
+                self._pending.clear()
+            if batch:
+                return batch
+            try:
+                await asyncio.wait_for(
+                    self._ready.wait(), max(0.0, deadline - time.monotonic())
+                )
+            except asyncio.TimeoutError:
+                return []
+
+
+class RatingEventBackend(ABC):
+    """
+    Carries updates from the worker that wrote a rating to every worker.
+
+    The in-memory backend only reaches streams of its own process. A shared
+    backend (e.g. Redis pub/sub or Postgres LISTEN/NOTIFY) implements the same
+    interface so that streams on every worker see every write.
+    """
+
+    @abstractmethod
+    def start(self, deliver: Callable[[RatingUpdate], None]) -> None:
+        """Begin passing updates published by any worker to deliver."""
+        ...
+
+    @abstractmethod
+    def publish(self, update: RatingUpdate) -> None: ...
+
+    @abstractmethod
+    def stop(self) -> None: ...
+
+
+class InMemoryRatingEventBackend(RatingEventBackend):
+    def __init__(self):
+        self._deliver: Callable[[RatingUpdate], None] | None = None
+
+    def start(self, deliver: Callable[[RatingUpdate], None]) -> None:
+        self._deliver = deliver
+
+    def publish(self, update: RatingUpdate) -> None:
+        if self._deliver is not None:
+            self._deliver(update)
+
+    def stop(self) -> None:
+        self._deliver = None
+
+
+class RatingBroker:
+    """
+    Live rating updates. Rating writes publish the new aggregates of a stance,
+    which are handed to the streams subscribed to the stance or its entity.
+    """
+
+    def __init__(self, backend: RatingEventBackend):
+        self.backend = backend
+        # streams that end without unsubscribing are dropped once collected
+        self._subscriptions: dict[str, weakref.WeakSet[Subscription]] = {}
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        self.backend.start(self._deliver)
+
+    def stop(self) -> None:
+        self.backend.stop()
+
+    def publish(self, update: RatingUpdate) -> None:
+        self.backend.publish(update)
+
+    def subscribe(self, channel: str) -> Subscription:
+        subscription = Subscription()
+        with self._lock:
+            self._subscriptions.setdefault(channel, weakref.WeakSet()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, channel: str, subscription: Subscription) -> None:
+        with self._lock:
+            subscriptions = self._subscriptions.get(channel)
+            if subscriptions is None:
+                return
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self._subscriptions[channel]
+
+    def _deliver(self, update: RatingUpdate) -> None:
+        with self._lock:
+            subscriptions: list[Subscription] = [
+                subscription
+                for channel in (
+                    stance_channel(update.stance_id),
+                    entity_channel(update.entity_id),
+                )
+                for subscription in self._subscriptions.get(channel, ())
+            ]
+        for subscription in subscriptions:
+            subscription.offer(update)
+
+
+rating_broker = RatingBroker(InMemoryRatingEventBackend())
+
+
+def publish_rating_update(
+    entity_id: int,
+    stance_id: int,
+    num_ratings: int,
+    average_rating: float | None,
+    rating_histogram: list[int],
+) -> None:
+    """Publish a stance's aggregates after a rating write has committed."""
+    rating_broker.publish(
+        RatingUpdate(
+            entity_id=entity_id,
+            stance_id=stance_id,
+            num_ratings=num_ratings,
+            average_rating=average_rating,
+            rating_histogram=tuple(rating_histogram),
+        )
+    )
+
+
+def _format_event(update: RatingUpdate) -> str:
+    return f"event: rating\ndata: {json.dumps(asdict(update))}\n\n"
+
+
+async def stream_rating_events(
+    channel: str, subscription: Subscription
+) -> AsyncIterator[str]:
+    """
+    Server-sent events for one subscription, until the client disconnects.
+    At most one batch is sent per interval; updates arriving in between are
+    coalesced into the next, keeping only the latest of each stance.
+    """
+    try:
+        yield f"retry: {RATING_EVENTS_RETRY_MS}\n\n"
+        while True:
+            batch: list[RatingUpdate] = await subscription.next_batch(
+                RATING_EVENTS_KEEPALIVE_SECONDS
+            )
+            if not batch:
+                yield ": keepalive\n\n"
+                continue
+            yield "".join(_format_event(update) for update in batch)
+            await asyncio.sleep(RATING_EVENTS_INTERVAL_SECONDS)
+    finally:
+        rating_broker.unsubscribe(channel, subscription)
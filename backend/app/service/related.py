@@ -0,0 +1,253 @@
+from collections.abc import Iterable
+from typing import NamedTuple
+import logging
+import os
+import re
+import threading
+import time
+import zlib
+
+import numpy as np
+
+# directory of the index built by app.scripts.build_related_index
+RELATED_INDEX_DIR = os.getenv("RELATED_INDEX_DIR", "related_index")
+# how often the API looks for a newly built index
+RELATED_INDEX_CHECK_SECONDS = float(os.getenv("RELATED_INDEX_CHECK_SECONDS", "60"))
+# neighbours stored per entity and per stance
+RELATED_NEIGHBOURS = int(os.getenv("RELATED_NEIGHBOURS", "20"))
+# dimensions text and tags are hashed into
+RELATED_TEXT_DIMENSIONS = int(os.getenv("RELATED_TEXT_DIMENSIONS", "512"))
+RELATED_TAG_DIMENSIONS = int(os.getenv("RELATED_TAG_DIMENSIONS", "128"))
+# share of similarity that comes from shared tags rather than shared words
+RELATED_TAG_WEIGHT = float(os.getenv("RELATED_TAG_WEIGHT", "0.35"))
+
+# buckets words are counted in to weigh them by inverse document frequency
+IDF_BUCKETS = 1 << 20
+CURRENT_FILE = "CURRENT"
+ENTITIES = "entities"
+STANCES = "stances"
+
+WORD = re.compile(r"[a-z0-9]{2,}")
+STOP_WORDS = frozenset(
+    "the and for are but not you all any can had her was one our out has him "
+    "his how its may new now old see two who did get let put say she too use "
+    "that with have this will your from they been were said each which their "
+    "there what about would into than them then these some could other more "
+    "also just should only over such very when where while".split()
+)
+
+
+def _hashes(tokens: Iterable[str]) -> np.ndarray:
+    # crc32 rather than hash(), which differs between processes
+    return np.fromiter(
+        (zlib.crc32(token.encode()) for token in tokens), dtype=np.uint32
+    )
+
+
+def tokenize(text: str | None) -> list[str]:
+    if not text:
+        return []
+    return [word for word in WORD.findall(text.lower()) if word not in STOP_WORDS]
+
+
+def _hash_into(vector: np.ndarray, hashes: np.ndarray, weights: np.ndarray) -> None:
+    """Add weighted features to a vector by the signed hashing trick."""
+    signs: np.ndarray = np.where(hashes & 1, 1.0, -1.0)
+    np.add.at(vector, (hashes >> 1) % len(vector), signs * weights)
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms: np.ndarray = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+class TextHasher:
+    """
+    TF-IDF vectors of texts, hashed into a fixed number of dimensions so that
+    no vocabulary has to be kept. Count every text first, then transform.
+    """
+
+    def __init__(self, dimensions: int = RELATED_TEXT_DIMENSIONS):
+        self.dimensions = dimensions
+        self.documents = 0
+        self.document_counts = np.zeros(IDF_BUCKETS, dtype=np.int64)
+
+    def count(self, text: str | None) -> None:
+        self.documents += 1
+        buckets: np.ndarray = np.unique(_hashes(tokenize(text)) % IDF_BUCKETS)
+        self.document_counts[buckets] += 1
+
+    def transform(self, texts: list[str | None]) -> np.ndarray:
+        idf: np.ndarray = np.log((1 + self.documents) / (1 + self.document_counts)) + 1
+        vectors: np.ndarray = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            hashes: np.ndarray = _hashes(tokenize(text))
+            if len(hashes):
+                _hash_into(vectors[row], hashes, idf[hashes % IDF_BUCKETS])
+        return _normalize(vectors)
+
+
+def tag_vectors(
+    ids: np.ndarray,
+    entity_tag_pairs: np.ndarray,
+    item_entities: np.ndarray | None = None,
+    dimensions: int = RELATED_TAG_DIMENSIONS,
+) -> np.ndarray:
+    """
+    Unit vectors of the tags of each entity in ids, or with item_entities of
+    the entity of each item, from (entity id, tag id) pairs.
+    """
+    lookup: np.ndarray = ids if item_entities is None else item_entities
+    result: np.ndarray = np.zeros((len(lookup), dimensions), dtype=np.float32)
+    if len(entity_tag_pairs) == 0:
+        return result
+    entities: np.ndarray = np.unique(entity_tag_pairs[:, 0])
+    vectors: np.ndarray = np.zeros((len(entities), dimensions), dtype=np.float32)
+    rows: np.ndarray = np.searchsorted(entities, entity_tag_pairs[:, 0])
+    hashes: np.ndarray = _hashes(str(tag) for tag in entity_tag_pairs[:, 1])
+    signs: np.ndarray = np.where(hashes & 1, 1.0, -1.0).astype(np.float32)
+    np.add.at(vectors, (rows, (hashes >> 1) % dimensions), signs)
+    vectors = _normalize(vectors)
+
+    position: np.ndarray = np.minimum(
+        np.searchsorted(entities, lookup), len(entities) - 1
+    )
+    tagged: np.ndarray = entities[position] == lookup
+    result[tagged] = vectors[position[tagged]]
+    return result
+
+
+def combine(text: np.ndarray, tags: np.ndarray, tag_weight: float) -> np.ndarray:
+    """
+    Concatenate unit text and tag vectors so that the dot product of two
+    combined vectors blends their text and tag cosines by tag_weight.
+    """
+    return np.hstack(
+        [text * np.sqrt(1 - tag_weight), tags * np.sqrt(tag_weight)]
+    ).astype(np.float32)
+
+
+class Neighbours(NamedTuple):
+    ids: np.ndarray  # (n, k) neighbour ids, -1 where there are fewer than k
+    scores: np.ndarray  # (n, k) cosine similarities, best first
+
+
+def nearest_neighbours(
+    query_ids: np.ndarray,
+    query_vectors: np.ndarray,
+    candidate_ids: np.ndarray,
+    candidate_vectors: np.ndarray,
+    k: int,
+    chunk_size: int = 1024,
+) -> Neighbours:
+    """The k most similar candidates of each query, leaving out the query itself."""
+    ids: np.ndarray = np.full((len(query_ids), k), -1, dtype=np.int32)
+    scores: np.ndarray = np.zeros((len(query_ids), k), dtype=np.float16)
+    keep: int = min(k, len(candidate_ids))
+    for start in range(0, len(query_ids), chunk_size):
+        end: int = start + chunk_size
+        similarity: np.ndarray = query_vectors[start:end] @ candidate_vectors.T
+        # nothing is its own neighbour, and unrelated items are not neighbours
+        similarity[query_ids[start:end, None] == candidate_ids[None, :]] = -np.inf
+        similarity[similarity <= 0] = -np.inf
+        if keep == 0:
+            continue
+        top: np.ndarray = np.argpartition(-similarity, keep - 1, axis=1)[:, :keep]
+        top_scores: np.ndarray = np.take_along_axis(similarity, top, axis=1)
+        order: np.ndarray = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        found: np.ndarray = np.isfinite(top_scores)
+        ids[start:end, :keep] = np.where(found, candidate_ids[top], -1)
+        scores[start:end, :keep] = np.where(found, top_scores, 0)
+    return Neighbours(ids, scores)
+
+
+class RelatedIndex:
+    """
+    Precomputed nearest neighbours of entities or stances, as three arrays:
+    sorted item ids, and each item's neighbour ids and scores. Loaded with
+    memory mapping, so processes share the pages and load nothing up front.
+    """
+
+    def __init__(self, ids: np.ndarray, neighbours: Neighbours):
+        self.ids = ids
+        self.neighbours = neighbours
+
+    def save(self, directory: str) -> None:
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, "ids.npy"), self.ids)
+        np.save(os.path.join(directory, "neighbours.npy"), self.neighbours.ids)
+        np.save(os.path.join(directory, "scores.npy"), self.neighbours.scores)
+
+    @classmethod
+    def load(cls, directory: str) -> "RelatedIndex":
+        def load(name: str) -> np.ndarray:
+            return np.load(os.path.join(directory, name), mmap_mode="r")
+
+        return cls(
+            load("ids.npy"), Neighbours(load("neighbours.npy"), load("scores.npy"))
+        )
+
+    def lookup(self, item_id: int, limit: int) -> list[tuple[int, float]]:
+        """An item's neighbours and their scores, best first."""
+        row: int = int(np.searchsorted(self.ids, item_id))
+        if row == len(self.ids) or self.ids[row] != item_id:
+            return []
+        return [
+            (int(neighbour), float(score))
+            for neighbour, score in zip(
+                self.neighbours.ids[row, :limit], self.neighbours.scores[row, :limit]
+            )
+            if neighbour >= 0
+        ]
+
+
+def publish_related_index(
+    root: str, version: str, indexes: dict[str, RelatedIndex]
+) -> None:
+    """
+    Write a version of the index next to the current one and switch to it.
+    Readers follow the CURRENT file, which is replaced atomically.
+    """
+    for kind, index in indexes.items():
+        index.save(os.path.join(root, version, kind))
+    current: str = os.path.join(root, CURRENT_FILE)
+    with open(current + ".tmp", "w") as f:
+        f.write(version)
+    os.replace(current + ".tmp", current)
+
+
+_loaded: dict[str, RelatedIndex] = {}
+_loaded_version: str | None = None
+_checked_at: float | None = None
+_lock = threading.Lock()
+
+
+def get_related_index(kind: str) -> RelatedIndex | None:
+    """The current index of entities or stances, or None before one is built."""
+    global _loaded_version, _checked_at
+    with _lock:
+        if _checked_at is None or (
+            time.monotonic() - _checked_at >= RELATED_INDEX_CHECK_SECONDS
+        ):
+            _checked_at = time.monotonic()
+            try:
+                with open(os.path.join(RELATED_INDEX_DIR, CURRENT_FILE)) as f:
+                    version: str | None = f.read().strip()
+            except FileNotFoundError:
+                version = None
+            if version != _loaded_version:
+                _loaded.clear()
+                _loaded_version = version
+                if version is not None:
+                    try:
+                        for name in (ENTITIES, STANCES):
+                            _loaded[name] = RelatedIndex.load(
+                                os.path.join(RELATED_INDEX_DIR, version, name)
+                            )
+                        logging.info(f"Loaded related index {version}")
+                    except Exception as e:
+                        _loaded.clear()
+                        logging.error(f"Error loading related index {version}: {e}")
+        return _loaded.get(kind)
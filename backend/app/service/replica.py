@@ -0,0 +1,88 @@
+from sqlalchemy import text
+import asyncio
+import logging
+import os
+import time
+
+from app.database.connect import replica_engine
+
+# seconds after a client's last write during which its reads go to the primary
+REPLICA_READ_YOUR_WRITES_SECONDS = float(
+    os.getenv("REPLICA_READ_YOUR_WRITES_SECONDS", "5")
+)
+# reads fall back to the primary while the replica is further behind than this
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "2"))
+REPLICA_LAG_CHECK_SECONDS = float(os.getenv("REPLICA_LAG_CHECK_SECONDS", "1"))
+
+READ_PRIMARY_COOKIE = "read_primary_until"
+SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+# no replay lag when every received change has been applied; an idle primary
+# produces no new transactions, so the last replay timestamp grows stale
+LAG_SQL = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+    """)
+
+# replay lag seen by the last check; None until a check succeeds, and after
+# one fails, so that reads stay on the primary while the replica is unknown
+replica_lag_seconds: float | None = None
+
+
+def replica_available() -> bool:
+    return (
+        replica_engine is not None
+        and replica_lag_seconds is not None
+        and replica_lag_seconds <= REPLICA_MAX_LAG_SECONDS
+    )
+
+
+def should_read_from_replica(method: str, read_primary_until: str | None) -> bool:
+    """
+    Whether a request can be served from the replica: it must be safe, its
+    client must not have written recently, and the replica must be current.
+    """
+    if method not in SAFE_METHODS or not replica_available():
+        return False
+    if read_primary_until:
+        try:
+            if float(read_primary_until) > time.time():
+                return False
+        except ValueError:
+            pass
+    return True
+
+
+def check_replica_lag() -> float:
+    with replica_engine.connect() as connection:
+        return float(connection.execute(LAG_SQL).scalar() or 0)
+
+
+async def run_replica_lag_monitor() -> None:
+    """Track the replica's replay lag, until cancelled."""
+    global replica_lag_seconds
+    if replica_engine is None:
+        return
+    while True:
+        was_available: bool = replica_available()
+        try:
+            replica_lag_seconds = await asyncio.to_thread(check_replica_lag)
+        except Exception as e:
+            replica_lag_seconds = None
+            if was_available:
+                logging.error(f"Replica lag check failed: {e}")
+        if (
+            was_available
+            and not replica_available()
+            and replica_lag_seconds is not None
+        ):
+            logging.warning(
+                "Replica behind by %s seconds; reading from the primary",
+                replica_lag_seconds,
+            )
+        elif replica_available() and not was_available:
+            logging.info("Replica caught up; reading from the replica")
+        await asyncio.sleep(REPLICA_LAG_CHECK_SECONDS)
@@ -0,0 +1,126 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass, field
+import os
+import threading
+import time
+
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "15"))
+RESPONSE_CACHE_STALE_SECONDS = float(os.getenv("RESPONSE_CACHE_STALE_SECONDS", "60"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "10000"))
+
+
+@dataclass
+class CachedResponse:
+    status: int
+    headers: list[tuple[bytes, bytes]]
+    body: bytes
+    stored_at: float
+    fresh_until: float
+    stale_until: float
+    # the body compressed once per content coding, so hits are not recompressed
+    encoded: dict[str, bytes] = field(default_factory=dict)
+
+    def is_fresh(self, now: float) -> bool:
+        return now < self.fresh_until
+
+    def is_usable(self, now: float) -> bool:
+        return now < self.stale_until
+
+    def header(self, name: bytes) -> bytes | None:
+        return next((v for k, v in self.headers if k.lower() == name), None)
+
+
+class ResponseCacheBackend(ABC):
+    """
+    Storage for cached responses, keyed by request path and query string.
+
+    The in-memory backend is local to one worker process. A shared backend
+    (e.g. Redis) implements the same interface so that every worker sees the
+    same entries and invalidations.
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> CachedResponse | None: ...
+
+    @abstractmethod
+    def set(self, key: str, entry: CachedResponse) -> None: ...
+
+    @abstractmethod
+    def delete_prefix(self, *prefixes: str) -> int:
+        """Delete every entry whose key starts with one of the prefixes."""
+        ...
+
+    @abstractmethod
+    def clear(self) -> None: ...
+
+
+class InMemoryResponseCacheBackend(ResponseCacheBackend):
+    """Thread-safe LRU cache; entries are dropped once past their stale window."""
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, CachedResponse] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> CachedResponse | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if not entry.is_usable(time.time()):
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, entry: CachedResponse) -> None:
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete_prefix(self, *prefixes: str) -> int:
+        with self._lock:
+            keys = [k for k in self._entries if k.startswith(prefixes)]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+response_cache: ResponseCacheBackend = InMemoryResponseCacheBackend()
+
+
+def cache_key(path: str, query_string: str) -> str:
+    # sort parameters so equivalent URLs share one entry
+    params = sorted(p for p in query_string.split("&") if p)
+    return f"{path}?{'&'.join(params)}"
+
+
+# invalidation hooks, called by write endpoints after their transaction commits
+def invalidate_home_feed() -> None:
+    response_cache.delete_prefix("/entities/?", "/tags/")
+
+
+def invalidate_stance_responses(entity_id: int, stance_id: int) -> None:
+    """
+    Drop cached pages of one stance, the stance list of its entity, and the
+    entity's demographics, which every rating of the stance feeds into.
+    """
+    response_cache.delete_prefix(
+        f"/entities/{entity_id}/stances/{stance_id}?",
+        f"/entities/{entity_id}/stances/{stance_id}/",
+        f"/entities/{entity_id}/stances/?",
+        f"/entities/{entity_id}/demographics?",
+    )
+
+
+def invalidate_entity_responses(entity_id: int) -> None:
+    """Drop every cached response that renders the entity or its stances."""
+    response_cache.delete_prefix(f"/entities/{entity_id}?", f"/entities/{entity_id}/")
+    invalidate_home_feed()
@@ -1,7 +1,11 @@
 import base64
 from app.service.storage import upload_image_to_storage
+from typing import NamedTuple
 import json
 
+# characters of plain text shown for a stance in feed previews
+EXCERPT_LENGTH = 280
+
 
 def process_stance_content_json(content_json: str) -> tuple[str, list[str]]:
     image_urls: list[str] = []
@@ -32,3 +36,77 @@ def process_stance_content_json(content_json: str) -> tuple[str, list[str]]:
         ]
     response = json.dumps(content_dict)
     return response, image_urls
+
+
+def extract_stance_text(content_json: str) -> str:
+    """Flatten a rich text document into plain text, one line per block."""
+    blocks: list[str] = []
+
+    def collect(node) -> str:
+        if not isinstance(node, dict):
+            return ""
+        if node.get("type") == "text":
+            return node.get("text") or ""
+        if node.get("type") == "hardBreak":
+            return "\n"
+        children = node.get("content")
+        if not isinstance(children, list):
+            return ""
+        # blocks of inline content become lines; containers recurse into blocks
+        if any(
+            isinstance(c, dict) and c.get("type") in ("text", "hardBreak")
+            for c in children
+        ):
+            return "".join(collect(child) for child in children)
+        for child in children:
+            text = collect(child)
+            if text.strip():
+                blocks.append(text.strip())
+        return ""
+
+    try:
+        content_dict = json.loads(content_json)
+    except (TypeError, ValueError):
+        return ""
+    text = collect(content_dict)
+    if text.strip():
+        blocks.append(text.strip())
+    return "\n".join(blocks)
+
+
+class StanceExcerpt(NamedTuple):
+    excerpt: str
+    word_count: int
+    preview_image_url: str | None
+
+
+def _first_image_url(node) -> str | None:
+    if not isinstance(node, dict):
+        return None
+    src = (node.get("attrs") or {}).get("src") if node.get("type") == "image" else None
+    if isinstance(src, str) and src and not src.startswith("data:"):
+        return src
+    for child in node.get("content") or []:
+        url = _first_image_url(child)
+        if url:
+            return url
+    return None
+
+
+def build_stance_excerpt(content_json: str, content_text: str) -> StanceExcerpt:
+    """
+    The preview shown in feeds: a plain text prefix cut at a word boundary,
+    the document's word count and the URL of its first image.
+    """
+    text: str = " ".join(content_text.split())
+    excerpt: str = text
+    if len(text) > EXCERPT_LENGTH:
+        cut: str = text[: EXCERPT_LENGTH + 1]
+        excerpt = (cut.rsplit(" ", 1)[0] if " " in cut else cut[:EXCERPT_LENGTH]) + "…"
+    try:
+        image_url: str | None = _first_image_url(json.loads(content_json))
+    except (TypeError, ValueError):
+        image_url = None
+    return StanceExcerpt(
+        excerpt=excerpt, word_count=len(text.split()), preview_image_url=image_url
+    )
@@ -0,0 +1,67 @@
+from sqlalchemy.orm import Session
+import asyncio
+import logging
+import os
+import random
+
+from app.database.connect import SessionLocal
+from app.database import refresh_token as token_db
+
+# seconds between compaction runs in each API process; 0 disables the job
+REFRESH_TOKEN_COMPACTION_SECONDS = float(
+    os.getenv("REFRESH_TOKEN_COMPACTION_SECONDS", "3600")
+)
+REFRESH_TOKEN_COMPACTION_BATCH_SIZE = int(
+    os.getenv("REFRESH_TOKEN_COMPACTION_BATCH_SIZE", "1000")
+)
+# bounds one run, so that a large backlog is worked off over several runs
+# instead of occupying a worker thread for long
+REFRESH_TOKEN_COMPACTION_MAX_BATCHES = int(
+    os.getenv("REFRESH_TOKEN_COMPACTION_MAX_BATCHES", "100")
+)
+
+
+def compact_refresh_tokens(
+    db: Session, batch_size: int, max_batches: int | None = None
+) -> int:
+    """
+    Delete expired and revoked refresh tokens, one short transaction per batch,
+    until none are left or max_batches have run. Returns the number deleted.
+    """
+    deleted: int = 0
+    batches: int = 0
+    while max_batches is None or batches < max_batches:
+        count: int = token_db.delete_stale_refresh_tokens(db, batch_size)
+        deleted += count
+        batches += 1
+        if count < batch_size:
+            break
+    return deleted
+
+
+def _compact() -> int:
+    db: Session = SessionLocal()
+    try:
+        return compact_refresh_tokens(
+            db,
+            REFRESH_TOKEN_COMPACTION_BATCH_SIZE,
+            REFRESH_TOKEN_COMPACTION_MAX_BATCHES,
+        )
+    finally:
+        db.close()
+
+
+async def run_refresh_token_compaction() -> None:
+    """Compact the refresh token table periodically, until cancelled."""
+    if REFRESH_TOKEN_COMPACTION_SECONDS <= 0:
+        return
+    # spread the runs of processes started together
+    await asyncio.sleep(random.uniform(0, REFRESH_TOKEN_COMPACTION_SECONDS))
+    while True:
+        try:
+            deleted: int = await asyncio.to_thread(_compact)
+            if deleted:
+                logging.info(f"Compacted {deleted} stale refresh tokens")
+        except Exception as e:
+            logging.error(f"Refresh token compaction failed: {e}")
+        await asyncio.sleep(REFRESH_TOKEN_COMPACTION_SECONDS)
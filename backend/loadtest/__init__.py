@@ -0,0 +1,2 @@
+# password of every user created by loadtest.generate
+LOADTEST_PASSWORD = "loadtest-password"
@@ -0,0 +1,294 @@
+"""
+Replay a weighted mix of API traffic and report latency per route.
+
+Usage:
+    python -m loadtest.driver [--url http://localhost:8000] [--concurrency 32]
+        [--duration 60] [--warmup 10] [--users 10000]
+        [--mix feed=40,entity=20,stance=25,rate=10,login=5]
+        [--output run.json] [--baseline baseline.json]
+
+Load a dataset with loadtest.generate first, then start the API without the
+per-client rate limits, which would otherwise answer most of this traffic
+with 429:
+
+    RATE_LIMIT_ENABLED=false uvicorn app.main:app --workers 4
+
+Each virtual user logs in as a random generated user, then loops picking a
+request from the mix: the authenticated stance feed, an entity, a stance
+page, a rating, or a fresh login. Entities and stances are drawn from the
+feed responses seen so far. Requests made during the warmup are not
+counted. The report lists throughput, errors and p50/p95/p99 latency per
+route; --output saves it as JSON and --baseline compares against a saved
+run, so every change can be measured against the same baseline.
+"""
+
+import argparse
+import http.client
+import json
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+from loadtest import LOADTEST_PASSWORD
+
+DEFAULT_MIX = "feed=40,entity=20,stance=25,rate=10,login=5"
+FEED_SIZE = 20
+# stances remembered for entity, stance page and rate requests
+POOL_SIZE = 10_000
+PERCENTILES = (50, 95, 99)
+
+
+class Pool:
+    """(entity_id, stance_id) pairs seen in feed responses, shared by all users."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self._items: list[tuple[int, int]] = []
+        self._lock = threading.Lock()
+
+    def add(self, stances: list[dict]) -> None:
+        with self._lock:
+            for stance in stances:
+                item = (stance["entity"]["id"], stance["id"])
+                if len(self._items) < self.size:
+                    self._items.append(item)
+                else:
+                    self._items[random.randrange(self.size)] = item
+
+    def choice(self, rng: random.Random) -> tuple[int, int] | None:
+        with self._lock:
+            return rng.choice(self._items) if self._items else None
+
+
+class Results:
+    """Latencies and error counts per route, recorded after the warmup."""
+
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = {}
+        self.errors: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, route: str, seconds: float, ok: bool) -> None:
+        with self._lock:
+            self.latencies.setdefault(route, []).append(seconds)
+            if not ok:
+                self.errors[route] = self.errors.get(route, 0) + 1
+
+    def report(self, seconds: float) -> dict[str, dict]:
+        report: dict[str, dict] = {}
+        with self._lock:
+            routes = {route: sorted(values) for route, values in self.latencies.items()}
+        for route, values in sorted(routes.items()):
+            report[route] = {
+                "requests": len(values),
+                "rps": len(values) / seconds,
+                "errors": self.errors.get(route, 0),
+                **{
+                    f"p{p}_ms": values[min(len(values) - 1, len(values) * p // 100)]
+                    * 1000
+                    for p in PERCENTILES
+                },
+            }
+        return report
+
+
+class VirtualUser(threading.Thread):
+    def __init__(
+        self,
+        args,
+        number: int,
+        pool: Pool,
+        results: Results,
+        stop_at: float,
+        record_from: float,
+    ):
+        super().__init__(daemon=True)
+        self.url = urlsplit(args.url)
+        self.rng = random.Random(args.seed * 100_003 + number)
+        self.users = args.users
+        self.mix = args.mix
+        self.pool = pool
+        self.results = results
+        self.stop_at = stop_at
+        self.record_from = record_from
+        self.connection: http.client.HTTPConnection | None = None
+        self.access_token: str | None = None
+
+    def request(
+        self, route: str, method: str, path: str, body: dict | None = None
+    ) -> dict | None:
+        """Send one request on the keep-alive connection; None on failure."""
+        headers = {"Content-Type": "application/json"}
+        if self.access_token:
+            headers["Authorization"] = f"Bearer {self.access_token}"
+        start = time.perf_counter()
+        try:
+            if self.connection is None:
+                connection_class = (
+                    http.client.HTTPSConnection
+                    if self.url.scheme == "https"
+                    else http.client.HTTPConnection
+                )
+                self.connection = connection_class(self.url.netloc, timeout=30)
+            self.connection.request(
+                method,
+                path,
+                body=json.dumps(body) if body is not None else None,
+                headers=headers,
+            )
+            response = self.connection.getresponse()
+            payload = response.read()
+            ok = response.status < 400
+        except (OSError, http.client.HTTPException):
+            if self.connection is not None:
+                self.connection.close()
+            self.connection = None
+            payload, ok = b"", False
+        if start >= self.record_from:
+            self.results.record(route, time.perf_counter() - start, ok)
+        return json.loads(payload) if ok and payload else None
+
+    def login(self) -> None:
+        user_id = self.rng.randint(1, self.users)
+        self.access_token = None
+        tokens = self.request(
+            "POST /auth/login",
+            "POST",
+            "/auth/login",
+            {"username": f"user{user_id}", "password": LOADTEST_PASSWORD},
+        )
+        if tokens:
+            self.access_token = tokens["access_token"]
+
+    def feed(self) -> None:
+        feed = self.request(
+            "POST /stances/feed",
+            "POST",
+            "/stances/feed",
+            {"num_stances": FEED_SIZE, "initial_stance_id": None, "entities": None},
+        )
+        if feed:
+            self.pool.add(feed["stances"])
+
+    def entity(self, entity_id: int, stance_id: int) -> None:
+        self.request("GET /entities/{entity_id}", "GET", f"/entities/{entity_id}")
+
+    def stance(self, entity_id: int, stance_id: int) -> None:
+        self.request(
+            "GET /entities/{entity_id}/stances/{stance_id}/page",
+            "GET",
+            f"/entities/{entity_id}/stances/{stance_id}/page",
+        )
+
+    def rate(self, entity_id: int, stance_id: int) -> None:
+        self.request(
+            "POST /entities/{entity_id}/stances/{stance_id}/rate",
+            "POST",
+            f"/entities/{entity_id}/stances/{stance_id}/rate",
+            {"rating": self.rng.randint(1, 5)},
+        )
+
+    def run(self) -> None:
+        self.login()
+        self.feed()
+        actions = list(self.mix)
+        weights = list(self.mix.values())
+        while time.monotonic() < self.stop_at:
+            action = self.rng.choices(actions, weights)[0]
+            if action == "login":
+                self.login()
+            elif action == "feed":
+                self.feed()
+            else:
+                item = self.pool.choice(self.rng)
+                if item is None:
+                    self.feed()
+                else:
+                    getattr(self, action)(*item)
+
+
+def parse_mix(mix: str) -> dict[str, int]:
+    weights: dict[str, int] = {}
+    for part in mix.split(","):
+        action, _, weight = part.partition("=")
+        if action not in ("feed", "entity", "stance", "rate", "login"):
+            raise argparse.ArgumentTypeError(f"unknown action {action!r}")
+        weights[action] = int(weight)
+    return weights
+
+
+def print_report(report: dict[str, dict], baseline: dict[str, dict] | None) -> None:
+    print(
+        f"{'route':<56} {'reqs':>7} {'rps':>8} {'errs':>5} "
+        f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+    )
+    for route, stats in report.items():
+        print(
+            f"{route:<56} {stats['requests']:>7} {stats['rps']:>8.1f} "
+            f"{stats['errors']:>5} {stats['p50_ms']:>8.1f} "
+            f"{stats['p95_ms']:>8.1f} {stats['p99_ms']:>8.1f}"
+        )
+        before = (baseline or {}).get(route)
+        if before:
+            changes = "  ".join(
+                f"{key} {(stats[key] - before[key]) / before[key] * 100:+.0f}%"
+                for key in ("rps", "p50_ms", "p95_ms", "p99_ms")
+                if before[key]
+            )
+            print(f"{'  vs baseline':<56} {changes}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=60)
+    parser.add_argument("--warmup", type=float, default=10)
+    parser.add_argument(
+        "--users", type=int, default=10_000, help="log in as user1 to user<USERS>"
+    )
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX))
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="save the report as JSON")
+    parser.add_argument("--baseline", help="compare with a report saved by --output")
+    args = parser.parse_args()
+
+    baseline: dict[str, dict] | None = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["routes"]
+
+    pool = Pool(POOL_SIZE)
+    results = Results()
+    started = time.monotonic()
+    record_from = time.perf_counter() + args.warmup
+    stop_at = started + args.warmup + args.duration
+    users = [
+        VirtualUser(args, number, pool, results, stop_at, record_from)
+        for number in range(args.concurrency)
+    ]
+    for user in users:
+        user.start()
+    for user in users:
+        user.join()
+
+    report = results.report(args.duration)
+    print_report(report, baseline)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "url": args.url,
+                    "concurrency": args.concurrency,
+                    "duration": args.duration,
+                    "mix": args.mix,
+                    "routes": report,
+                },
+                f,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
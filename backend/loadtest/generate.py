@@ -0,0 +1,335 @@
+"""
+Bulk-load a deterministic synthetic dataset for load testing.
+
+Usage:
+    python -m loadtest.generate [--scale 1.0] [--seed 1] [--reset]
+
+At --scale 1.0 this loads 1M users (with profiles, and demographics for most
+of them), 100k entities with tags, 5M stances, 50M ratings and a power-law
+follow graph, then builds the rating and demographic rollups. Smaller scales
+shrink every table in proportion; 0.01 loads in about a minute.
+
+Rows are generated inside postgres with INSERT ... SELECT over
+generate_series. Every random choice is a hash of the row number and the
+seed, so the same scale and seed always produce the same database.
+Popularity follows power laws: low-numbered users, entities and stances
+attract most of the follows, stances and ratings.
+
+Every generated user is named user<id> and has the password LOADTEST_PASSWORD,
+which loadtest.driver uses to log in. The tables must be empty; --reset
+truncates them first. Never point this at a database you care about.
+"""
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import argparse
+import logging
+import time
+
+import bcrypt
+from sqlalchemy import text
+
+from app.database.connect import engine
+from app.scripts.backfill_rating_stats import backfill_rating_stats
+from app.scripts.rebuild_demographic_stats import rebuild_demographic_stats
+from loadtest import LOADTEST_PASSWORD
+
+# a fixed salt keeps the dataset byte-for-byte reproducible
+LOADTEST_SALT = b"$2b$12$loadtestloadtestloadte"
+
+FULL_SCALE = {
+    "users": 1_000_000,
+    "tags": 500,
+    "entities": 100_000,
+    "stances": 5_000_000,
+    "ratings": 50_000_000,
+}
+# ratings are written in chunks of this many users, one transaction each
+RATING_CHUNK_USERS = 50_000
+
+WORDS = (
+    "budget climate housing transit schools tariffs healthcare energy "
+    "immigration privacy policing water wages taxes zoning veterans farms "
+    "broadband elections courts pensions parks tourism trade drugs childcare "
+    "jobs safety rent pollution"
+).split()
+GENDERS = ("female", "male", "female", "male", "nonbinary", "other")
+
+TABLES = (
+    "user_tag_affinities",
+    "tag_stance_pools",
+    "outbox_events",
+    "stance_demographic_stats",
+    "stance_rating_stats",
+    "ratings",
+    "follows",
+    "demographics",
+    "profiles",
+    "refresh_tokens",
+    "images",
+    "stances",
+    "entity_tags",
+    "entities",
+    "tags",
+    "users",
+)
+SERIAL_TABLES = (
+    "users",
+    "profiles",
+    "demographics",
+    "tags",
+    "entities",
+    "entity_tags",
+    "stances",
+    "ratings",
+    "follows",
+)
+
+
+class Generator:
+    def __init__(self, scale: float, seed: int):
+        self.seed = seed
+        self.counts = {
+            table: max(10, int(count * scale)) for table, count in FULL_SCALE.items()
+        }
+        self.counts["tags"] = min(self.counts["tags"], FULL_SCALE["tags"])
+
+    def uniform(self, key: str, stream: int) -> str:
+        """SQL for a deterministic uniform double in [0, 1) per key and stream."""
+        salt = self.seed * 1000 + stream
+        return (
+            f"(((hashint8extended(({key})::bigint, {salt}) >> 11) "
+            f"& 9007199254740991)::float8 / 9007199254740992)"
+        )
+
+    def pick(self, key: str, stream: int, n: int, skew: float) -> str:
+        """SQL for a 0-based index below n; skew > 1 favours low indexes."""
+        return f"floor({n} * power({self.uniform(key, stream)}, {skew}))::bigint"
+
+    def word(self, key: str, stream: int) -> str:
+        words = ", ".join(f"'{word}'" for word in WORDS)
+        return f"(ARRAY[{words}])[1 + floor({len(WORDS)} * {self.uniform(key, stream)})::int]"
+
+    def statements(self, password_hash: str) -> list[tuple[str, str]]:
+        users = self.counts["users"]
+        tags = self.counts["tags"]
+        entities = self.counts["entities"]
+        stances = self.counts["stances"]
+        stances_per_user = max(1, stances // users)
+        anchor = "TIMESTAMPTZ '2025-01-01 00:00:00+00'"
+        u = self.uniform
+        return [
+            (
+                "users",
+                f"""
+                INSERT INTO users (id, username, full_name, email, password_hash,
+                                   is_admin, created_at, updated_at)
+                SELECT i, 'user' || i, initcap({self.word('i', 1)}) || ' User ' || i,
+                       'user' || i || '@loadtest.example', '{password_hash}', false,
+                       {anchor} - interval '730 days' * {u('i', 2)},
+                       {anchor} - interval '30 days' * {u('i', 3)}
+                FROM generate_series(1, {users}) i
+                """,
+            ),
+            (
+                "profiles",
+                f"""
+                INSERT INTO profiles (id, user_id, bio, created_at, updated_at)
+                SELECT i, i, 'I care about ' || {self.word('i', 4)} || '.',
+                       {anchor}, {anchor}
+                FROM generate_series(1, {users}) i
+                """,
+            ),
+            (
+                "demographics",
+                f"""
+                INSERT INTO demographics (id, user_id, birth_year, gender, zip_code,
+                                          created_at, updated_at)
+                SELECT i, i, 1940 + floor(66 * {u('i', 6)})::int,
+                       (ARRAY{list(GENDERS)})[1 + floor({len(GENDERS)} * {u('i', 7)})::int],
+                       lpad(floor(100000 * {u('i', 8)})::int::text, 5, '0'),
+                       {anchor}, {anchor}
+                FROM generate_series(1, {users}) i
+                WHERE {u('i', 5)} < 0.6
+                """,
+            ),
+            (
+                "tags",
+                f"""
+                INSERT INTO tags (id, name, tag_type)
+                SELECT i, {self.word('i', 9)} || '-' || i,
+                       CASE WHEN i <= {max(1, tags // 10)} THEN 1 ELSE 2 END
+                FROM generate_series(1, {tags}) i
+                """,
+            ),
+            (
+                "entities",
+                f"""
+                INSERT INTO entities (id, unique_id, type, title, description,
+                                      location, start_time, end_time, images_json,
+                                      latest_action_date, latest_action_text,
+                                      created_at, updated_at)
+                SELECT i, 'loadtest-' || i, 1 + i % 4,
+                       initcap({self.word('i', 10)}) || ' and ' || {self.word('i', 11)}
+                           || ' ' || i,
+                       'A debate about ' || {self.word('i', 12)} || ', '
+                           || {self.word('i', 13)} || ' and ' || {self.word('i', 14)}
+                           || ' in the community.',
+                       CASE WHEN i % 4 IN (0, 2) THEN 'City ' || i % 500 END,
+                       {anchor} - interval '730 days' * {u('i', 15)},
+                       CASE WHEN i % 4 = 0 THEN {anchor} END,
+                       '[]',
+                       CASE WHEN i % 4 = 2
+                           THEN {anchor} - interval '365 days' * {u('i', 16)} END,
+                       CASE WHEN i % 4 = 2 THEN 'Referred to committee' END,
+                       {anchor} - interval '730 days' * {u('i', 17)},
+                       {anchor} - interval '30 days' * {u('i', 18)}
+                FROM generate_series(1, {entities}) i
+                """,
+            ),
+            (
+                "entity_tags",
+                f"""
+                INSERT INTO entity_tags (entity_id, tag_id)
+                SELECT DISTINCT i, {self.pick('i * 8 + k', 19, tags, 2)} + 1
+                FROM generate_series(1, {entities}) i,
+                     generate_series(0, floor(4 * power({u('i', 20)}, 2))::int) k
+                ORDER BY 1, 2
+                """,
+            ),
+            (
+                # user i's k-th stance lands on a popular entity, offset by k
+                # so that no user has two stances on one entity
+                "stances",
+                f"""
+                INSERT INTO stances (id, user_id, entity_id, headline, content_json,
+                                     content_text, excerpt, word_count,
+                                     engagement_score, created_at, updated_at)
+                SELECT s.i, s.user_id, s.entity_id, s.headline,
+                       json_build_object('type', 'doc', 'content', json_build_array(
+                           json_build_object('type', 'paragraph', 'content',
+                               json_build_array(json_build_object(
+                                   'type', 'text', 'text', s.body)))))::text,
+                       s.body,
+                       CASE WHEN length(s.body) <= 280 THEN s.body
+                            ELSE rtrim(left(s.body, 280)) || '…' END,
+                       array_length(regexp_split_to_array(trim(s.body), '\\s+'), 1),
+                       100 * power({u('s.i', 21)}, 3),
+                       {anchor} - interval '365 days' * {u('s.i', 22)},
+                       {anchor} - interval '30 days' * {u('s.i', 23)}
+                FROM (
+                    SELECT i,
+                           (i - 1) % {users} + 1 AS user_id,
+                           ({self.pick('(i - 1) % ' + str(users), 24, entities, 2)}
+                               + (i - 1) / {users} * {max(1, entities // stances_per_user)})
+                               % {entities} + 1 AS entity_id,
+                           'Why ' || {self.word('i', 25)} || ' matters' AS headline,
+                           'We should rethink ' || {self.word('i', 26)} || ' before '
+                               || {self.word('i', 27)} || '. ' || repeat(
+                                   'Here is the case for ' || {self.word('i', 28)}
+                                   || ' in plain terms. ',
+                                   1 + floor(8 * {u('i', 29)})::int) AS body
+                    FROM generate_series(1, {stances}) i
+                ) s
+                """,
+            ),
+            (
+                # each user follows a power-law number of users, drawn from a
+                # power-law popularity distribution; repeat draws are dropped
+                "follows",
+                f"""
+                INSERT INTO follows (follower_id, followed_id, created_at)
+                SELECT f.follower_id, f.followed_id, {anchor}
+                FROM (
+                    SELECT i AS follower_id,
+                           {self.pick('i * 64 + k', 30, users, 3)} + 1 AS followed_id
+                    FROM generate_series(1, {users}) i,
+                         generate_series(0, floor(49 * power({u('i', 31)}, 4))::int) k
+                ) f
+                WHERE f.follower_id <> f.followed_id
+                ORDER BY f.follower_id, f.followed_id
+                ON CONFLICT DO NOTHING
+                """,
+            ),
+        ]
+
+    def rating_statement(self, first_user: int, last_user: int) -> str:
+        users = self.counts["users"]
+        stances = self.counts["stances"]
+        per_user = max(1, self.counts["ratings"] // users)
+        # the rare repeat draw of a stance by one user is dropped
+        return f"""
+            INSERT INTO ratings (stance_id, user_id, rating)
+            SELECT {self.pick('i * 1024 + k', 32, stances, 2)} + 1, i,
+                   1 + floor(5 * power({self.uniform('i * 1024 + k', 33)}, 0.7))::int
+            FROM generate_series({first_user}, {last_user}) i,
+                 generate_series(0, {per_user - 1}) k
+            ORDER BY i, k
+            ON CONFLICT DO NOTHING
+        """
+
+    def run(self, reset: bool) -> None:
+        with engine.begin() as connection:
+            if reset:
+                connection.execute(
+                    text(f"TRUNCATE {', '.join(TABLES)} RESTART IDENTITY")
+                )
+            elif connection.execute(
+                text("SELECT EXISTS (SELECT 1 FROM users)")
+            ).scalar():
+                raise SystemExit("users is not empty; rerun with --reset to truncate")
+
+        password_hash = bcrypt.hashpw(
+            LOADTEST_PASSWORD.encode(), LOADTEST_SALT
+        ).decode()
+        for table, statement in self.statements(password_hash):
+            started = time.monotonic()
+            with engine.begin() as connection:
+                rows = connection.execute(text(statement)).rowcount
+            logging.info(
+                "Loaded %d %s in %.1fs", rows, table, time.monotonic() - started
+            )
+
+        users = self.counts["users"]
+        for first_user in range(1, users + 1, RATING_CHUNK_USERS):
+            last_user = min(users, first_user + RATING_CHUNK_USERS - 1)
+            with engine.begin() as connection:
+                connection.execute(text(self.rating_statement(first_user, last_user)))
+            logging.info("Loaded ratings of users up to %d", last_user)
+
+        with engine.begin() as connection:
+            for table in SERIAL_TABLES:
+                connection.execute(
+                    text(
+                        f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                        f"coalesce((SELECT max(id) FROM {table}), 1))"
+                    )
+                )
+
+        backfill_rating_stats(batch_size=10000)
+        rebuild_demographic_stats()
+        with engine.connect().execution_options(
+            isolation_level="AUTOCOMMIT"
+        ) as connection:
+            connection.execute(text("VACUUM ANALYZE"))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--reset", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    generator = Generator(args.scale, args.seed)
+    logging.info("Generating %s", generator.counts)
+    started = time.monotonic()
+    generator.run(args.reset)
+    logging.info("Dataset ready in %.1fs", time.monotonic() - started)
+
+
+if __name__ == "__main__":
+    main()
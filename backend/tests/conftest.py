@@ -0,0 +1,148 @@
+"""
+The suite runs the app in-process against a throwaway postgres database,
+seeded by loadtest.generate. Point TEST_DATABASE_URL at an empty database;
+it is truncated and reseeded on every run:
+
+    TEST_DATABASE_URL=postgresql+psycopg2://localhost/stance_test pytest
+
+Without it only the unit tests run, those that do not use the seeded fixture.
+"""
+
+import os
+import re
+import tempfile
+import time
+
+import pytest
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+# the seeded dataset as a fraction of loadtest.generate's full scale
+TEST_SEED_SCALE = float(os.getenv("TEST_SEED_SCALE", "0.0005"))
+
+# unit tests import modules that build the engine, which never connects to an
+# unused database
+os.environ["DATABASE_URL"] = (
+    TEST_DATABASE_URL or "postgresql+psycopg2://localhost/unused"
+)
+os.environ.setdefault("JWT_SECRET", "test-secret-" + "0" * 32)
+os.environ.setdefault("JWT_ALGORITHM", "HS256")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "15")
+os.environ.setdefault("REFRESH_TOKEN_EXPIRES_DAYS", "7")
+os.environ["RATE_LIMIT_ENABLED"] = "false"
+os.environ["RELATED_INDEX_DIR"] = tempfile.mkdtemp(prefix="related_index_")
+
+SERVER_TIMING_QUERIES = re.compile(r'desc="queries: (\d+)"')
+
+
+def pytest_collection_modifyitems(config, items):
+    if TEST_DATABASE_URL:
+        return
+    skip = pytest.mark.skip(reason="TEST_DATABASE_URL is not set")
+    for item in items:
+        if "seeded" in item.fixturenames:
+            item.add_marker(skip)
+
+
+@pytest.fixture(scope="session")
+def seeded():
+    """Seed the database and return ids of rows worth requesting."""
+    from sqlalchemy import text
+
+    from app.database.connect import Base, engine
+    import app.database.models
+    from app.scripts.build_related_index import build_related_index
+    from app.scripts.rebuild_feed_ranking import rebuild_feed_ranking
+    from loadtest.generate import Generator
+
+    Base.metadata.create_all(engine)
+    Generator(TEST_SEED_SCALE, seed=1).run(reset=True)
+    rebuild_feed_ranking(chunk_rows=100_000)
+    build_related_index()
+
+    with engine.connect() as connection:
+        # the most popular rows have the longest pages
+        row = connection.execute(
+            text(
+                "SELECT entity_id, count(*) FROM stances "
+                "GROUP BY entity_id ORDER BY count(*) DESC, entity_id LIMIT 1"
+            )
+        ).first()
+        entity_id: int = row[0]
+        stance_id: int = connection.execute(
+            text("SELECT min(id) FROM stances WHERE entity_id = :entity_id"),
+            {"entity_id": entity_id},
+        ).scalar()
+        tag_id: int = connection.execute(
+            text(
+                "SELECT tag_id FROM entity_tags "
+                "GROUP BY tag_id ORDER BY count(*) DESC, tag_id LIMIT 1"
+            )
+        ).scalar()
+        followed_id: int = connection.execute(
+            text(
+                "SELECT followed_id FROM follows "
+                "GROUP BY followed_id ORDER BY count(*) DESC, followed_id LIMIT 1"
+            )
+        ).scalar()
+        follower_id: int = connection.execute(
+            text(
+                "SELECT follower_id FROM follows "
+                "GROUP BY follower_id ORDER BY count(*) DESC, follower_id LIMIT 1"
+            )
+        ).scalar()
+        user_id: int = connection.execute(
+            text("SELECT user_id FROM stances WHERE id = :stance_id"),
+            {"stance_id": stance_id},
+        ).scalar()
+    return {
+        "entity_id": entity_id,
+        "stance_id": stance_id,
+        "tag_id": tag_id,
+        "followed_id": followed_id,
+        "follower_id": follower_id,
+        "user_id": user_id,
+    }
+
+
+@pytest.fixture(scope="session")
+def client(seeded):
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture(scope="session")
+def auth_headers(seeded):
+    from app.service.auth import create_access_token
+
+    # authenticated requests skip the shared response cache and load the
+    # caller's own ratings, the most expensive variant of each page
+    return {
+        "Authorization": f"Bearer {create_access_token(seeded['follower_id'], False)}"
+    }
+
+
+@pytest.fixture(scope="session")
+def measure(client, auth_headers):
+    def measure(method: str, url: str, runs: int = 3, **kwargs):
+        """
+        Call an endpoint runs times as a signed-in user. Returns the last
+        response, the most SQL statements any call ran and the fastest wall
+        time in seconds.
+        """
+        queries: int = 0
+        fastest: float = float("inf")
+        for _ in range(runs):
+            start: float = time.perf_counter()
+            response = client.request(method, url, headers=auth_headers, **kwargs)
+            fastest = min(fastest, time.perf_counter() - start)
+            timing: str = response.headers.get("server-timing", "")
+            match = SERVER_TIMING_QUERIES.search(timing)
+            assert match, f"{method} {url} did not report its queries"
+            queries = max(queries, int(match.group(1)))
+        return response, queries, fastest
+
+    return measure
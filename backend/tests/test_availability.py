@@ -0,0 +1,53 @@
+from app.service import availability as availability_module
+from app.service.availability import AvailabilityIndex, BloomFilter
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(1000, 0.01)
+    names: list[str] = [f"user{i}" for i in range(1000)]
+    for name in names:
+        bloom.add(name)
+    assert all(name in bloom for name in names)
+    assert bloom.count == 1000
+
+
+def test_bloom_filter_false_positive_rate_at_capacity():
+    bloom = BloomFilter(10000, 0.01)
+    for i in range(10000):
+        bloom.add(f"taken{i}")
+    false_positives: int = sum(f"free{i}" in bloom for i in range(20000))
+    # the configured rate holds up to capacity, with room for sampling noise
+    assert false_positives / 20000 < 0.015
+
+
+def test_checks_fall_back_to_the_database_until_built(monkeypatch):
+    queries: list[str] = []
+
+    def is_username_taken(db, username: str) -> bool:
+        queries.append(username)
+        return username.lower() == "alice"
+
+    monkeypatch.setattr(
+        availability_module.user_db, "is_username_taken", is_username_taken
+    )
+    monkeypatch.setattr(
+        availability_module.user_db,
+        "iter_usernames_and_emails",
+        lambda db, updated_since=None: iter([("alice", "alice@example.com")]),
+    )
+    monkeypatch.setattr(availability_module.user_db, "count_users", lambda db: 1)
+    index = AvailabilityIndex()
+
+    assert index.is_username_taken(None, "bob") is False
+    assert queries == ["bob"]
+
+    index.refresh(None)
+    queries.clear()
+    # names the filter never saw are answered without a query
+    assert index.is_username_taken(None, "bob") is False
+    assert queries == []
+    assert index.is_username_taken(None, "ALICE") is True
+    assert queries == ["ALICE"]
+
+    index.add(username="Carol")
+    assert "carol" in index._usernames
@@ -0,0 +1,114 @@
+import asyncio
+import gzip
+import threading
+
+import pytest
+from starlette.datastructures import MutableHeaders
+
+from app.service import compression
+from app.service.compression import is_compressible, negotiate_encoding
+
+
+@pytest.fixture
+def offered(monkeypatch):
+    # as offered with brotli installed, whether or not it is here
+    monkeypatch.setattr(compression, "ENCODINGS", ("br", "gzip"))
+
+
+@pytest.mark.parametrize(
+    "accept_encoding, encoding",
+    [
+        (None, None),
+        ("", None),
+        ("identity", None),
+        ("gzip", "gzip"),
+        ("gzip, deflate, br", "br"),
+        # ties go to the server's preference, whatever the client's order
+        ("gzip;q=0.8, br;q=0.8", "br"),
+        ("br;q=0.5, gzip", "gzip"),
+        ("BR;Q=1, GZIP;Q=0.2", "br"),
+        ("br;q=0, gzip;q=0.1", "gzip"),
+        ("br;q=0, gzip;q=0", None),
+        ("*", "br"),
+        ("*;q=0.3, br;q=0.1", "gzip"),
+        ("gzip;q=0, *", "br"),
+        # an unreadable weight refuses the coding
+        ("br;q=high, gzip", "gzip"),
+        (" gzip ; level=1 ; q=0.7 ", "gzip"),
+    ],
+)
+def test_negotiate_encoding_weighs_q_values(offered, accept_encoding, encoding):
+    assert negotiate_encoding(accept_encoding) == encoding
+
+
+def test_only_offered_encodings_are_chosen(monkeypatch):
+    monkeypatch.setattr(compression, "ENCODINGS", ("gzip",))
+    assert negotiate_encoding("br") is None
+    assert negotiate_encoding("br, gzip;q=0.1") == "gzip"
+
+
+@pytest.mark.parametrize(
+    "content_type, size, expected",
+    [
+        ("application/json", 2048, True),
+        ("application/json; charset=utf-8", 2048, True),
+        ("text/html", 2048, True),
+        ("text/event-stream", 2048, False),
+        ("image/png", 2048, False),
+        ("application/json", 10, False),
+    ],
+)
+def test_is_compressible(content_type: str, size: int, expected: bool):
+    headers = MutableHeaders(raw=[(b"content-type", content_type.encode())])
+    assert is_compressible(headers, size) is expected
+
+
+def test_already_encoded_bodies_are_not_compressed_again():
+    headers = MutableHeaders(
+        raw=[(b"content-type", b"application/json"), (b"content-encoding", b"br")]
+    )
+    assert not is_compressible(headers, 2048)
+
+
+def test_gzip_output_is_stable():
+    body: bytes = b'{"stances": []}' * 200
+    assert compression.compress(body, "gzip") == compression.compress(body, "gzip")
+    assert gzip.decompress(compression.compress(body, "gzip")) == body
+
+
+def test_middleware_compresses_off_the_event_loop(monkeypatch):
+    from app.middleware import compression as middleware
+
+    threads: list[int] = []
+
+    def recording(body: bytes, encoding: str) -> bytes:
+        threads.append(threading.get_ident())
+        return compression.compress(body, encoding)
+
+    monkeypatch.setattr(middleware, "compress", recording)
+    body: bytes = b'{"stances": []}' * 200
+
+    async def app(scope, receive, send) -> None:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [(b"content-type", b"application/json")],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+    messages: list[dict] = []
+
+    async def send(message: dict) -> None:
+        messages.append(message)
+
+    scope: dict = {
+        "type": "http",
+        "method": "GET",
+        "path": "/",
+        "headers": [(b"accept-encoding", b"gzip")],
+    }
+    asyncio.run(middleware.CompressionMiddleware(app)(scope, None, send))
+    assert threads and threads[0] != threading.get_ident()
+    assert gzip.decompress(messages[1]["body"]) == body
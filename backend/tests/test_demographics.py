@@ -0,0 +1,96 @@
+from datetime import date
+
+import pytest
+
+from app.service.demographics import (
+    UNKNOWN,
+    UNKNOWN_BIRTH_YEAR,
+    DemographicBucket,
+    age_band,
+    demographic_bucket,
+    gender_bucket,
+    region,
+    suppress_small_buckets,
+)
+
+TODAY = date(2026, 6, 1)
+
+
+@pytest.mark.parametrize(
+    "birth_year, band",
+    [
+        (None, UNKNOWN),
+        (UNKNOWN_BIRTH_YEAR, UNKNOWN),
+        (2027, UNKNOWN),
+        (2026, "under_18"),
+        (2009, "under_18"),
+        (2008, "18_29"),
+        (1997, "18_29"),
+        (1996, "30_44"),
+        (1982, "30_44"),
+        (1981, "45_64"),
+        (1962, "45_64"),
+        (1961, "65_plus"),
+        (1900, "65_plus"),
+    ],
+)
+def test_age_band(birth_year, band):
+    assert age_band(birth_year, TODAY) == band
+
+
+def test_age_band_moves_with_the_year_but_the_bucket_does_not():
+    assert age_band(2008, date(2025, 12, 31)) == "under_18"
+    assert age_band(2008, date(2026, 1, 1)) == "18_29"
+    # cells are keyed on the birth year, so ratings stay in their cell
+    assert demographic_bucket(2008, None, None).birth_year == 2008
+
+
+@pytest.mark.parametrize(
+    "gender, bucket",
+    [
+        (None, UNKNOWN),
+        ("  ", UNKNOWN),
+        ("Female", "female"),
+        (" MALE ", "male"),
+        ("non-binary", "nonbinary"),
+        ("agender", "other"),
+    ],
+)
+def test_gender_bucket(gender, bucket):
+    assert gender_bucket(gender) == bucket
+
+
+@pytest.mark.parametrize(
+    "zip_code, bucket",
+    [(None, UNKNOWN), ("", UNKNOWN), ("02139", "new_england"), ("94110", "pacific")],
+)
+def test_region(zip_code, bucket):
+    assert region(zip_code) == bucket
+
+
+def test_demographic_bucket():
+    assert demographic_bucket(1990, "female", "60614") == DemographicBucket(
+        1990, "female", "central"
+    )
+    assert demographic_bucket(None, None, None) == DemographicBucket(
+        UNKNOWN_BIRTH_YEAR, UNKNOWN, UNKNOWN
+    )
+
+
+def test_suppress_small_buckets():
+    rows = [("18_29", 10, 40), ("30_44", 4, 12), ("65_plus", 1, 5)]
+    assert suppress_small_buckets(rows) == ([("18_29", 10, 40)], 5)
+
+
+def test_sql_age_band_matches_python(seeded):
+    from sqlalchemy import literal, select
+
+    from app.database.connect import engine
+    from app.database.demographic_stats import _age_band
+
+    with engine.connect() as connection:
+        for birth_year in (UNKNOWN_BIRTH_YEAR, 2030, 2009, 2008, 1982, 1962, 1940):
+            band: str = connection.execute(
+                select(_age_band(literal(birth_year), TODAY))
+            ).scalar()
+            assert band == age_band(birth_year, TODAY)
@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+
+from app.service.feed_ranking import rank_candidates
+
+STANCE_IDS = np.array([11, 3, 7, 20, 5, 14, 9, 2], dtype=np.int64)
+# ties on 0.5 and 0.2 are ranked by id, descending
+SCORES = np.array([0.5, 0.9, 0.5, 0.2, 0.5, 0.1, 0.2, 0.9])
+RANKED = [3, 2, 11, 7, 5, 20, 9, 14]
+
+
+def _pages(limit: int) -> list[list[int]]:
+    pages: list[list[int]] = []
+    cursor_score, cursor_id = None, None
+    while True:
+        page = rank_candidates(STANCE_IDS, SCORES, limit, cursor_score, cursor_id)
+        if len(page) == 0:
+            return pages
+        pages.append(STANCE_IDS[page].tolist())
+        cursor_score, cursor_id = float(SCORES[page[-1]]), int(STANCE_IDS[page[-1]])
+
+
+def test_candidates_are_ranked_by_score_then_id():
+    page = rank_candidates(STANCE_IDS, SCORES, len(STANCE_IDS))
+    assert STANCE_IDS[page].tolist() == RANKED
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 5, 8, 20])
+def test_pages_follow_the_cursor_without_gaps_or_repeats(limit: int):
+    pages: list[list[int]] = _pages(limit)
+    assert [stance_id for page in pages for stance_id in page] == RANKED
+    assert all(len(page) == limit for page in pages[:-1])
+
+
+def test_a_cursor_inside_a_tie_continues_with_lower_ids():
+    page = rank_candidates(STANCE_IDS, SCORES, 2, cursor_score=0.5, cursor_id=11)
+    assert STANCE_IDS[page].tolist() == [7, 5]
+
+
+def test_a_cursor_above_the_first_candidate_starts_from_the_top():
+    page = rank_candidates(STANCE_IDS, SCORES, 2, cursor_score=0.9, cursor_id=4)
+    assert STANCE_IDS[page].tolist() == [3, 2]
+
+
+def test_no_candidates():
+    empty = np.array([], dtype=np.int64)
+    assert len(rank_candidates(empty, np.array([]), 10)) == 0
+
+
+def _feed(client, headers: dict, limit: int, count: int, **params) -> list[int]:
+    """The ids of the first count stances of the personalized feed."""
+    ids: list[int] = []
+    params.update(ranking="personalized", num_stances=limit, fields="headline")
+    while len(ids) < count:
+        response = client.get("/stances/feed", params=params, headers=headers)
+        assert response.status_code == 200, response.text
+        page: list[int] = [stance["id"] for stance in response.json()["stances"]]
+        assert len(page) <= limit
+        ids.extend(page)
+        cursor: dict | None = response.json()["next_cursor"]
+        if cursor is None:
+            break
+        params.update(cursor_score=cursor["score"], cursor_id=cursor["id"])
+    return ids[:count]
+
+
+def test_personalized_feed_needs_a_signed_in_user(client):
+    response = client.get("/stances/feed", params={"ranking": "personalized"})
+    assert response.status_code == 401
+    response = client.post(
+        "/stances/feed",
+        json={
+            "num_stances": 5,
+            "initial_stance_id": None,
+            "entities": None,
+            "ranking": "personalized",
+        },
+    )
+    assert response.status_code == 401
+
+
+@pytest.mark.parametrize("limit", [1, 3, 10])
+def test_initial_stance_leads_the_feed_without_gaps_or_repeats(
+    client, auth_headers, seeded, limit: int
+):
+    whole: list[int] = _feed(client, auth_headers, 100, 40)
+    assert whole, "the personalized feed is empty"
+    for initial in (seeded["stance_id"], whole[len(whole) // 2]):
+        expected: list[int] = [initial] + [i for i in whole if i != initial]
+        count: int = min(len(expected), 30)
+        paged: list[int] = _feed(
+            client, auth_headers, limit, count, initial_stance_id=initial
+        )
+        assert paged == expected[:count]
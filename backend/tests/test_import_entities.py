@@ -0,0 +1,47 @@
+import json
+
+import pytest
+
+from app.scripts.import_entities import _copy_value, normalize_record
+
+
+def _record(**fields) -> dict:
+    return {"unique_id": "hr-1", "title": "A bill", "type": "1", **fields}
+
+
+@pytest.mark.parametrize(
+    "fields, images",
+    [
+        ({}, []),
+        ({"images": ["https://a/1.png"]}, ["https://a/1.png"]),
+        ({"images_json": '["https://a/1.png"]'}, ["https://a/1.png"]),
+        ({"images_json": ["https://a/1.png"]}, ["https://a/1.png"]),
+        ({"images_json": [{"url": "https://a/1.png"}]}, [{"url": "https://a/1.png"}]),
+    ],
+)
+def test_images_are_stored_as_json(fields: dict, images: list):
+    row, _ = normalize_record(_record(**fields))
+    assert json.loads(row["images_json"]) == images
+
+
+def test_timestamps_and_tags_are_normalized():
+    row, tags = normalize_record(
+        _record(
+            start_time="2024-01-02T03:04:05Z",
+            tags=[{"name": "Health", "tag_type": "2"}],
+        )
+    )
+    assert row["type"] == 1
+    assert row["start_time"] == "2024-01-02T03:04:05+00:00"
+    assert row["end_time"] is None
+    assert tags == [("Health", 2)]
+
+
+def test_records_without_an_id_or_title_are_rejected():
+    with pytest.raises(ValueError):
+        normalize_record({"title": "A bill", "type": "1"})
+
+
+def test_copy_values_are_escaped():
+    assert _copy_value(None) == "\\N"
+    assert _copy_value("a\tb\nc\\d") == "a\\tb\\nc\\\\d"
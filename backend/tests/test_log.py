@@ -0,0 +1,67 @@
+import json
+import logging
+import sys
+
+import pytest
+
+from app.service.log import REDACTED, JsonFormatter, redact
+
+
+@pytest.mark.parametrize(
+    "message, redacted",
+    [
+        ("password=hunter2 user=bob", f"password={REDACTED} user=bob"),
+        ("refresh_token='a b' ok", f"refresh_token={REDACTED} ok"),
+        (
+            '{"password": "a b", "name": "x"}',
+            f'{{"password": {REDACTED}, "name": "x"}}',
+        ),
+        ("Authorization: Bearer abc.def next", f"Authorization: {REDACTED} next"),
+        ("authorization=basic dXNlcjpwdw==", f"authorization={REDACTED}"),
+        ("cookie: a=1; b=2 done", f"cookie: {REDACTED} done"),
+        ("X-Api-Key=k2 api-key: k3", f"X-Api-Key={REDACTED} api-key: {REDACTED}"),
+        ("JWT_SECRET = s3cret", f"JWT_SECRET = {REDACTED}"),
+    ],
+)
+def test_credentials_in_messages_are_redacted(message: str, redacted: str):
+    assert redact(message) == redacted
+
+
+@pytest.mark.parametrize(
+    "message",
+    ["user=bob rated stance 3", "tokenizer ran in 3ms", "token bucket refilled"],
+)
+def test_messages_without_credential_pairs_are_kept(message: str):
+    assert redact(message) == message
+
+
+def test_credential_keys_are_redacted_in_nested_values():
+    assert redact(
+        {"Password": "x", "nested": {"api_key": 1, "items": ["token=abc", 2]}}
+    ) == {
+        "Password": REDACTED,
+        "nested": {"api_key": REDACTED, "items": [f"token={REDACTED}", 2]},
+    }
+
+
+def test_json_records_redact_extra_fields_and_exceptions():
+    try:
+        raise ValueError("password=hunter2")
+    except ValueError:
+        record = logging.makeLogRecord(
+            {
+                "name": "test",
+                "levelno": logging.ERROR,
+                "levelname": "ERROR",
+                "msg": "signing in %s with secret=%s",
+                "args": ("bob", "x"),
+                "exc_info": sys.exc_info(),
+                "access_token": "abc",
+                "body": {"password": "x", "username": "bob"},
+            }
+        )
+    entry: dict = json.loads(JsonFormatter().format(record))
+    assert entry["message"] == f"signing in bob with secret={REDACTED}"
+    assert entry["access_token"] == REDACTED
+    assert entry["body"] == {"password": REDACTED, "username": "bob"}
+    assert "hunter2" not in entry["exception"]
@@ -0,0 +1,117 @@
+import asyncio
+import re
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api.metrics import router as metrics_router
+from app.middleware.response_cache import CacheRule, ResponseCacheMiddleware
+from app.service import metrics
+from app.service.metrics import RequestStats, current_request_stats
+from app.service.response_cache import InMemoryResponseCacheBackend
+
+
+def _metrics_client() -> TestClient:
+    app = FastAPI()
+    app.include_router(metrics_router.router)
+    return TestClient(app)
+
+
+def test_metrics_are_not_served_without_a_token(monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_TOKEN", None)
+    assert _metrics_client().get("/metrics").status_code == 404
+
+
+def test_metrics_require_the_token(monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_TOKEN", "scrape")
+    client = _metrics_client()
+    assert client.get("/metrics").status_code == 401
+    assert (
+        client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code
+        == 401
+    )
+    response = client.get("/metrics", headers={"Authorization": "Bearer scrape"})
+    assert response.status_code == 200
+    assert "http_request_duration_seconds" in response.text
+
+
+def test_stale_refreshes_are_not_added_to_the_triggering_request():
+    async def querying_app(scope, receive, send) -> None:
+        # stands in for the SQL the endpoint runs
+        current_request_stats.get().queries += 3
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"{}"})
+
+    app = ResponseCacheMiddleware(
+        querying_app,
+        InMemoryResponseCacheBackend(),
+        [CacheRule(re.compile(r"^/refreshed$"), ttl=0, stale=60)],
+    )
+    scope: dict = {
+        "type": "http",
+        "method": "GET",
+        "path": "/refreshed",
+        "query_string": b"",
+        "headers": [],
+    }
+
+    async def receive() -> dict:
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message: dict) -> None:
+        pass
+
+    async def request() -> RequestStats:
+        stats = RequestStats()
+        current_request_stats.set(stats)
+        await app(scope, receive, send)
+        await asyncio.sleep(0.05)
+        return stats
+
+    async def miss_then_stale() -> tuple[RequestStats, RequestStats]:
+        return await asyncio.create_task(request()), await asyncio.create_task(
+            request()
+        )
+
+    missed, stale = asyncio.run(miss_then_stale())
+    assert missed.queries == 3
+    assert stale.queries == 0
+    assert (
+        'response_cache_refresh_db_queries_count{rule="^/refreshed$"} 1\n'
+        in metrics.render_metrics()
+    )
+
+
+def test_event_streams_are_timed_until_they_start(monkeypatch):
+    from app.middleware import metrics as middleware
+
+    recorded: list[float] = []
+    monkeypatch.setattr(
+        middleware,
+        "record_request",
+        lambda method, route, status, seconds, stats: recorded.append(seconds),
+    )
+
+    def streaming_app(content_type: bytes):
+        async def app(scope, receive, send) -> None:
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": 200,
+                    "headers": [(b"content-type", content_type)],
+                }
+            )
+            await asyncio.sleep(0.2)
+            await send({"type": "http.response.body", "body": b""})
+
+        return app
+
+    async def send(message: dict) -> None:
+        pass
+
+    scope: dict = {"type": "http", "method": "GET", "path": "/stream", "headers": []}
+    for content_type in (b"text/event-stream; charset=utf-8", b"application/json"):
+        app = middleware.MetricsMiddleware(streaming_app(content_type), routes=[])
+        asyncio.run(app(scope, None, send))
+    streamed, buffered = recorded
+    assert streamed < 0.1 <= 0.2 <= buffered
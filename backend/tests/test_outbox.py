@@ -0,0 +1,26 @@
+import pytest
+
+from app.service import outbox
+from app.service.outbox import retry_delay
+
+
+@pytest.fixture
+def delays(monkeypatch):
+    monkeypatch.setattr(outbox, "OUTBOX_RETRY_SECONDS", 5.0)
+    monkeypatch.setattr(outbox, "OUTBOX_RETRY_MAX_SECONDS", 600.0)
+
+
+@pytest.mark.parametrize(
+    "attempts, seconds",
+    [(1, 5), (2, 10), (3, 20), (7, 320), (8, 600), (9, 600)],
+)
+def test_retry_delay_doubles_up_to_the_max(delays, attempts: int, seconds: float):
+    assert retry_delay(attempts) == seconds
+
+
+def test_retry_delay_of_many_attempts_stays_at_the_max(delays):
+    assert retry_delay(10_000) == 600
+
+
+def test_retry_delay_before_any_failure_is_the_first_delay(delays):
+    assert retry_delay(0) == 5
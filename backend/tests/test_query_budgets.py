@@ -0,0 +1,128 @@
+"""
+SQL statement and wall time budgets per endpoint.
+
+Every list endpoint must run the same number of statements whatever its page
+size: a count that grows with the page is an N+1 query. A failing budget
+means an endpoint got slower; raise it only when the extra work is intended.
+Wall times are the fastest of three calls, scaled by TEST_WALL_TIME_FACTOR
+for slow machines, and are reported as the wall_ms property of each test.
+"""
+
+import os
+from typing import NamedTuple
+
+import pytest
+
+TEST_WALL_TIME_FACTOR = float(os.getenv("TEST_WALL_TIME_FACTOR", "1"))
+
+PAGE_SIZES = (1, 10, 50)
+
+
+class Budget(NamedTuple):
+    method: str
+    # formatted with the seeded ids and the page size n
+    url: str
+    queries: int
+    max_ms: float
+    json: dict | None = None
+
+
+PAGED_BUDGETS = {
+    "stance feed": Budget("GET", "/stances/feed?num_stances={n}", 7, 250),
+    "stance feed post": Budget(
+        "POST",
+        "/stances/feed",
+        7,
+        250,
+        json={"num_stances": "{n}", "initial_stance_id": None, "entities": None},
+    ),
+    "stance feed preview": Budget(
+        "GET", "/stances/feed?num_stances={n}&preview=true", 7, 250
+    ),
+    "stance feed personalized": Budget(
+        "GET", "/stances/feed?num_stances={n}&ranking=personalized", 10, 250
+    ),
+    "stance feed fields": Budget(
+        "GET", "/stances/feed?num_stances={n}&fields=headline,average_rating", 2, 250
+    ),
+    "following feed": Budget("GET", "/stances/following-feed?limit={n}", 7, 250),
+    "rating histograms": Budget(
+        "GET", "/stances/rating-histograms?{stance_ids}", 1, 100
+    ),
+    "my ratings": Budget("GET", "/stances/my-ratings?{stance_ids}", 1, 100),
+    "entity stances": Budget("GET", "/entities/{entity_id}/stances/?limit={n}", 8, 250),
+    "user stances": Budget("GET", "/users/{user_id}/stances/?limit={n}", 6, 250),
+    "entities": Budget("GET", "/entities/?limit={n}", 4, 250),
+    "entities fields": Budget("GET", "/entities/?limit={n}&fields=title", 1, 100),
+    "tag entities": Budget("GET", "/tags/{tag_id}/entities?limit={n}", 3, 250),
+    "followers": Budget("GET", "/users/{followed_id}/followers?limit={n}", 2, 100),
+    "following": Budget("GET", "/users/{follower_id}/following?limit={n}", 2, 100),
+    "search entities": Budget("GET", "/search/entities?q=budget&limit={n}", 2, 250),
+    "search stances": Budget("GET", "/search/stances?q=budget&limit={n}", 1, 250),
+}
+
+SINGLE_BUDGETS = {
+    "entity": Budget("GET", "/entities/{entity_id}", 3, 100),
+    "stance": Budget("GET", "/entities/{entity_id}/stances/{stance_id}", 3, 100),
+    "stance page": Budget(
+        "GET", "/entities/{entity_id}/stances/{stance_id}/page", 9, 100
+    ),
+    "my stance": Budget("GET", "/entities/{entity_id}/stances/me", 11, 100),
+    "user": Budget("GET", "/users/{user_id}", 1, 100),
+    "profile page": Budget("GET", "/users/{user_id}/profile_page", 6, 100),
+    "entity demographics": Budget("GET", "/entities/{entity_id}/demographics", 2, 100),
+    "stance demographics": Budget(
+        "GET", "/entities/{entity_id}/stances/{stance_id}/demographics", 3, 100
+    ),
+    "related entities": Budget("GET", "/entities/{entity_id}/related", 3, 100),
+    "similar stances": Budget(
+        "GET", "/entities/{entity_id}/stances/{stance_id}/similar", 3, 100
+    ),
+}
+
+
+def _format(value, values: dict):
+    if isinstance(value, str):
+        return int(value.format(**values)) if value == "{n}" else value.format(**values)
+    if isinstance(value, dict):
+        return {key: _format(item, values) for key, item in value.items()}
+    return value
+
+
+def _check(measure, record_property, budget: Budget, values: dict) -> None:
+    url: str = _format(budget.url, values)
+    response, queries, seconds = measure(
+        budget.method, url, json=_format(budget.json, values)
+    )
+    record_property("queries", queries)
+    record_property("wall_ms", round(seconds * 1000, 1))
+
+    assert response.status_code == 200, response.text
+    assert queries <= budget.queries, (
+        f"{budget.method} {url} ran {queries} SQL statements, "
+        f"over its budget of {budget.queries}"
+    )
+    max_ms: float = budget.max_ms * TEST_WALL_TIME_FACTOR
+    assert (
+        seconds * 1000 <= max_ms
+    ), f"{budget.method} {url} took {seconds * 1000:.0f}ms, over {max_ms:.0f}ms"
+
+
+@pytest.mark.parametrize("n", PAGE_SIZES)
+@pytest.mark.parametrize("name", PAGED_BUDGETS)
+def test_paged_endpoint_budget(measure, record_property, seeded, name: str, n: int):
+    stance_ids: str = "&".join(
+        f"stance_ids={stance_id}"
+        for stance_id in range(seeded["stance_id"], seeded["stance_id"] + n)
+    )
+    _check(
+        measure,
+        record_property,
+        PAGED_BUDGETS[name],
+        {**seeded, "n": n, "stance_ids": stance_ids},
+    )
+
+
+@pytest.mark.parametrize("name", SINGLE_BUDGETS)
+def test_single_endpoint_budget(measure, record_property, seeded, name: str):
+    _check(measure, record_property, SINGLE_BUDGETS[name], seeded)
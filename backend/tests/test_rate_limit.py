@@ -0,0 +1,55 @@
+import pytest
+
+from app.service import rate_limit
+from app.service.rate_limit import InMemoryRateLimitBackend
+
+
+@pytest.fixture
+def clock(monkeypatch) -> list[float]:
+    """A monotonic clock the test moves by hand."""
+    now: list[float] = [1000.0]
+    monkeypatch.setattr(rate_limit.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_a_full_bucket_allows_a_burst(clock):
+    backend = InMemoryRateLimitBackend()
+    assert [backend.take("a", rate=1, burst=3) for _ in range(3)] == [0, 0, 0]
+    assert backend.take("a", rate=1, burst=3) == pytest.approx(1)
+
+
+def test_tokens_refill_at_the_rate(clock):
+    backend = InMemoryRateLimitBackend()
+    for _ in range(2):
+        backend.take("a", rate=2, burst=2)
+    assert backend.take("a", rate=2, burst=2) == pytest.approx(0.5)
+
+    clock[0] += 0.25
+    # half a token has come back since the rejected take
+    assert backend.take("a", rate=2, burst=2) == pytest.approx(0.25)
+    clock[0] += 0.25
+    assert backend.take("a", rate=2, burst=2) == 0
+    assert backend.take("a", rate=2, burst=2) == pytest.approx(0.5)
+
+
+def test_refill_stops_at_the_burst(clock):
+    backend = InMemoryRateLimitBackend()
+    backend.take("a", rate=1, burst=2)
+    clock[0] += 3600
+    assert [backend.take("a", rate=1, burst=2) for _ in range(3)] == [
+        0,
+        0,
+        pytest.approx(1),
+    ]
+
+
+def test_buckets_are_per_key_and_evicted_least_recently_used(clock):
+    backend = InMemoryRateLimitBackend(max_keys=2)
+    backend.take("a", rate=1, burst=1)
+    backend.take("b", rate=1, burst=1)
+    assert backend.take("b", rate=1, burst=1) > 0
+    assert backend.take("a", rate=1, burst=1) > 0
+
+    # "b" is now the least recently used and makes room for "c"
+    backend.take("c", rate=1, burst=1)
+    assert backend.take("b", rate=1, burst=1) == 0
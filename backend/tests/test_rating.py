@@ -0,0 +1,178 @@
+import threading
+import time
+import uuid
+
+import pytest
+from sqlalchemy import text
+
+from app.database import outbox as outbox_db
+from app.database import rating as rating_db
+from app.database import user as user_db
+from app.database.unit_of_work import unit_of_work
+from app.service.demographics import UNKNOWN_BUCKET
+
+
+@pytest.fixture
+def db(seeded):
+    from app.database.connect import SessionLocal
+
+    db = SessionLocal()
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def rater(db) -> int:
+    name: str = f"rater_{uuid.uuid4().hex[:8]}"
+    return user_db.create_user(db, name, None, f"{name}@example.com", "x", False).id
+
+
+def _rating(db, stance_id: int, user_id: int) -> int | None:
+    return db.execute(
+        text("SELECT rating FROM ratings WHERE stance_id = :s AND user_id = :u"),
+        {"s": stance_id, "u": user_id},
+    ).scalar()
+
+
+def _cell(db, stance_id: int) -> tuple[int, int]:
+    row = db.execute(
+        text(
+            "SELECT num_ratings, rating_sum FROM stance_demographic_stats "
+            "WHERE stance_id = :s AND birth_year = :b AND gender = :g "
+            "AND region = :r"
+        ),
+        {
+            "s": stance_id,
+            "b": UNKNOWN_BUCKET.birth_year,
+            "g": UNKNOWN_BUCKET.gender,
+            "r": UNKNOWN_BUCKET.region,
+        },
+    ).first()
+    return tuple(row) if row else (0, 0)
+
+
+@pytest.fixture
+def events(monkeypatch) -> list[int]:
+    """The stance ids of the outbox events recorded during a test."""
+    recorded: list[int] = []
+    add_outbox_event = outbox_db.add_outbox_event
+
+    def recording(db, topic: str, aggregate_id: int, payload: dict):
+        recorded.append(aggregate_id)
+        return add_outbox_event(db, topic, aggregate_id, payload)
+
+    monkeypatch.setattr(outbox_db, "add_outbox_event", recording)
+    return recorded
+
+
+def test_insert_update_and_remove_move_the_histogram(db, rater, seeded, events):
+    stance_id: int = seeded["stance_id"]
+    histogram: list[int] = rating_db.get_rating_histogram(db, stance_id)
+    cell: tuple[int, int] = _cell(db, stance_id)
+
+    def expect(added: dict[int, int]) -> list[int]:
+        return [
+            count + added.get(value, 0)
+            for value, count in zip(rating_db.RATING_VALUES, histogram)
+        ]
+
+    rated = rating_db.rate_stances(db, rater, {stance_id: 4})
+    assert rated[stance_id].rating_histogram == expect({4: 1})
+    assert _rating(db, stance_id, rater) == 4
+    assert _cell(db, stance_id) == (cell[0] + 1, cell[1] + 4)
+
+    rated = rating_db.rate_stances(db, rater, {stance_id: 2})
+    assert rated[stance_id].rating_histogram == expect({2: 1})
+    assert _cell(db, stance_id) == (cell[0] + 1, cell[1] + 2)
+
+    # the same rating again changes nothing and records no event
+    rated = rating_db.rate_stances(db, rater, {stance_id: 2})
+    assert rated[stance_id].rating_histogram == expect({2: 1})
+    assert events == [stance_id, stance_id]
+
+    rated = rating_db.rate_stances(db, rater, {stance_id: None})
+    assert rated[stance_id].rating_histogram == histogram
+    assert _rating(db, stance_id, rater) is None
+    assert _cell(db, stance_id) == cell
+    assert events == [stance_id] * 3
+    assert rating_db.get_rating_histogram(db, stance_id) == histogram
+
+
+def test_several_stances_and_unknown_ids_in_one_write(db, rater, seeded):
+    first: int = seeded["stance_id"]
+    second: int = first + 1
+    histograms: dict[int, list[int]] = rating_db.get_rating_histograms(
+        db, [first, second]
+    )
+
+    rated = rating_db.rate_stances(db, rater, {second: 5, -1: 3, first: 1})
+    assert set(rated) == {first, second}
+    assert sum(rated[first].rating_histogram) == sum(histograms[first]) + 1
+    assert sum(rated[second].rating_histogram) == sum(histograms[second]) + 1
+    assert (_rating(db, first, rater), _rating(db, second, rater)) == (1, 5)
+
+
+def test_first_ratings_racing_are_retried(db, rater, seeded, monkeypatch):
+    from app.database.connect import SessionLocal
+
+    stance_id: int = seeded["stance_id"] + 2
+    histogram: list[int] = rating_db.get_rating_histogram(db, stance_id)
+    attempts: list[int] = []
+    apply_ratings = rating_db._apply_ratings
+
+    def counting(*args):
+        attempts.append(threading.get_ident())
+        return apply_ratings(*args)
+
+    monkeypatch.setattr(rating_db, "_apply_ratings", counting)
+
+    results: dict = {}
+
+    def rate_concurrently() -> None:
+        other = SessionLocal()
+        try:
+            results.update(rating_db.rate_stances(other, rater, {stance_id: 5}))
+        finally:
+            other.close()
+
+    with unit_of_work(db):
+        rating_db.rate_stances(db, rater, {stance_id: 3})
+        # the concurrent first rating waits on the stance lock held here, with
+        # a snapshot that cannot see the rating committed below
+        thread = threading.Thread(target=rate_concurrently)
+        thread.start()
+        time.sleep(0.3)
+    thread.join(timeout=10)
+
+    assert attempts.count(thread.ident) == 2
+    assert _rating(db, stance_id, rater) == 5
+    expected: list[int] = histogram.copy()
+    expected[4] += 1
+    assert results[stance_id].rating_histogram == expected
+    assert rating_db.get_rating_histogram(db, stance_id) == expected
+
+
+def test_moving_ratings_waits_on_the_stance_locks_of_rating_writes(db, rater, seeded):
+    from app.database.connect import SessionLocal
+    from app.database.demographic_stats import move_user_ratings
+    from app.errors import DatabaseError
+
+    stance_id: int = seeded["stance_id"] + 3
+    rating_db.rate_stances(db, rater, {stance_id: 4})
+
+    writer = SessionLocal()
+    try:
+        # a rating write holds the stance lock it takes first
+        writer.execute(
+            text("SELECT id FROM stances WHERE id = :s FOR NO KEY UPDATE"),
+            {"s": stance_id},
+        )
+        db.execute(text("SET LOCAL lock_timeout = '200ms'"))
+        with pytest.raises(DatabaseError):
+            move_user_ratings(
+                db, rater, UNKNOWN_BUCKET, UNKNOWN_BUCKET._replace(gender="female")
+            )
+        db.rollback()
+    finally:
+        writer.rollback()
+        writer.close()
@@ -0,0 +1,153 @@
+import asyncio
+import re
+
+from app.middleware.response_cache import CacheRule, ResponseCacheMiddleware
+from app.service.response_cache import (
+    CachedResponse,
+    InMemoryResponseCacheBackend,
+    cache_key,
+    invalidate_stance_responses,
+    response_cache,
+)
+
+
+def _scope(path: str, query: bytes = b"") -> dict:
+    return {
+        "type": "http",
+        "method": "GET",
+        "path": path,
+        "query_string": query,
+        "headers": [],
+    }
+
+
+async def _request(app, scope: dict) -> tuple[int, dict, bytes]:
+    messages: list[dict] = []
+
+    async def receive() -> dict:
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message: dict) -> None:
+        messages.append(message)
+
+    await app(scope, receive, send)
+    headers: dict = dict(messages[0]["headers"])
+    return messages[0]["status"], headers, messages[1]["body"]
+
+
+def _counting_app(calls: list[str], delay: float = 0):
+    async def app(scope, receive, send) -> None:
+        calls.append(scope["path"])
+        await asyncio.sleep(delay)
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [(b"content-type", b"application/json")],
+            }
+        )
+        await send({"type": "http.response.body", "body": b'{"n": %d}' % len(calls)})
+
+    return app
+
+
+def test_cache_key_sorts_parameters():
+    assert cache_key("/entities/", "limit=10&cursor=x") == cache_key(
+        "/entities/", "cursor=x&limit=10"
+    )
+
+
+def test_concurrent_misses_share_one_fetch():
+    calls: list[str] = []
+    app = ResponseCacheMiddleware(
+        _counting_app(calls, delay=0.05),
+        InMemoryResponseCacheBackend(),
+        [CacheRule(re.compile(r"^/entities/\d+$"))],
+    )
+
+    async def burst():
+        return await asyncio.gather(
+            *(_request(app, _scope("/entities/1")) for _ in range(20))
+        )
+
+    responses = asyncio.run(burst())
+    assert calls == ["/entities/1"]
+    assert {body for _, _, body in responses} == {b'{"n": 1}'}
+    assert {headers[b"x-cache"] for _, headers, _ in responses} == {b"MISS"}
+
+
+def test_hits_are_served_without_calling_the_app():
+    calls: list[str] = []
+    app = ResponseCacheMiddleware(
+        _counting_app(calls),
+        InMemoryResponseCacheBackend(),
+        [CacheRule(re.compile(r"^/entities/\d+$"))],
+    )
+
+    async def twice():
+        await _request(app, _scope("/entities/1"))
+        return await _request(app, _scope("/entities/1"))
+
+    _, headers, _ = asyncio.run(twice())
+    assert calls == ["/entities/1"]
+    assert headers[b"x-cache"] == b"HIT"
+
+
+def test_stale_entries_are_refreshed_once_in_the_background():
+    calls: list[str] = []
+    app = ResponseCacheMiddleware(
+        _counting_app(calls, delay=0.05),
+        InMemoryResponseCacheBackend(),
+        [CacheRule(re.compile(r"^/entities/\d+$"), ttl=0, stale=60)],
+    )
+
+    async def stale_burst():
+        await _request(app, _scope("/entities/1"))
+        responses = await asyncio.gather(
+            *(_request(app, _scope("/entities/1")) for _ in range(5))
+        )
+        await asyncio.sleep(0.1)
+        return responses
+
+    responses = asyncio.run(stale_burst())
+    assert len(calls) == 2
+    assert {headers[b"x-cache"] for _, headers, _ in responses} == {b"STALE"}
+
+
+def test_unmatched_and_authorized_requests_are_not_cached():
+    calls: list[str] = []
+    app = ResponseCacheMiddleware(
+        _counting_app(calls),
+        InMemoryResponseCacheBackend(),
+        [CacheRule(re.compile(r"^/entities/\d+$"))],
+    )
+    authorized: dict = _scope("/entities/1")
+    authorized["headers"] = [(b"authorization", b"Bearer token")]
+
+    async def requests():
+        for _ in range(2):
+            await _request(app, _scope("/stances/feed"))
+            await _request(app, authorized)
+
+    asyncio.run(requests())
+    assert len(calls) == 4
+
+
+def test_rating_writes_invalidate_entity_demographics():
+    entry = CachedResponse(200, [], b"", 0, float("inf"), float("inf"))
+    keys: list[str] = [
+        "/entities/1/demographics?by=age_band",
+        "/entities/1/stances/2/demographics?",
+        "/entities/1/stances/?limit=10",
+        "/entities/1?",
+        "/entities/3/demographics?",
+    ]
+    response_cache.clear()
+    for key in keys:
+        response_cache.set(key, entry)
+    invalidate_stance_responses(1, 2)
+    assert [key for key in keys if response_cache.get(key)] == [
+        "/entities/1?",
+        "/entities/3/demographics?",
+    ]
+    response_cache.clear()
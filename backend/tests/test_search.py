@@ -0,0 +1,41 @@
+def _pages(client, path: str, key: str, limit: int) -> list[list[dict]]:
+    pages: list[list[dict]] = []
+    params: dict = {"q": "budget", "limit": limit}
+    while True:
+        response = client.get(path, params=params)
+        assert response.status_code == 200, response.text
+        pages.append(response.json()[key])
+        cursor: dict | None = response.json()["next_cursor"]
+        if cursor is None:
+            return pages
+        params.update(cursor_rank=cursor["rank"], cursor_id=cursor["id"])
+
+
+def test_search_pages_are_ranked_without_gaps_or_repeats(client):
+    for path, key in (("/search/entities", "entities"), ("/search/stances", "stances")):
+        whole: list[dict] = [
+            item for page in _pages(client, path, key, limit=100) for item in page
+        ]
+        paged: list[dict] = [
+            item for page in _pages(client, path, key, limit=7) for item in page
+        ]
+        assert whole, f"{path} found nothing to page through"
+        assert [item["id"] for item in paged] == [item["id"] for item in whole]
+        ranks: list[float] = [item["rank"] for item in paged]
+        assert ranks == sorted(ranks, reverse=True)
+
+
+def test_searches_past_the_candidate_cap_are_flagged(client, auth_headers, monkeypatch):
+    from app.database import search
+
+    for path, key in (("/search/entities", "entities"), ("/search/stances", "stances")):
+        params: dict = {"q": "budget", "limit": 100}
+        response = client.get(path, params=params, headers=auth_headers)
+        found: int = len(response.json()[key])
+        assert found > 2 and not response.json()["truncated"]
+
+        monkeypatch.setattr(search, "SEARCH_MAX_CANDIDATES", 2)
+        response = client.get(path, params=params, headers=auth_headers)
+        assert len(response.json()[key]) == 2
+        assert response.json()["truncated"]
+        monkeypatch.undo()